@@ -0,0 +1,235 @@
+"""
+Agents plugged into MatchRunner. An agent has one method:
+
+    choose(inputs, legal, games) -> (pits, outputs)
+
+inputs is a (n, 15) array with one row per game waiting for this agent: the 14 board entries followed by the player
+to move, the same layout as NeuralNetwork.query takes. legal is a (n, 6) boolean mask of the non empty pits of the
+player to move, and games holds the index of every row's game. The agent returns an array of n pits (1 - 6), always
+legal, and optionally a (n, 6) array of the scores it picked them from (None otherwise). Games of other BoardVariants
+have variant.input_size input columns and variant.pits legal and score columns.
+
+Agents may also have a scalar version for a single game, which MatchRunner uses when only one game is in flight:
+
+    choose_one(input_list, legal) -> (pit, outputs)
+
+with input_list a list of 15 entries and legal the legal move bitmask of the player to move (GameBoard.legal_moves).
+"""
+from VariantGameBoard import *
+from NeuralNetwork import *
+import numpy as np
+import random
+
+
+class RandomAgent:
+
+    """
+    Picks uniformly among the legal pits, like Game.random_agent retried until it hits a non empty pit.
+    """
+
+    def __init__(self, rng=None):
+        """
+        :param rng: optional np.random.RandomState or Generator; the global np.random state is used by default
+        """
+        self.rng = rng
+
+    def choose(self, inputs, legal, games):
+        draws = (self.rng if self.rng is not None else np.random).uniform(size=legal.shape)
+        return np.argmax(np.where(legal, draws, -1.0), axis=1) + 1, None
+
+    def choose_one(self, input_list, legal):
+        pits = GameBoard.MASK_PITS[legal]
+        if self.rng is not None:
+            return pits[int(self.rng.randint(len(pits)))], None
+        return random.choice(pits), None
+
+
+class NetworkAgent:
+
+    """
+    Plays the highest scoring legal pit of a NeuralNetwork, querying every waiting game in one query_batch. With a
+    temperature it samples among the legal pits instead (NeuralNetwork.masked_sample), to explore during training.
+    """
+
+    def __init__(self, nn, temperature=None, rng=None):
+        """
+        :param temperature: softmax temperature of the sampled moves; None or 0 always plays the best pit
+        :param rng: optional np.random.RandomState or Generator for the sampling
+        """
+        self.nn = nn
+        self.temperature = temperature
+        self.rng = rng
+
+    def choose(self, inputs, legal, games):
+        outputs = self.nn.query_batch(inputs).copy()
+        return NeuralNetwork.masked_sample(outputs, legal, self.temperature, self.rng), outputs
+
+    def choose_one(self, input_list, legal):
+        outputs = self.nn.query(input_list).ravel()
+        return NeuralNetwork.masked_sample(outputs, legal, self.temperature, self.rng), outputs
+
+
+class QueryAgent:
+
+    """
+    Adapts anything with a single input query method returning a column of move scores, one per pit (AlphaBetaAgent,
+    MCTSAgent, or a NeuralNetwork), by querying one game at a time.
+    """
+
+    def __init__(self, agent):
+        self.agent = agent
+
+    def choose(self, inputs, legal, games):
+        outputs = np.empty(legal.shape)
+        for i in range(len(inputs)):
+            outputs[i] = np.asarray(self.agent.query(inputs[i].tolist()), dtype=float).ravel()
+        return NeuralNetwork.masked_argmax(outputs, legal), outputs
+
+    def choose_one(self, input_list, legal):
+        outputs = np.asarray(self.agent.query(input_list), dtype=float).ravel()
+        return NeuralNetwork.masked_argmax(outputs, legal), outputs
+
+
+class PopulationAgent:
+
+    """
+    Plays every network of a PopulationNetwork at once. Game g belongs to network g // games_per_network, and every
+    step evaluates one input slot per game of every network with a single population query.
+    """
+
+    def __init__(self, population_net, games_per_network):
+        self.population_net = population_net
+        self.games_per_network = games_per_network
+        self.input_size = population_net.net_size[0]
+        self.output_size = population_net.net_size[-1]
+        self.inputs = np.zeros((population_net.population_size * games_per_network, self.input_size),
+                               dtype=population_net.dtype)
+
+    def choose(self, inputs, legal, games):
+        self.inputs[games] = inputs
+        outputs = self.population_net.query(self.inputs.reshape(self.population_net.population_size,
+                                                                self.games_per_network, self.input_size))
+        outputs = outputs.reshape(-1, self.output_size)[games]
+        return NeuralNetwork.masked_argmax(outputs, legal), outputs
+
+
+class EndgameAgent:
+
+    """
+    Plays the exact best pit of a Tablebase once a game gets down to the table's seed count, and lets another agent
+    play the games that still have more seeds.
+    """
+
+    def __init__(self, agent, tablebase):
+        """
+        :param agent: agent (or anything as_agent accepts) playing the positions the table does not cover
+        """
+        self.agent = as_agent(agent)
+        self.tablebase = tablebase
+
+    def choose(self, inputs, legal, games):
+        covered = inputs[:, 1:13].sum(axis=1) <= self.tablebase.max_seeds
+        if not covered.any():
+            return self.agent.choose(inputs, legal, games)
+
+        pits = np.empty(len(inputs), dtype=np.intp)
+        outputs = np.empty((len(inputs), 6))
+        outputs[covered] = self.tablebase.move_values(inputs[covered])
+        pits[covered] = NeuralNetwork.masked_argmax(outputs[covered], legal[covered])
+
+        rest = ~covered
+        if rest.any():
+            pits[rest], rest_outputs = self.agent.choose(inputs[rest], legal[rest], games[rest])
+            if rest_outputs is None:
+                return pits, None
+            outputs[rest] = rest_outputs
+        return pits, outputs
+
+    def choose_one(self, input_list, legal):
+        if self.tablebase.covers(input_list[:14]):
+            outputs = self.tablebase.move_values([input_list])[0]
+            return NeuralNetwork.masked_argmax(outputs, legal), outputs
+        if hasattr(self.agent, 'choose_one'):
+            return self.agent.choose_one(input_list, legal)
+        pits, outputs = self.agent.choose(np.array([input_list]), NeuralNetwork.MOVE_BITS & legal != 0,
+                                          np.zeros(1, dtype=np.intp))
+        return pits[0], None if outputs is None else outputs[0]
+
+
+class OpeningBookAgent:
+
+    """
+    Plays the moves of an OpeningBook while a game is still in the book, and lets another agent play the games that
+    have left it.
+    """
+
+    def __init__(self, agent, book):
+        """
+        :param agent: agent (or anything as_agent accepts) playing the positions which are not in the book
+        """
+        self.agent = as_agent(agent)
+        self.book = book
+
+    def choose(self, inputs, legal, games):
+        pits = self.book.moves(inputs)
+        rest = pits == 0
+        if not rest.any():
+            return pits, None
+
+        if rest.all():
+            return self.agent.choose(inputs, legal, games)
+        pits[rest] = self.agent.choose(inputs[rest], legal[rest], games[rest])[0]
+        return pits, None
+
+    def choose_one(self, input_list, legal):
+        lookup = self.book.lookup(input_list[:14], input_list[14])
+        if lookup is not None:
+            return lookup[0], None
+        if hasattr(self.agent, 'choose_one'):
+            return self.agent.choose_one(input_list, legal)
+        pits, outputs = self.agent.choose(np.array([input_list]), NeuralNetwork.MOVE_BITS & legal != 0,
+                                          np.zeros(1, dtype=np.intp))
+        return pits[0], None if outputs is None else outputs[0]
+
+
+class HumanAgent:
+
+    """
+    Asks at the keyboard for a pit, showing the board first. Empty pits are refused and asked for again.
+    """
+
+    def __init__(self, variant=None):
+        """
+        :param variant: BoardVariant of the games it plays, the standard game by default
+        """
+        self.variant = variant if variant is not None else BoardVariant.STANDARD
+
+    def choose(self, inputs, legal, games):
+        pits = np.empty(len(inputs), dtype=np.intp)
+        bits = 1 << np.arange(legal.shape[1])
+        for i in range(len(inputs)):
+            pits[i] = self.choose_one(inputs[i].tolist(), int(np.dot(legal[i], bits)))[0]
+        return pits, None
+
+    def choose_one(self, input_list, legal):
+        variant = self.variant
+        VariantGameBoard.create(variant, [int(x) for x in input_list[:variant.size]]).text_display_board()
+        player = int(input_list[variant.size])
+        while True:
+            pit = int(input("Player {}, please enter which pit (1-{}) you would like to shift from:"
+                            .format(player, variant.pits)))
+            if pit in GameBoard.MASK_PITS[legal]:
+                return pit, None
+            print("Pit {} is not a legal move, please choose a pit with marbles in it.".format(pit))
+
+
+def as_agent(agent):
+    """
+    :return: agent itself if it already has choose, a NetworkAgent for a NeuralNetwork, a QueryAgent for anything
+    else with query
+    """
+    if hasattr(agent, 'choose'):
+        return agent
+    if hasattr(agent, 'query_batch'):
+        return NetworkAgent(agent)
+    return QueryAgent(agent)
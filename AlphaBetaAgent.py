@@ -0,0 +1,289 @@
+from GameBoard import *
+import numpy as np
+import time
+
+
+class SearchBudgetExceeded(Exception):
+    """
+    Raised inside the search when the time or node budget of the current move runs out.
+    """
+    pass
+
+
+class AlphaBetaAgent:
+
+    """
+    Search agent using iterative deepening negamax with alpha-beta pruning, move ordering and a bounded transposition
+    table keyed by the Zobrist hash of the position (GameBoard.hash) and the player to move.
+
+    Moves that end in the player's own store give the same player another move (the "return player" path of
+    GameBoard.move_marbles), so those children are searched from the same point of view rather than negated.
+
+    With a Tablebase, positions with few enough seeds left are not searched but looked up, which gives their exact
+    value at any depth. With an OpeningBook, positions in the book are played from it without searching.
+
+    The agent plugs into the Game loops through query, which takes the same board + player input list as
+    NeuralNetwork.query and returns a (6, 1) array of move scores with the best move scored highest.
+    """
+
+    # Transposition table entry bound types
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+    def __init__(self, max_depth=12, time_limit=None, node_limit=None, table_size=2 ** 18, tablebase=None,
+                 book=None):
+        """
+        :param max_depth: deepest iteration of iterative deepening
+        :param time_limit: optional wall clock budget per move, in seconds
+        :param node_limit: optional budget of searched nodes per move
+        :param table_size: number of transposition table slots, rounded up to a power of 2
+        :param tablebase: optional Tablebase giving the exact value of endgame positions
+        :param book: optional OpeningBook of moves played without searching
+        """
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.tablebase = tablebase
+        self.book = book
+
+        # The transposition table is a set of parallel lists indexed by the low bits of the key. A slot is
+        # replaced when the new entry was searched at least as deep, or when the old entry is from an earlier move.
+        size = 1
+        while size < table_size:
+            size *= 2
+        self.table_mask = size - 1
+        self.table_keys = [None] * size
+        self.table_depths = [0] * size
+        self.table_values = [0] * size
+        self.table_flags = [0] * size
+        self.table_moves = [0] * size
+        self.table_ages = [0] * size
+        self.age = 0
+
+        # Statistics of the last search
+        self.nodes = 0
+        self.tablebase_hits = 0
+        self.elapsed = 0.0
+        self.depth_reached = 0
+        self.deadline = None
+
+    def query(self, input_list):
+        """
+        :param input_list: the 14 board entries followed by the player to move, as given to NeuralNetwork.query
+        :return: (6, 1) array of move scores. The chosen move has the highest score, and empty pits score -inf.
+        """
+        if len(input_list) != 15:
+            raise Exception('Input has incorrect size. The size of input was {}, but should be {}.'
+                            .format(len(input_list), 15))
+
+        board = GameBoard([int(x) for x in input_list[:14]])
+        player = int(input_list[14])
+        best_pit, best_value, root_values = self.search(board, player)
+
+        scores = np.full((6, 1), -np.inf)
+        for pit, value in root_values.items():
+            scores[pit - 1, 0] = min(value, best_value)
+        if best_pit is not None:
+            scores[best_pit - 1, 0] = best_value + 0.5
+        return scores
+
+    def choose_move(self, board, player):
+        """
+        :param board: a GameBoard
+        :return: the best pit (1 - 6) for player, or None if player has no legal move
+        """
+        return self.search(board, player)[0]
+
+    def search(self, board, player):
+        """
+        Runs iterative deepening until max_depth or the move budget is reached, keeping the result of the deepest
+        completed iteration.
+
+        :return: (best_pit, best_value, root_values) where values are the expected store difference for player and
+        root_values maps every legal pit to its value from the last completed iteration. Only the best pit's value is
+        exact: the other pits are searched with alpha at the best value so far, so their values are upper bounds
+        which may tie the best value. Search a pit with search_child and a full window for its exact value.
+        """
+        start = time.perf_counter()
+        self.deadline = start + self.time_limit if self.time_limit is not None else None
+        self.nodes = 0
+        self.tablebase_hits = 0
+        self.depth_reached = 0
+        self.age += 1
+
+        if self.book is not None:
+            lookup = self.book.lookup(board.board, player)
+            if lookup is not None:
+                self.elapsed = time.perf_counter() - start
+                return lookup[0], lookup[1], {lookup[0]: lookup[1]}
+
+        best_pit = None
+        best_value = 0
+        root_values = {}
+        root_moves = self.ordered_moves(board, player, None)
+
+        try:
+            for depth in range(1, self.max_depth + 1):
+                values = {}
+                alpha = -np.inf
+                for pit in root_moves:
+                    value = self.search_child(board, player, pit, depth, alpha, np.inf)
+                    values[pit] = value
+                    if value > alpha:
+                        alpha = value
+
+                root_moves = sorted(root_moves, key=lambda x: values[x], reverse=True)
+                root_values = values
+                best_pit = root_moves[0] if root_moves else None
+                best_value = alpha if root_moves else AlphaBetaAgent.final_value(board, player)
+                self.depth_reached = depth
+        except SearchBudgetExceeded:
+            # The first iteration always has to finish, otherwise there is no move to play
+            if best_pit is None and root_moves:
+                best_pit = root_moves[0]
+
+        self.elapsed = time.perf_counter() - start
+        return best_pit, best_value, root_values
+
+    def search_child(self, board, player, pit, depth, alpha, beta):
+        """
+        Plays pit on a copy of board and searches the resulting position, returning its value for player.
+        """
+        child = board.copy()
+        next_player = child.move_marbles(player, pit)
+
+        if next_player == player:
+            return self.negamax(child, player, depth - 1, alpha, beta)
+        return -self.negamax(child, next_player, depth - 1, -beta, -alpha)
+
+    def negamax(self, board, player, depth, alpha, beta):
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.check_budget()
+
+        if board.check_end_condition():
+            return AlphaBetaAgent.final_value(board, player)
+
+        if self.tablebase is not None and self.tablebase.covers(board.board):
+            self.tablebase_hits += 1
+            return self.tablebase.final_value(board, player)
+
+        if depth <= 0:
+            return AlphaBetaAgent.evaluate(board, player)
+
+        key = board.hash ^ GameBoard.ZOBRIST_PLAYER if player == 1 else board.hash
+        slot = key & self.table_mask
+        table_move = None
+
+        if self.table_keys[slot] == key:
+            table_move = self.table_moves[slot]
+            if self.table_depths[slot] >= depth:
+                value = self.table_values[slot]
+                flag = self.table_flags[slot]
+                if flag == AlphaBetaAgent.EXACT:
+                    return value
+                if flag == AlphaBetaAgent.LOWER and value > alpha:
+                    alpha = value
+                elif flag == AlphaBetaAgent.UPPER and value < beta:
+                    beta = value
+                if alpha >= beta:
+                    return value
+
+        original_alpha = alpha
+        best_value = -np.inf
+        best_pit = 0
+
+        for pit in self.ordered_moves(board, player, table_move):
+            value = self.search_child(board, player, pit, depth, alpha, beta)
+            if value > best_value:
+                best_value = value
+                best_pit = pit
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                break
+
+        if best_value <= original_alpha:
+            flag = AlphaBetaAgent.UPPER
+        elif best_value >= beta:
+            flag = AlphaBetaAgent.LOWER
+        else:
+            flag = AlphaBetaAgent.EXACT
+
+        if self.table_ages[slot] != self.age or depth >= self.table_depths[slot]:
+            self.table_keys[slot] = key
+            self.table_depths[slot] = depth
+            self.table_values[slot] = best_value
+            self.table_flags[slot] = flag
+            self.table_moves[slot] = best_pit
+            self.table_ages[slot] = self.age
+
+        return best_value
+
+    def check_budget(self):
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchBudgetExceeded()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchBudgetExceeded()
+
+    def nodes_per_second(self):
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def stats(self):
+        """
+        :return: dict describing the last search, for logging
+        """
+        return {'nodes': self.nodes, 'seconds': self.elapsed, 'nodes_per_second': self.nodes_per_second(),
+                'depth': self.depth_reached, 'tablebase_hits': self.tablebase_hits}
+
+    @staticmethod
+    def ordered_moves(board, player, table_move):
+        """
+        :return: legal pits in search order: the transposition table move, then moves ending in the player's store
+        (extra turns), then captures, then the rest from the pit nearest the store outwards
+        """
+        b = board.board
+        first = []
+        extra_turns = []
+        captures = []
+        rest = []
+
+        for pit in board.legal_pits(player):
+            marbles = b[player * 6 + pit]
+            if pit == table_move:
+                first.append(pit)
+                continue
+
+            last = GameBoard.SOWING_ORDER[player][pit][(marbles - 1) % 13]
+            if last == 0 or last == 13:
+                extra_turns.append(pit)
+            elif marbles < 13 and b[last] == 0 and b[GameBoard.INDEX_ACROSS[last]] != 0:
+                captures.append(pit)
+            else:
+                rest.append(pit)
+
+        # Player 0 sows towards index 0 and player 1 towards index 13, so the pit nearest the store differs
+        if player == 1:
+            extra_turns.reverse()
+            rest.reverse()
+        return first + extra_turns + captures + rest
+
+    @staticmethod
+    def evaluate(board, player):
+        """
+        Heuristic value of a position that is not finished: the difference between the two stores, for player.
+        """
+        b = board.board
+        diff = b[0] - b[13]
+        return diff if player == 0 else -diff
+
+    @staticmethod
+    def final_value(board, player):
+        """
+        Value of a finished game: every player's store plus the marbles left in their row, as scored by Game.
+        """
+        rows = board.get_sum_rows()
+        b = board.board
+        diff = b[0] + rows[0] - b[13] - rows[1]
+        return diff if player == 0 else -diff
@@ -0,0 +1,183 @@
+from VariantGameBoard import *
+import numpy as np
+
+
+class BatchGameBoard:
+
+    """
+    Holds N independent games of Mancala as one (N, 14) integer array, using the same layout as GameBoard
+    (player 0's store at index 0, player 1's store at index 13). Every method works on all of the games at once,
+    so one call to move_marbles plays one move in each game with a handful of array operations.
+
+    Other BoardVariants are played the same way on (N, variant.size) arrays, with the variant's pits and stores in
+    place of the 6 pits and index 13 above.
+
+    NOTE: The results of every move are identical to GameBoard.move_marbles, including the return codes
+    (2 for an empty pit, the same player for an extra turn, the other player otherwise).
+    """
+
+    def __init__(self, num_games, boards=None, variant=None):
+        """
+        :param num_games: number of games held by the batch
+        :param boards: optional (num_games, variant.size) array or list of boards to start from. Defaults to the
+        starting position for every game.
+        :param variant: BoardVariant of the games, the standard 6 pit, 4 seed game by default
+        """
+        variant = variant if variant is not None else BoardVariant.STANDARD
+        if boards is None:
+            boards = np.tile(np.array(variant.start, dtype=np.int16), (num_games, 1))
+        else:
+            boards = np.array(boards, dtype=np.int16, ndmin=2)
+
+        assert boards.shape == (num_games, variant.size), \
+            "Invalid boards shape {}, must be ({}, {})".format(boards.shape, num_games, variant.size)
+
+        self.boards = boards
+        self.num_games = num_games
+        self.rows = np.arange(num_games)
+
+        self.variant = variant
+        self.pits = variant.pits
+        self.store = variant.size - 1
+        # Index that captured marbles are taken from, for every board index. The stores never capture, so their
+        # entries are unused.
+        self.across = np.array([0] + variant.index_across[1:-1] + [self.store], dtype=np.intp)
+        # Pit numbers, added to player * pits to get the board indices of a player's row
+        self.pit_numbers = np.arange(1, variant.pits + 1)
+
+        # The sowing tables must cover the largest pit that can ever appear, which is every marble on the board
+        self.delta, self.last = BatchGameBoard.sowing_tables(
+            max(variant.total_seeds, int(boards.sum(axis=1).max(initial=0))), variant)
+
+    def __len__(self):
+        return self.num_games
+
+    def move_marbles(self, players, pits, games=None):
+        """
+        Plays one move in each of the selected games.
+
+        :param players: array of player ids (0 or 1), one per selected game
+        :param pits: array of pits numbered 1 - pits, one per selected game
+        :param games: optional array of game indices the moves are applied to. Defaults to every game.
+        :return: array with the next player of each selected game, following the GameBoard.move_marbles codes
+        """
+        players = np.asarray(players, dtype=np.intp)
+        pits = np.asarray(pits, dtype=np.intp)
+        rows = self.rows if games is None else np.asarray(games, dtype=np.intp)
+
+        assert np.all((players == 0) | (players == 1)), "Invalid player id, must be either 0 or 1"
+        assert np.all((pits >= 1) & (pits <= self.pits)), "Invalid pit number, must be between 1 and {}".format(
+            self.pits)
+
+        index = players * self.pits + pits
+        marbles = self.boards[rows, index]
+        empty = marbles == 0
+
+        # Sowing is a single table lookup: the delta row removes the marbles from the chosen pit and adds them
+        # to every pit they pass over. An empty pit has an all zero delta row.
+        self.boards[rows] += self.delta[players, pits - 1, marbles]
+        last = self.last[players, pits - 1, marbles]
+
+        store_landing = (last == 0) | (last == self.store)
+        across = self.across[last]
+
+        capture = ~empty & ~store_landing & (self.boards[rows, last] == 1) & (self.boards[rows, across] != 0)
+        if capture.any():
+            cap_rows = rows[capture]
+            cap_last = last[capture]
+            cap_across = across[capture]
+            plus_points = self.boards[cap_rows, cap_across] + self.boards[cap_rows, cap_last]
+            self.boards[cap_rows, cap_across] = 0
+            self.boards[cap_rows, cap_last] = 0
+            self.boards[cap_rows, players[capture] * self.store] += plus_points
+
+        return np.where(empty, 2, np.where(store_landing, players, 1 - players))
+
+    def legal_moves(self, players, games=None):
+        """
+        :param players: array of player ids (0 or 1), one per selected game
+        :param games: optional array of game indices. Defaults to every game.
+        :return: (len(players), pits) boolean array, True for every non empty pit of the player in the selected game
+        """
+        players = np.asarray(players, dtype=np.intp)
+        rows = self.rows if games is None else np.asarray(games, dtype=np.intp)
+        return self.boards[rows[:, np.newaxis], players[:, np.newaxis] * self.pits + self.pit_numbers] > 0
+
+    def check_end_condition(self):
+        """
+        :return: boolean array, True for every game in which either player has no marbles left in their row
+        """
+        pits = self.pits
+        return ~self.boards[:, 1:pits + 1].any(axis=1) | ~self.boards[:, pits + 1:self.store].any(axis=1)
+
+    def get_sum_rows(self):
+        pits = self.pits
+        return self.boards[:, 1:pits + 1].sum(axis=1), self.boards[:, pits + 1:self.store].sum(axis=1)
+
+    def get_score(self):
+        return self.boards[:, 0], self.boards[:, self.store]
+
+    def get_final_score(self):
+        """
+        :return: (N, 2) array of each player's store plus the marbles left in their row, as used at the end of a game
+        """
+        pits = self.pits
+        score = np.empty((self.num_games, 2), dtype=np.int32)
+        score[:, 0] = self.boards[:, 0] + self.boards[:, 1:pits + 1].sum(axis=1)
+        score[:, 1] = self.boards[:, self.store] + self.boards[:, pits + 1:self.store].sum(axis=1)
+        return score
+
+    def get_winner(self):
+        """
+        :return: array with the winner of each game. Ties go to player 0, like max(enumerate(score)) in Game.
+        """
+        return np.argmax(self.get_final_score(), axis=1)
+
+    def get_boards(self):
+        return self.boards.copy()
+
+    def get_game_board(self, game):
+        """
+        :return: a GameBoard (VariantGameBoard.create) holding a copy of the given game
+        """
+        return VariantGameBoard.create(self.variant, self.boards[game].tolist())
+
+    def reset_games(self, games=None):
+        """
+        Puts the selected games (every game by default) back to the starting position.
+        """
+        if games is None:
+            games = self.rows
+        self.boards[games] = self.variant.start
+
+    @staticmethod
+    def sowing_tables(max_marbles, variant=None):
+        """
+        Builds the sowing tables from BoardVariant.sowing_delta, so the batched moves follow exactly the same rules
+        as the single board. The tables only depend on the pits per side, so variants differing in seeds share them.
+
+        :param max_marbles: largest number of marbles a pit can hold
+        :param variant: BoardVariant of the tables, the standard game by default
+        :return: (delta, last) where delta[player, pit - 1, marbles] is the change to the board when sowing that many
+        marbles from the pit, and last[player, pit - 1, marbles] is the index the final marble lands in
+        """
+        variant = variant if variant is not None else BoardVariant.STANDARD
+        cached = BatchGameBoard._table_cache.get((variant.pits, max_marbles))
+        if cached is not None:
+            return cached
+
+        delta = np.zeros((2, variant.pits, max_marbles + 1, variant.size), dtype=np.int16)
+        last = np.zeros((2, variant.pits, max_marbles + 1), dtype=np.intp)
+
+        for player in range(2):
+            for pit in range(1, variant.pits + 1):
+                # Empty pits keep an all zero delta; last points at the pit itself
+                last[player, pit - 1, 0] = variant.board_index(player, pit)
+                for marbles in range(1, max_marbles + 1):
+                    delta[player, pit - 1, marbles], last[player, pit - 1, marbles] = \
+                        variant.sowing_delta(player, pit, marbles)
+
+        BatchGameBoard._table_cache[(variant.pits, max_marbles)] = (delta, last)
+        return delta, last
+
+    _table_cache = {}
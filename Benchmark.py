@@ -0,0 +1,281 @@
+"""
+Throughput benchmarks of the hot paths: board moves, random games (also on a larger board variant), network queries
+and training, games against the random agent and a genetic algorithm generation.
+
+Every benchmark reseeds random and np.random before it runs, so each run times the same work. It runs repeats times
+and keeps its best measurement, the one least disturbed by the rest of the machine. Results are a dict mapping every
+benchmark to {'value', 'unit', 'higher_is_better'}, written as JSON together with the versions and platform they were
+measured on, and compare checks them against such a file from an earlier run (the baseline).
+"""
+from GameBoard import *
+from BatchGameBoard import *
+from NeuralNetwork import *
+from MatchRunner import *
+from Game import *
+import contextlib
+import io
+import json
+import platform
+import random
+import sys
+import time
+import numpy as np
+
+
+class Benchmark:
+
+    """
+    Benchmark suite. Throughputs are measured for about seconds each; the genetic algorithm generation is timed once
+    per repeat.
+    """
+
+    LAYER_SIZES = ([15, 50, 6], [15, 100, 6], [15, 200, 6])
+
+    def __init__(self, seconds=1.0, repeats=3, seed=0, layer_sizes=LAYER_SIZES, batch_size=1024, train_batch_size=32,
+                 ga_population=20, ga_net_size=(15, 20, 6), ga_games=20):
+        """
+        :param seconds: time spent per measurement of a throughput
+        :param repeats: measurements per benchmark, the best one is kept
+        :param seed: seed of random and np.random, set before every benchmark
+        :param layer_sizes: network layer sizes the network benchmarks run at
+        :param batch_size: samples per query_batch
+        :param train_batch_size: samples per train_batch
+        :param ga_population: population of the timed genetic algorithm generation
+        :param ga_net_size: layer sizes of its networks
+        :param ga_games: fitness games per network
+        """
+        self.seconds = seconds
+        self.repeats = repeats
+        self.seed = seed
+        self.layer_sizes = [list(layers) for layers in layer_sizes]
+        self.batch_size = batch_size
+        self.train_batch_size = train_batch_size
+        self.ga_population = ga_population
+        self.ga_net_size = list(ga_net_size)
+        self.ga_games = ga_games
+
+    def benchmarks(self):
+        """
+        :return: list of (name, unit, higher_is_better, function) of every benchmark. A throughput function takes a
+        time budget and returns (work done, seconds taken); a timing function (higher_is_better False) takes nothing
+        and returns seconds.
+        """
+        benchmarks = [
+            ('gameboard_move_marbles', 'moves/sec', True, self.move_marbles),
+            ('random_games', 'games/sec', True, self.random_games),
+            ('variant_random_games_8x6', 'games/sec', True, Benchmark.variant_random_games),
+        ]
+        for layers in self.layer_sizes:
+            size = '-'.join(str(layer) for layer in layers)
+            benchmarks += [
+                ('query_' + size, 'samples/sec', True, self.network_benchmark(layers, Benchmark.query)),
+                ('query_batch_' + size, 'samples/sec', True, self.network_benchmark(layers, self.query_batch)),
+                ('query_batch_float32_' + size, 'samples/sec', True,
+                 self.network_benchmark(layers, self.query_batch, np.float32)),
+                ('train_' + size, 'samples/sec', True, self.network_benchmark(layers, Benchmark.train)),
+                ('train_batch_' + size, 'samples/sec', True, self.network_benchmark(layers, self.train_batch)),
+            ]
+        benchmarks += [
+            ('test_against_random_agent', 'games/sec', True, self.test_against_random_agent),
+            ('genetic_generation', 'seconds', False, self.genetic_generation),
+        ]
+        return benchmarks
+
+    def run(self, names=None, verbose=False):
+        """
+        :param names: optional list of benchmarks to run, every benchmark by default; a name also selects every
+        benchmark it is a prefix of
+        :param verbose: print every result as it is measured
+        :return: dict of results, see the module docstring
+        """
+        results = {}
+        for name, unit, higher_is_better, function in self.benchmarks():
+            if names is not None and not any(name.startswith(selected) for selected in names):
+                continue
+
+            measurements = []
+            for _ in range(self.repeats):
+                random.seed(self.seed)
+                np.random.seed(self.seed)
+                if higher_is_better:
+                    work, elapsed = function(self.seconds)
+                    measurements.append(work / elapsed)
+                else:
+                    measurements.append(function())
+
+            value = max(measurements) if higher_is_better else min(measurements)
+            results[name] = {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+            if verbose:
+                print("{}: {:.6g} {}".format(name, value, unit))
+        return results
+
+    @staticmethod
+    def timed(step, seconds, work_per_step):
+        """
+        Calls step until seconds have passed, always at least once.
+
+        :return: (work done, seconds taken)
+        """
+        work = 0
+        start = time.perf_counter()
+        while True:
+            step()
+            work += work_per_step
+            elapsed = time.perf_counter() - start
+            if elapsed >= seconds:
+                return work, elapsed
+
+    @staticmethod
+    def move_marbles(seconds):
+        # Random legal moves of random games, drawn up front so only the moves are timed
+        pits = np.random.randint(0, 6, size=1000).tolist()
+        board = [GameBoard()]
+
+        def step():
+            b = board[0]
+            player = 0
+            for choice in pits:
+                legal = b.legal_pits(player)
+                player = b.move_marbles(player, legal[choice % len(legal)])
+                if b.check_end_condition():
+                    b = GameBoard()
+                    player = 0
+            board[0] = b
+        return Benchmark.timed(step, seconds, len(pits))
+
+    @staticmethod
+    def random_games(seconds):
+        runner = MatchRunner(RandomAgent(), RandomAgent())
+        return Benchmark.timed(lambda: sum(1 for _ in runner.play(10)), seconds, 10)
+
+    @staticmethod
+    def variant_random_games(seconds):
+        # Random games on an 8 pit board of 6 seeds each, played by VariantGameBoard
+        runner = MatchRunner(RandomAgent(), RandomAgent(), variant=BoardVariant.get(8, 6))
+        return Benchmark.timed(lambda: sum(1 for _ in runner.play(10)), seconds, 10)
+
+    def network_benchmark(self, layers, benchmark, dtype=np.float64):
+        """
+        :return: throughput function running benchmark(nn, seconds) on a new network of the given layer sizes
+        """
+        return lambda seconds: benchmark(NeuralNetwork(layers, dtype=dtype), seconds)
+
+    @staticmethod
+    def random_inputs(count, size):
+        """
+        :return: (count, size) float array of boards from random play, followed by the player to move
+        """
+        boards = BatchGameBoard(count)
+        for _ in range(8):
+            boards.move_marbles(np.random.randint(0, 2, size=count), np.random.randint(1, 7, size=count))
+        inputs = np.zeros((count, size))
+        inputs[:, :14] = boards.boards
+        inputs[:, 14] = np.random.randint(0, 2, size=count)
+        return inputs
+
+    @staticmethod
+    def query(nn, seconds):
+        samples = Benchmark.random_inputs(100, nn.layers[0]).tolist()
+        return Benchmark.timed(lambda: [nn.query(sample) for sample in samples], seconds, len(samples))
+
+    def query_batch(self, nn, seconds):
+        inputs = Benchmark.random_inputs(self.batch_size, nn.layers[0]).astype(nn.dtype)
+        return Benchmark.timed(lambda: nn.query_batch(inputs), seconds, len(inputs))
+
+    @staticmethod
+    def train(nn, seconds):
+        samples = Benchmark.random_inputs(100, nn.layers[0]).tolist()
+        targets = np.random.uniform(size=(100, nn.layers[-1])).tolist()
+
+        def step():
+            for sample, target in zip(samples, targets):
+                nn.train(sample, target)
+        return Benchmark.timed(step, seconds, len(samples))
+
+    def train_batch(self, nn, seconds):
+        inputs = Benchmark.random_inputs(self.train_batch_size, nn.layers[0])
+        targets = np.random.uniform(size=(self.train_batch_size, nn.layers[-1]))
+        return Benchmark.timed(lambda: nn.train_batch(inputs, targets), seconds, len(inputs))
+
+    @staticmethod
+    def test_against_random_agent(seconds):
+        nn = NeuralNetwork([15, 100, 6])
+        game = Game()
+        return Benchmark.timed(lambda: game.test_against_random_agent(nn, 50), seconds, 50)
+
+    def genetic_generation(self):
+        """
+        :return: seconds one GeneticAgent generation takes, without a worker pool
+        """
+        from GeneticAgent import GeneticAgent
+        ga = GeneticAgent(self.ga_population, self.ga_net_size, seed=self.seed, games_per_fitness=self.ga_games)
+        try:
+            start = time.perf_counter()
+            # run prints the generation number, which would end up in the JSON on stdout
+            with contextlib.redirect_stdout(io.StringIO()):
+                ga.run(1)
+            return time.perf_counter() - start
+        finally:
+            ga.close()
+
+    def settings(self):
+        return {'seconds': self.seconds, 'repeats': self.repeats, 'seed': self.seed, 'layer_sizes': self.layer_sizes,
+                'batch_size': self.batch_size, 'train_batch_size': self.train_batch_size,
+                'ga_population': self.ga_population, 'ga_net_size': self.ga_net_size, 'ga_games': self.ga_games}
+
+    def report(self, results):
+        """
+        :return: JSON serializable dict of results, the settings and the environment they were measured in
+        """
+        return {'results': results, 'settings': self.settings(), 'python': platform.python_version(),
+                'numpy': np.__version__, 'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+    def save(self, path, results):
+        with open(path, 'w') as file:
+            json.dump(self.report(results), file, indent=1)
+
+
+def load_results(path):
+    """
+    :return: results dict of a JSON file written by Benchmark.save
+    """
+    with open(path) as file:
+        return json.load(file)['results']
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    :param results: dict of results, as Benchmark.run returns
+    :param baseline: dict of earlier results, e.g. from load_results
+    :param threshold: largest allowed slowdown, as a share of the baseline
+    :return: list of (name, baseline value, value, change) of every benchmark more than threshold slower than its
+    baseline, change being the relative slowdown. Benchmarks missing from either side are skipped.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]['value']
+        new = result['value']
+        if old <= 0 or new <= 0:
+            continue
+        # Slowdown in time per unit of work, so throughputs and timings count alike
+        change = old / new - 1.0 if result['higher_is_better'] else new / old - 1.0
+        if change > threshold:
+            regressions.append((name, old, new, change))
+    return regressions
+
+
+def print_comparison(results, baseline, regressions, out=sys.stdout):
+    """
+    Prints every result next to its baseline, marking the regressions.
+    """
+    regressed = {name for name, _, _, _ in regressions}
+    for name, result in results.items():
+        line = "{:32} {:>14.6g} {}".format(name, result['value'], result['unit'])
+        if name in baseline:
+            line += "  (baseline {:.6g}, {:+.1%})".format(baseline[name]['value'],
+                                                          result['value'] / baseline[name]['value'] - 1.0)
+        if name in regressed:
+            line += "  REGRESSION"
+        print(line, file=out)
@@ -0,0 +1,165 @@
+import random
+
+
+class BoardVariant:
+
+    """
+    Rules of a Mancala board with any number of pits per side and seeds per pit, and the move tables derived from
+    them. The standard game is 6 pits of 4 seeds.
+
+    The board layout generalizes GameBoard's: with P pits per side the board is a list of 2P + 2 marble counts, player
+    0's store at index 0 and its pits at 1 - P, player 1's pits at P + 1 - 2P and its store at 2P + 1. Player 0 sows
+    downwards and player 1 upwards, each skipping the other's store, so a marble passes 2P + 1 indices per lap. Pit p
+    of a player is board index player * P + p, and the pit across index i is i + P or i - P.
+
+    Building the tables takes a while, so variants are shared: get returns the cached variant of a pit and seed count,
+    and its tables are built once.
+    """
+
+    # Largest number of pits per side, the size of the MASK_PITS table
+    MAX_PITS = 10
+
+    _cache = {}
+
+    def __init__(self, pits=6, seeds=4):
+        """
+        Use get instead, which shares the tables of equal variants.
+
+        :param pits: pits per side
+        :param seeds: seeds in every pit at the start
+        """
+        # A single pit would make a row of move scores look like a column of one score per board
+        assert 2 <= pits <= BoardVariant.MAX_PITS, \
+            "Invalid pit count {}, must be between 2 and {}".format(pits, BoardVariant.MAX_PITS)
+        # Zobrist keys and PackedBoard bytes cover counts up to 255
+        assert 1 <= seeds and 2 * pits * seeds <= 255, \
+            "Invalid seed count {}, the board must hold between 1 and 255 seeds".format(seeds)
+
+        self.pits = pits
+        self.seeds = seeds
+        self.size = 2 * pits + 2
+        self.stores = (0, self.size - 1)
+        self.lap = 2 * pits + 1
+        self.total_seeds = 2 * pits * seeds
+        self.row_mask = (1 << pits) - 1
+
+        # Sizes of a NeuralNetwork playing the variant: the board followed by the player to move, one output per pit
+        self.input_size = self.size + 1
+        self.output_size = pits
+
+        self.start = [0] + [seeds] * (2 * pits) + [0]
+
+        # Move tables, indexed by [player][pit] (pit 0 is unused)
+        # sowing_order: the lap indices reachable from each pit, in sowing order, ending with the pit itself
+        # sowing_mask: legal_mask bits of the pits among the first k entries of the sowing order, for k = 0 - lap
+        # index_across: the pit across every board index (the stores have no pit across)
+        self.sowing_order = [[None] + [self.sowing_path(player, pit) for pit in range(1, pits + 1)]
+                             for player in range(2)]
+        self.sowing_mask = [[None] + [[sum(1 << (index - 1) for index in self.sowing_order[player][pit][:k]
+                                           if index not in self.stores) for k in range(self.lap + 1)]
+                                      for pit in range(1, pits + 1)] for player in range(2)]
+        self.index_across = [None] + [self.across(index) for index in range(1, self.size - 1)] + [None]
+        self.mask_pits = BoardVariant.MASK_PITS
+
+        # Random 64 bit key for every (index, count), and the key xored in when player 1 is to move
+        zobrist_random = random.Random(0x6D616E63616C61)
+        self.zobrist = [[zobrist_random.getrandbits(64) for _ in range(256)] for _ in range(self.size)]
+        self.zobrist_player = zobrist_random.getrandbits(64)
+
+    @staticmethod
+    def get(pits=6, seeds=4):
+        """
+        :return: the shared BoardVariant of pits pits per side with seeds seeds each
+        """
+        variant = BoardVariant._cache.get((pits, seeds))
+        if variant is None:
+            variant = BoardVariant._cache[(pits, seeds)] = BoardVariant(pits, seeds)
+        return variant
+
+    def layers(self, *hidden):
+        """
+        :return: NeuralNetwork layer sizes for the variant with the given hidden layers
+        """
+        return [self.input_size] + list(hidden) + [self.output_size]
+
+    def board_index(self, player, pit):
+        return player * self.pits + pit
+
+    def across(self, index):
+        return index + self.pits if index <= self.pits else index - self.pits
+
+    def next_index(self, index, player):
+        """
+        :return: the index after index in player's sowing direction, skipping the other player's store
+        """
+        if index == 0:
+            return self.pits + 1
+        if index == self.size - 1:
+            return self.pits
+
+        if index <= self.pits:
+            index -= 1
+            if index == 0 and player == 1:
+                return self.pits + 1
+            return index
+        index += 1
+        if index == self.size - 1 and player == 0:
+            return self.pits
+        return index
+
+    def sowing_path(self, player, pit):
+        """
+        :return: tuple of the lap indices a marble from this pit is sown into, in order, the pit itself last
+        """
+        index = self.board_index(player, pit)
+        order = []
+        for _ in range(self.lap):
+            index = self.next_index(index, player)
+            order.append(index)
+        return tuple(order)
+
+    def sowing_delta(self, player, pit, marbles):
+        """
+        Closed form of sowing marbles out of a pit: every reachable index gets the number of full laps, and the first
+        (marbles % lap) indices of the sowing order get one more.
+
+        :return: (delta, last) where delta is the change to each board entry and last is the index the final marble
+        lands in
+        """
+        order = self.sowing_order[player][pit]
+        laps, remainder = divmod(marbles, self.lap)
+
+        delta = [0] * self.size
+        for position, index in enumerate(order):
+            delta[index] = laps + (1 if position < remainder else 0)
+        delta[self.board_index(player, pit)] -= marbles
+
+        return tuple(delta), order[(marbles - 1) % self.lap]
+
+    def zobrist_hash(self, board, player=None):
+        h = 0
+        for index, count in enumerate(board):
+            h ^= self.zobrist[index][count]
+        if player == 1:
+            h ^= self.zobrist_player
+        return h
+
+    def legal_mask(self, board):
+        """
+        :return: bitmask with bit (index - 1) set for every non empty pit, player 0's pits in the low pits bits and
+        player 1's above them
+        """
+        mask = 0
+        for index in range(1, self.size - 1):
+            if board[index] != 0:
+                mask |= 1 << (index - 1)
+        return mask
+
+    def __repr__(self):
+        return 'BoardVariant(pits={}, seeds={})'.format(self.pits, self.seeds)
+
+
+# The pits (1 - MAX_PITS) whose bits are set, for every legal move mask of up to MAX_PITS bits
+BoardVariant.MASK_PITS = [tuple(pit for pit in range(1, BoardVariant.MAX_PITS + 1) if mask & (1 << (pit - 1)))
+                          for mask in range(1 << BoardVariant.MAX_PITS)]
+BoardVariant.STANDARD = BoardVariant.get(6, 4)
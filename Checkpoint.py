@@ -0,0 +1,137 @@
+"""
+Binary checkpoints of networks and populations of networks.
+
+A checkpoint file is laid out as:
+
+    magic        8 bytes, b'MANCALA\\0'
+    version      uint32, little endian
+    header size  uint32, little endian
+    header       JSON, utf-8, padded with spaces so the weights start on a 64 byte boundary
+    weights      (rows, genes) matrix of float32 or float64 weights, C order, little endian
+
+The header holds the kind of checkpoint, the layer sizes, the learning rate, the dtype, shape and offset of the weight
+matrix, and any extra state the writer adds (e.g. the state of a GeneticAgent run). A network is a matrix of one row,
+laid out like NeuralNetwork.genome.
+
+Since the weights are one aligned block, loading can np.memmap them instead of reading them: the network then uses the
+pages of the file as its weights, and every process mapping the same file shares one copy of them.
+"""
+from NeuralNetwork import *
+import json
+import os
+import struct
+import numpy as np
+
+MAGIC = b'MANCALA\0'
+VERSION = 1
+ALIGNMENT = 64
+PREFIX = struct.Struct('<8sII')
+DTYPES = {'float32': np.dtype('<f4'), 'float64': np.dtype('<f8')}
+
+
+def save(path, genomes, header):
+    """
+    Writes a checkpoint through a temporary file, so a crash while saving never leaves a broken checkpoint behind.
+
+    :param genomes: (rows, genes) matrix of weights, float32 or float64
+    :param header: dict of header entries; dtype, shape and offset are filled in
+    """
+    genomes = np.asarray(genomes)
+    if genomes.ndim != 2:
+        raise Exception('Genomes have incorrect shape. The shape of the genomes was {}, but should be (rows, genes).'
+                        .format(genomes.shape))
+    if genomes.dtype.name not in DTYPES:
+        raise Exception('Unsupported weight dtype {}, must be float32 or float64.'.format(genomes.dtype))
+
+    header = dict(header, dtype=genomes.dtype.name, shape=list(genomes.shape))
+
+    # The offset is part of the header, so its length decides the offset; a few digits of room settles it
+    header['offset'] = 0
+    text = json.dumps(header).encode('utf-8')
+    offset = -(-(PREFIX.size + len(text) + 16) // ALIGNMENT) * ALIGNMENT
+    header['offset'] = offset
+    text = json.dumps(header).encode('utf-8')
+    text += b' ' * (offset - PREFIX.size - len(text))
+
+    with open(path + '.tmp', 'wb') as file:
+        file.write(PREFIX.pack(MAGIC, VERSION, len(text)))
+        file.write(text)
+        file.write(np.ascontiguousarray(genomes, dtype=DTYPES[genomes.dtype.name]).tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def read_header(path):
+    """
+    :return: the header dict of a checkpoint
+    """
+    with open(path, 'rb') as file:
+        prefix = file.read(PREFIX.size)
+        if len(prefix) != PREFIX.size:
+            raise Exception('{} is not a checkpoint, it is too short.'.format(path))
+        magic, version, size = PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise Exception('{} is not a checkpoint.'.format(path))
+        if version > VERSION:
+            raise Exception('{} is a version {} checkpoint, only up to version {} can be read.'
+                            .format(path, version, VERSION))
+        return json.loads(file.read(size).decode('utf-8'))
+
+
+def load(path, mmap_mode='r'):
+    """
+    :param mmap_mode: np.memmap mode for the weights: 'r' maps them read only, 'c' copy on write (the process can
+    change its weights without touching the file or the other processes' copies), None reads them into memory
+    :return: (genomes, header) with genomes the (rows, genes) weight matrix
+    """
+    header = read_header(path)
+    dtype = DTYPES[header['dtype']]
+    shape = tuple(header['shape'])
+
+    if mmap_mode is None:
+        with open(path, 'rb') as file:
+            file.seek(header['offset'])
+            genomes = np.fromfile(file, dtype=dtype, count=shape[0] * shape[1]).reshape(shape)
+    else:
+        genomes = np.memmap(path, dtype=dtype, mode=mmap_mode, offset=header['offset'], shape=shape)
+    return genomes, header
+
+
+def save_network(path, nn, dtype=None, **extra):
+    """
+    :param dtype: weight dtype to store, the network's own by default; float32 halves the size
+    :param extra: additional header entries
+    """
+    genome = nn.genome if dtype is None else nn.genome.astype(dtype)
+    save(path, genome[np.newaxis, :], dict(extra, kind='network', layers=list(nn.layers),
+                                           learning_rate=nn.learning_rate))
+
+
+def load_network(path, mmap_mode='r'):
+    """
+    :return: NeuralNetwork whose weights are the checkpoint's weights; with a mmap_mode they are a view into the
+    mapped file, so nothing is copied. A read only mapping can be queried but not trained.
+    """
+    genomes, header = load(path, mmap_mode)
+    if header.get('kind') != 'network' or genomes.shape[0] != 1:
+        raise Exception('{} is not a network checkpoint.'.format(path))
+    return NeuralNetwork(header['layers'], header['learning_rate'], genome=genomes[0])
+
+
+def save_population(path, genomes, layers, learning_rate=0.5, **extra):
+    """
+    :param genomes: (population, genes) matrix with one genome per row, e.g. GeneticAgent.genomes
+    :param extra: additional header entries
+    """
+    save(path, genomes, dict(extra, kind='population', layers=list(layers), learning_rate=learning_rate))
+
+
+def load_population(path, mmap_mode='r'):
+    """
+    :return: (genomes, header) of a population checkpoint, genomes being the (population, genes) matrix
+    """
+    genomes, header = load(path, mmap_mode)
+    if header.get('kind') != 'population':
+        raise Exception('{} is not a population checkpoint.'.format(path))
+    return genomes, header
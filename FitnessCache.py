@@ -0,0 +1,91 @@
+from collections import OrderedDict
+import hashlib
+import numpy as np
+
+
+class FitnessCache:
+
+    """
+    Least recently used cache of fitness estimates, keyed by a hash of a network's weights rather than by the
+    NeuralNetwork object, so survivors and copies of a network are recognized across selection steps and generations.
+
+    Every entry keeps the win percentage together with the number of games it was measured over, so fresh evaluations
+    of the same network are merged into a running average instead of replacing the old estimate.
+    """
+
+    def __init__(self, max_entries=1024):
+        """
+        :param max_entries: number of networks kept; the least recently used entry is evicted beyond that
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(nn):
+        """
+        :return: digest of the layer sizes and genome of the network
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.array(nn.layers, dtype=np.int64).tobytes())
+        digest.update(np.ascontiguousarray(nn.genome).data)
+        return digest.digest()
+
+    def get(self, key):
+        """
+        :return: (win_pct, games) for the key, or None if it is not cached
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def add(self, key, win_pct, games):
+        """
+        Merges an evaluation of win_pct over games into the entry for key.
+
+        :return: the merged (win_pct, games)
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            old_pct, old_games = entry
+            total = old_games + games
+            win_pct = (old_pct * old_games + win_pct * games) / total
+            games = total
+
+        self.entries[key] = (win_pct, games)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+        return win_pct, games
+
+    def clear(self):
+        self.entries.clear()
+
+    def state(self):
+        """
+        :return: list of [key as hex, win_pct, games] entries, least recently used first, which JSON can hold
+        """
+        return [[key.hex(), win_pct, games] for key, (win_pct, games) in self.entries.items()]
+
+    def load_state(self, state):
+        """
+        Replaces the entries with the ones of a list returned by state.
+        """
+        self.entries.clear()
+        for key, win_pct, games in state:
+            self.entries[bytes.fromhex(key)] = (win_pct, games)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
@@ -1,14 +1,102 @@
-from GameBoard import *
+from VariantGameBoard import *
+from BatchGameBoard import *
 from NeuralNetwork import *
+from MatchRunner import *
+from ReplayBuffer import *
+from Instrumentation import *
 import numpy as np
 import random
 
 
+# scipy.signal.lfilter once looked up by discounted_sums, False if SciPy is not installed
+_lfilter = None
+
+
+def discounted_sums(values, factor):
+    """
+    Discounted sum from every position to the end of the last axis, out[t] = values[t] + factor * out[t + 1], the
+    same recurrence discount_rewards used to walk backwards in Python.
+
+    A single game runs the recurrence over plain floats, which beats any array call at the length of a game. A batch
+    runs it over the reversed axis with scipy.signal.lfilter when SciPy is installed, otherwise with one vectorized
+    step per position. All of them do the same floating point operations as the loop, so the results are exact.
+
+    :param values: array or list, (length,) for one game or (games, length) for a batch
+    :return: new float array of the same shape
+    """
+    global _lfilter
+
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        out = values.tolist()
+        accumulated = 0.0
+        for i in range(len(out) - 1, -1, -1):
+            accumulated = out[i] + accumulated * factor
+            out[i] = accumulated
+        return np.array(out)
+
+    if values.shape[-1] == 0:
+        return values.copy()
+
+    if _lfilter is None:
+        # Imported on first use only, SciPy takes a while to import and is optional
+        try:
+            from scipy.signal import lfilter
+            _lfilter = lfilter
+        except ImportError:
+            _lfilter = False
+    if _lfilter:
+        return np.ascontiguousarray(_lfilter([1.0], [1.0, -factor], values[..., ::-1], axis=-1)[..., ::-1])
+
+    out = np.empty_like(values)
+    accumulated = np.zeros(values.shape[:-1])
+    for i in range(values.shape[-1] - 1, -1, -1):
+        accumulated = values[..., i] + accumulated * factor
+        out[..., i] = accumulated
+    return out
+
+
+def padded_rewards(rewards, lengths):
+    """
+    :return: (rewards, mask) where rewards is a (games, max length) float array with 0 after the end of every game
+    and mask is True for the moves of every game
+    """
+    rewards = np.array(rewards, dtype=float, ndmin=2)
+    lengths = np.asarray(lengths)
+    if lengths.shape != (rewards.shape[0],):
+        raise Exception('Lengths have incorrect shape. The shape of the lengths was {}, but should be ({},).'
+                        .format(lengths.shape, rewards.shape[0]))
+
+    mask = np.arange(rewards.shape[1]) < lengths[:, np.newaxis]
+    rewards[~mask] = 0.0
+    return rewards, mask
+
+
+def normalize_padded(values, mask):
+    """
+    Normalizes every row of values to a mean of 0 and a standard deviation of 1 over its masked entries, leaving rows
+    whose entries are all equal centered only. Entries outside the mask are set to 0.
+    """
+    counts = np.maximum(mask.sum(axis=1, keepdims=True), 1)
+    values = values - np.where(mask, values, 0.0).sum(axis=1, keepdims=True) / counts
+    values[~mask] = 0.0
+
+    std_dev = np.sqrt((values * values).sum(axis=1, keepdims=True) / counts)
+    std_dev[std_dev == 0] = 1.0
+    values /= std_dev
+    return values
+
+
 class Game:
 
-    def __init__(self):
-        self.board = GameBoard()
-        self.nn = NeuralNetwork([15, 200, 6], 0.3)
+    def __init__(self, variant=None):
+        """
+        :param variant: BoardVariant played, the standard 6 pit, 4 seed game by default. The network's input and
+        output sizes follow the variant.
+        """
+        self.variant = variant if variant is not None else BoardVariant.STANDARD
+        self.board = VariantGameBoard.create(self.variant)
+        self.nn = NeuralNetwork(self.variant.layers(200), 0.3)
 
     def turn(self, player, pit):
         next_player = self.board.move_marbles(player, pit)
@@ -21,273 +109,285 @@ class Game:
         return next_player
 
     def text_play(self):
-        player = 0
         print("Welcome to the game of Mancala! Player 0 will go first")
-        while player >= 0:
-            self.board.text_display_board()
-            pit = int(input("Player {}, please enter which pit (1-6) you would like to shift from:".format(player)))
-
-            player = self.turn(player, pit)
-
-        score = self.board.get_score()
-        final_marbles = self.board.get_sum_rows()
+        human = HumanAgent(self.variant)
+        result = next(MatchRunner(human, human, alternate=False, variant=self.variant).play(1))
 
-        score = [score[i] + final_marbles[i] for i in range(len(score))]
-        winner = max(enumerate(score), key=lambda x: x[1])[0]
+        score = result.score
+        winner = result.winner
 
+        self.board = VariantGameBoard.create(self.variant, result.board)
         self.board.text_display_board()
         print("Congratulations Player {}! You are the winner. "
               "The final score was Player 0: {} Player 1: {}".format(winner, score[0], score[1]))
         self.reset_game()
 
     def reset_game(self):
-        self.board = GameBoard()
+        self.board = VariantGameBoard.create(self.variant)
+
+    def test_against_random_agent(self, agent, num_games, parallel=None):
+        """
+        Plays num_games between agent and the random agent, agent playing player 0 in even games and player 1 in odd
+        games.
+
+        :param agent: a NeuralNetwork, anything else with query (AlphaBetaAgent, MCTSAgent) or an Agents agent
+        :param parallel: games played at once; defaults to 64 for agents which choose moves in batches (networks)
+        and 1 otherwise, so search agents can keep their tree between moves
+        :return: share of games won by agent
+        """
+        agent = as_agent(agent)
+        if parallel is None:
+            parallel = 64 if isinstance(agent, NetworkAgent) else 1
+        return MatchRunner(agent, RandomAgent(), variant=self.variant).win_rate(num_games, parallel)
 
-    def test_against_random_agent(self, agent, num_games):
-        player = 0
-        reset_counter = 0
-        turn_counter = 0
-        agent_win_counter = 0
-        agent_player = 0
-        next_player = 1
-
-        while reset_counter < num_games:
-            # initial_score = self.board.get_score()
-            turn_counter += 1
-
-            # print(self.board.text_display_board())
-            if player == agent_player:
-                agent_input = self.board.get_board()
-                agent_input.append(agent_player)
-                agent_decision = agent.query(agent_input)
-
-                sorted_decision = list(enumerate(agent_decision.flatten()))
-                sorted_decision.sort(key=lambda x: x[1])
-
-                for i in range(len(sorted_decision)):
-                    pit = sorted_decision[-(i + 1)][0] + 1
-                    next_player = self.turn(player, pit)
-
-                    if next_player == 2:
-                        next_player = agent_player
-                        # print(self.board.get_score())
-                    else:
-                        break
-
-                # post_turn_score = self.board.get_score()
-                # score_diff = [post_turn_score[i] - initial_score[i] for i in range(len(initial_score))]
-            else:
-                pit = Game.random_agent()
-                next_player = self.turn(player, pit)
-                if next_player == 2:
-                    next_player = -agent_player + 1
-
-            if next_player == -1:
-                score = self.board.get_score()
-                final_marbles = self.board.get_sum_rows()
-
-                score = [score[i] + final_marbles[i] for i in range(len(score))]
-                winner = max(enumerate(score), key=lambda x: x[1])[0]
-
-                if winner == agent_player:
-                    agent_win_counter += 1
-                self.reset_game()
-                reset_counter += 1
-                turn_counter = 0
-                agent_player = -agent_player + 1
-                next_player = 0
+    @staticmethod
+    def batch_test_against_random_agent(population_net, num_games, variant=None):
+        """
+        Plays num_games against the random agent for every network of a PopulationNetwork, all in lockstep on one
+        MatchRunner: every step is one batched query for all networks and one batched move for all games.
+
+        Like test_against_random_agent, the network plays as player 0 in even games and as player 1 in odd games,
+        picks its highest scoring non empty pit, and the random agent picks uniformly among its non empty pits.
 
-            player = next_player
+        :param variant: BoardVariant played, the standard game by default
+        :return: array with the win percentage of every network
+        """
+        agent = PopulationAgent(population_net, num_games)
+        runner = MatchRunner(agent, RandomAgent(), variant=variant)
 
-        return agent_win_counter / num_games
+        wins = np.zeros(population_net.population_size * num_games, dtype=bool)
+        for result in runner.play(len(wins), parallel=len(wins)):
+            wins[result.game] = result.winner == result.agent_player
+
+        return wins.reshape(population_net.population_size, num_games).mean(axis=1)
 
     @staticmethod
     def random_agent():
         return random.randint(1, 6)
 
     @staticmethod
-    def discount_rewards(reward_history, d_rate):
-        discounted_rewards = []
-
-        accumulated_reward = 0
-        for i in range(1, len(reward_history) + 1):
-            accumulated_reward = reward_history[-i] + accumulated_reward * d_rate
-            discounted_rewards.insert(0, accumulated_reward)
-            # print(accumulated_reward)
+    def discount_rewards(reward_history, d_rate, normalize=True):
+        """
+        Discounted return of every move of one game, accumulated backwards from the last move, then normalized to a
+        mean of 0 and a standard deviation of 1 (unless the rewards are all equal).
+
+        :param reward_history: rewards of the moves, in order
+        :param d_rate: discount rate
+        :param normalize: normalize the returns; if False the raw discounted returns are returned
+        :return: array of the returns, in the same order as the rewards
+        """
+        discounted_rewards = discounted_sums(reward_history, d_rate)
+        if normalize and len(discounted_rewards):
+            # Same operations as np.mean and np.std (which centers the already centered rewards again), so the
+            # results match them exactly
+            count = len(discounted_rewards)
+            discounted_rewards -= discounted_rewards.sum() / count
+            centered = discounted_rewards - discounted_rewards.sum() / count
+            std_dev = np.sqrt((centered * centered).sum() / count)
+            if std_dev != 0:
+                discounted_rewards /= std_dev
 
-        # normalize rewards before returning
+        return discounted_rewards
 
-        # print(discounted_rewards)
-        discounted_rewards -= np.mean(discounted_rewards)
-        std_dev = np.std(discounted_rewards)
-        if std_dev != 0:
-            discounted_rewards /= std_dev
-        # print(discounted_rewards)
+    @staticmethod
+    def discount_rewards_batch(rewards, lengths, d_rate, normalize=True):
+        """
+        discount_rewards for a batch of games at once.
+
+        :param rewards: (games, max length) array with the rewards of every game, padded after the end of a game
+        :param lengths: number of moves of every game
+        :return: (games, max length) array of the returns of every game, normalized per game like discount_rewards,
+        with 0 after the end of a game. Matches discount_rewards game by game up to rounding.
+        """
+        rewards, mask = padded_rewards(rewards, lengths)
+        returns = discounted_sums(rewards, d_rate)
+        if normalize:
+            returns = normalize_padded(returns, mask)
+        return returns
 
-        return discounted_rewards
+    @staticmethod
+    def gae_advantages(rewards, values, d_rate, gae_lambda, lengths=None, normalize=False):
+        """
+        Generalized advantage estimates (Schulman et al., High-Dimensional Continuous Control Using Generalized
+        Advantage Estimation) of the moves of one game, or of a padded batch of games when lengths is given.
+
+        Every move's temporal difference error reward + d_rate * value of the next move - value of the move is
+        discounted backwards by d_rate * gae_lambda. The value after the last move is 0, since the game is over.
+        gae_lambda = 1 gives the discounted returns minus the values, gae_lambda = 0 the one step errors.
+
+        :param rewards: rewards of the moves, (length,) or (games, max length)
+        :param values: value estimates of the positions the moves were played from, same shape as rewards
+        :param lengths: number of moves of every game for a padded batch
+        :param normalize: normalize the advantages per game like discount_rewards
+        :return: array of the advantages, the same shape as rewards
+        """
+        if lengths is None:
+            rewards = np.array(rewards, dtype=float, ndmin=2)
+            values = np.array(values, dtype=float, ndmin=2)
+            lengths = [rewards.shape[1]]
+            single = True
+        else:
+            single = False
+
+        rewards, mask = padded_rewards(rewards, lengths)
+        values = np.where(mask, np.asarray(values, dtype=float), 0.0)
+        if values.shape != rewards.shape:
+            raise Exception('Values have incorrect shape. The shape of the values was {}, but should be {}.'
+                            .format(values.shape, rewards.shape))
+
+        next_values = np.zeros_like(values)
+        next_values[:, :-1] = values[:, 1:]
+        errors = np.where(mask, rewards + d_rate * next_values - values, 0.0)
+
+        advantages = discounted_sums(errors, d_rate * gae_lambda)
+        if normalize:
+            advantages = normalize_padded(advantages, mask)
+        return advantages[0] if single else advantages
 
-    def train_neural_network(self, game_runs):
+    @staticmethod
+    def training_moves(result, player, d_rate=0.5):
+        """
+        Training data of one player's moves in a game recorded by MatchRunner, the way train_neural_network learns
+        from it: the target of a move is the network's output with the chosen pit's entry pushed up to 0.99 if the
+        move scored and down to 0.01 otherwise, and it is scaled by the move's return from move_rewards.
+
+        :param result: MatchResult with a history, in which player's moves have outputs
+        :param player: player id (0 or 1) whose moves are used
+        :return: (states, targets, actions, returns) arrays with one row per move, or None if player never moved
+        """
+        rewards = Game.move_rewards(result, player, d_rate)
+        if rewards is None:
+            return None
+
+        states, actions, scored, returns = rewards
+        targets = np.array([move[3] for move in result.history if move[0] == player], dtype=float)
+        targets[np.arange(len(actions)), actions - 1] = np.where(scored, 0.99, 0.01)
+        return states, targets, actions, returns
 
-        game_input_history = []
-        game_target_history = []
-        reward_history = []
-        player = 0
-        reset_counter = 0
-        turn_counter = 0
+    @staticmethod
+    def move_rewards(result, player, d_rate=0.5):
+        """
+        Rewards of one player's moves in a game recorded by MatchRunner. A scoring move is rewarded with half the
+        marbles it scored, any other move with -1, all rewards count 1.5 times in a won game, and the rewards are
+        discounted and normalized by discount_rewards.
+
+        :param result: MatchResult with a history; the moves need no outputs
+        :param player: player id (0 or 1) whose moves are used
+        :return: (states, actions, scored, returns) arrays with one row per move, scored telling which moves added
+        marbles to the store, or None if player never moved
+        """
+        moves = [move for move in result.history if move[0] == player]
+        if not moves:
+            return None
+
+        states = np.array([move[1] for move in moves], dtype=float)
+        actions = np.array([move[2] for move in moves])
+        score_diffs = np.array([move[4] for move in moves])
+
+        scored = score_diffs > 0
+        reward_history = np.where(scored, 0.5 * score_diffs, -1.0)
+        if result.winner == player:
+            reward_history *= 1.5
+
+        return states, actions, scored, Game.discount_rewards(reward_history, d_rate)
+
+    def train_neural_network(self, game_runs, parallel=1, temperature=None, replay=None, replay_batches=0,
+                             batch_size=32, prioritized=False, instrumentation=None):
+        """
+        Trains self.nn against the random agent. After every game the network is trained on each of its moves, with
+        the chosen pit's target pushed up if the move scored and down otherwise, scaled by the discounted reward.
+
+        The moves are kept in a ReplayBuffer, so on top of the pass over the finished game the network can be trained
+        on replay_batches minibatches of older moves after every game.
+
+        :param parallel: games played at once. With more than one, games in flight keep being played by the network
+        while it is trained on the games which finished.
+        :param temperature: if set, the network samples its moves from a softmax of its outputs over the legal pits
+        at this temperature instead of always playing its best pit, to explore during training
+        :param replay: optional ReplayBuffer to store the moves in, e.g. a memory mapped one for long runs. By default
+        a buffer holding the moves of the last 1000 games or so is used.
+        :param replay_batches: minibatches sampled from the buffer and trained on after every game
+        :param batch_size: moves per replayed minibatch
+        :param prioritized: sample minibatches by the size of the discounted reward instead of uniformly
+        :param instrumentation: optional Instrumentation timing the board simulation, the network's forward passes,
+        the reward discounting and the backpropagation, and counting games and positions
+        """
         ai_win_counter = 0
-        ai_player = 0
-
-        print("Welcome to the game of Mancala! this training session will continue for {} runs.".format(game_runs))
+        reset_counter = 0
+        instrumentation = instrumentation if instrumentation is not None else NO_INSTRUMENTATION
 
-        while reset_counter < game_runs:
-            initial_score = self.board.get_score()
-            turn_counter += 1
-            if player == ai_player:
-                ai_input = self.board.get_board()
-                ai_input.append(ai_player)
-                game_input_history.append(ai_input)
-                ai_decision = self.nn.query(ai_input)
-
-                sorted_decision = list(enumerate(ai_decision.flatten()))
-                sorted_decision.sort(key=lambda x: x[1])
-
-                for i in range(len(sorted_decision)):
-                    pit = sorted_decision[-(i + 1)][0] + 1
-                    next_player = self.turn(player, pit)
-
-                    if next_player == 2:
-                        next_player = ai_player
-                        #print(self.board.get_score())
-                    else:
-                        break
-
-                post_turn_score = self.board.get_score()
-                score_diff = [post_turn_score[i] - initial_score[i] for i in range(len(initial_score))]
-
-                # Converting the numpy array returned by query into a python list with integer elements (rather than
-                # numpy array elements as defaulted to by running list[ai_decision
-                ai_decision = [x[0] for x in list(ai_decision)]
-                target_list = ai_decision
-                # target_list = np.zeros(6)
-                if score_diff[player] > 0:
-                    target_list[pit - 1] = 0.99
-                    reward_history.append(0.5 * score_diff[player])
-                else:
-                    target_list[pit - 1] = 0.01
-                    reward_history.append(-1)
-
-                game_target_history.append(target_list)
-                # self.nn.train(ai_input, target_list)
-
-                # print("Turn {} has passed. NN scores {} points this round.".format(turn_counter, score_diff[player]))
-            else:
-                pit = Game.random_agent()
-                next_player = self.turn(player, pit)
-                if next_player == 2:
-                    next_player = -ai_player + 1
-
-            if next_player == -1:
-                score = self.board.get_score()
-                final_marbles = self.board.get_sum_rows()
-
-                score = [score[i] + final_marbles[i] for i in range(len(score))]
-                winner = max(enumerate(score), key=lambda x: x[1])[0]
+        if replay is None:
+            replay = ReplayBuffer(20000, self.nn.layers[0], self.nn.layers[-1])
 
-                # print("NN: Player {} Random AI: Player {}".format(ai_player, -ai_player + 1))
-                # print("Player {} won!".format(winner))
+        print("Welcome to the game of Mancala! this training session will continue for {} runs.".format(game_runs))
 
-                if winner == ai_player:
+        runner = MatchRunner(instrumentation.agent(NetworkAgent(self.nn, temperature), 'forward'),
+                             instrumentation.agent(RandomAgent(), 'random_agent'), variant=self.variant)
+        games = instrumentation.iterate('simulation', runner.play(game_runs, parallel, record=True))
+        with instrumentation.profile(0):
+            for result in games:
+                ai_player = result.agent_player
+                if result.winner == ai_player:
                     ai_win_counter += 1
-                    reward_history = [reward * 1.5 for reward in reward_history]
-
-                discounted_rewards = Game.discount_rewards(reward_history, 0.5)
 
-                for i in range(len(game_input_history)):
-                    self.nn.train(game_input_history[i], [target * discounted_rewards[i]
-                                                          for target in game_target_history[i]])
+                # print("NN: Player {} Random AI: Player {}".format(ai_player, -ai_player + 1))
+                # print("Player {} won!".format(result.winner))
+
+                with instrumentation.phase('discount'):
+                    moves = Game.training_moves(result, ai_player)
+                if moves is not None:
+                    with instrumentation.phase('backprop'):
+                        # One batched update for the whole game, each target scaled by its discounted reward
+                        rows = replay.add_batch(*moves, priorities=moves[3])
+                        game_moves = replay.get(rows)
+                        self.nn.train_batch(game_moves.states,
+                                            game_moves.targets * game_moves.returns[:, np.newaxis])
+
+                        for _ in range(replay_batches):
+                            batch = replay.sample(batch_size, prioritized)
+                            self.nn.train_batch(batch.states,
+                                                batch.targets * (batch.returns * batch.weights)[:, np.newaxis])
+
+                instrumentation.count('games')
+                instrumentation.count('positions', result.turns)
+                instrumentation.tick(games_played=reset_counter + 1)
 
-                game_target_history = []
-                game_input_history = []
-                reward_history = []
-                self.reset_game()
                 reset_counter += 1
-                turn_counter = 0
-                ai_player = -ai_player + 1
-                next_player = 0
                 if reset_counter > 0 and reset_counter * 100 / game_runs % 10 == 0:
                     print("Training is {}% finished!".format(reset_counter * 100 / game_runs))
 
-            player = next_player
-
+        instrumentation.log('train_end', games_played=reset_counter)
+        replay.flush()
         print("AI has completed this training session.")
         print("AI has won {} percentage of games".format(ai_win_counter/game_runs))
 
-    def test_neural_network(self, game_runs):
-        player = 0
-        reset_counter = 0
-        turn_counter = 0
+    def test_neural_network(self, game_runs, league=None, games_per_opponent=20):
+        """
+        Plays self.nn against the random agent, printing every game, and then against every member of league if one
+        is given, printing the win rate against each member and the Elo performance rating of the network.
+        """
         ai_win_counter = 0
-        ai_player = 0
-        next_player = 1
 
         print("Welcome to the game of Mancala! AI will start first")
-        while reset_counter < game_runs:
-            initial_score = self.board.get_score()
-            turn_counter += 1
-
-            # print(self.board.text_display_board())
-            if player == ai_player:
-                ai_input = self.board.get_board()
-                ai_input.append(ai_player)
-                ai_decision = self.nn.query(ai_input)
-
-                sorted_decision = list(enumerate(ai_decision.flatten()))
-                sorted_decision.sort(key=lambda x: x[1])
-
-                for i in range(len(sorted_decision)):
-                    pit = sorted_decision[-(i + 1)][0] + 1
-                    next_player = self.turn(player, pit)
-
-                    if next_player == 2:
-                        next_player = ai_player
-                        # print(self.board.get_score())
-                    else:
-                        break
-
-                post_turn_score = self.board.get_score()
-                score_diff = [post_turn_score[i] - initial_score[i] for i in range(len(initial_score))]
-                # print(post_turn_score)
-                print("Turn {} has passed. NN scores {} points this round.".format(turn_counter, score_diff[player]))
-            else:
-                pit = Game.random_agent()
-                next_player = self.turn(player, pit)
-                if next_player == 2:
-                    next_player = -ai_player + 1
-
-            if next_player == -1:
-                score = self.board.get_score()
-                final_marbles = self.board.get_sum_rows()
-
-                score = [score[i] + final_marbles[i] for i in range(len(score))]
-                winner = max(enumerate(score), key=lambda x: x[1])[0]
-
-                print("NN: Player {} Random AI: Player {}".format(ai_player, -ai_player + 1))
-                print("Player {} won!".format(winner))
-                print("Final Score is {}!".format(score))
-                if winner == ai_player:
-                    ai_win_counter += 1
-                self.reset_game()
-                reset_counter += 1
-                turn_counter = 0
-                ai_player = -ai_player + 1
-                next_player = 0
+        runner = MatchRunner(NetworkAgent(self.nn), RandomAgent(), variant=self.variant)
+        for result in runner.play(game_runs, record=True):
+            ai_player = result.agent_player
 
-            player = next_player
+            for turn_counter, (player, ai_input, pit, ai_decision, score_diff) in enumerate(result.history, 1):
+                if player == ai_player:
+                    print("Turn {} has passed. NN scores {} points this round.".format(turn_counter, score_diff))
 
-        print("AI has won {} percentage of games".format(ai_win_counter / game_runs))
+            print("NN: Player {} Random AI: Player {}".format(ai_player, -ai_player + 1))
+            print("Player {} won!".format(result.winner))
+            print("Final Score is {}!".format(result.score))
+            if result.winner == ai_player:
+                ai_win_counter += 1
 
-newgame = Game()
+        print("AI has won {} percentage of games".format(ai_win_counter / game_runs))
 
-#newgame.text_play()
-# newgame.train_neural_network(100000)
-# newgame.test_neural_network(1000)
+        if league is not None and len(league) > 0:
+            results = league.evaluate(self.nn, games_per_opponent)
+            for name, win_pct in results.items():
+                print("AI has won {} percentage of games against {} (rated {:.0f})"
+                      .format(win_pct, name, league.member(name)['rating']))
+            print("AI has a performance rating of {:.0f} against the league".format(league.performance_rating(results)))
@@ -1,13 +1,125 @@
 
+from BoardVariant import *
+
+
 class GameBoard:
 
-    def __init__(self):
-        self.board = [0,
-                      4, 4, 4, 4, 4, 4,
-                      4, 4, 4, 4, 4, 4,
-                      0]
+    def __init__(self, board=None):
+        """
+        :param board: optional list of 14 marble counts to start from, in the same layout as self.board. Defaults to
+        the standard starting position.
+        """
+        if board is None:
+            board = [0,
+                     4, 4, 4, 4, 4, 4,
+                     4, 4, 4, 4, 4, 4,
+                     0]
+        self.board = list(board)
+
+        # Zobrist hash of the board, kept up to date by move_marbles
+        self.hash = GameBoard.zobrist_hash(self.board)
+
+        # Bitmask of the non empty pits, bit (index - 1) for board index 1 - 12, kept up to date by move_marbles.
+        # The low 6 bits are player 0's legal moves and the high 6 bits player 1's, see legal_moves
+        self.legal = GameBoard.legal_mask(self.board)
+
+    def set_board(self, board):
+        """
+        Replaces the board with a copy of the given list and recomputes its hash. Use this rather than assigning
+        self.board directly.
+        """
+        self.board = list(board)
+        self.hash = GameBoard.zobrist_hash(self.board)
+        self.legal = GameBoard.legal_mask(self.board)
+
+    def copy(self):
+        board = GameBoard.__new__(GameBoard)
+        board.board = self.board[:]
+        board.hash = self.hash
+        board.legal = self.legal
+        return board
+
+    def legal_moves(self, player):
+        """
+        :return: bitmask of the legal moves of player, bit (pit - 1) set if the pit is not empty
+        """
+        return (self.legal >> (player * 6)) & 0x3F
+
+    def legal_pits(self, player):
+        """
+        :return: tuple of the legal pits (1 - 6) of player, in increasing order
+        """
+        return GameBoard.MASK_PITS[(self.legal >> (player * 6)) & 0x3F]
 
     def move_marbles(self, player, pit):
+        """
+        Moves the marbles in the given pit. The final distribution is found in closed form from the precomputed sowing
+        order of the pit: every reachable index gets the number of full laps, and the first (marbles % 13) indices get
+        one more. This replaces one next_index call per marble.
+
+        :param player: 0 or 1
+        :param pit: numbered 1 - 6
+        :return: 2 if the pit was empty, player if the last marble landed in a store (extra turn), otherwise the
+        other player
+        """
+        assert player == 0 or player == 1, "Invalid player id, must be either 0 or 1"
+        assert 1 <= pit <= 6, "Invalid pit number {}, must be between 1 and 6".format(pit)
+
+        board = self.board
+        index = player * 6 + pit
+        marbles = board[index]
+
+        if marbles == 0:
+            return 2
+
+        # Every changed entry is xored out of the hash with its old count and back in with its new one
+        zobrist = GameBoard.ZOBRIST
+        h = self.hash ^ zobrist[index][marbles] ^ zobrist[index][0]
+        board[index] = 0
+
+        order = GameBoard.SOWING_ORDER[player][pit]
+        laps, remainder = divmod(marbles, 13)
+
+        # Sowing only ever fills pits, so the emptied pit is cleared and every pit reached is set. A full lap reaches
+        # every index of the order, the emptied pit included.
+        legal = (self.legal & ~(1 << (index - 1))) | GameBoard.SOWING_MASK[player][pit][13 if laps else remainder]
+        if laps:
+            for i in order:
+                count = board[i]
+                h ^= zobrist[i][count] ^ zobrist[i][count + laps]
+                board[i] = count + laps
+        for i in order[:remainder]:
+            count = board[i]
+            h ^= zobrist[i][count] ^ zobrist[i][count + 1]
+            board[i] = count + 1
+        index = order[(marbles - 1) % 13]
+
+        if index == 0 or index == 13:
+            self.hash = h
+            self.legal = legal
+            return player
+
+        if board[index] == 1:
+            across = GameBoard.INDEX_ACROSS[index]
+            captured = board[across]
+            if captured != 0:
+                store = board[-player]
+                h ^= zobrist[across][captured] ^ zobrist[across][0] ^ zobrist[index][1] ^ zobrist[index][0]
+                h ^= zobrist[-player][store] ^ zobrist[-player][store + captured + 1]
+                board[-player] = store + captured + 1
+                board[across] = 0
+                board[index] = 0
+                legal &= ~((1 << (across - 1)) | (1 << (index - 1)))
+
+        self.hash = h
+        self.legal = legal
+        return -player + 1
+
+    def move_marbles_reference(self, player, pit):
+        """
+        Reference implementation of move_marbles which sows one marble at a time with next_index. It is kept to check
+        the closed form move_marbles against, and is much slower.
+        """
         assert player == 0 or player == 1, "Invalid player id, must be either 0 or 1"
         assert 1 <= pit <= 6, "Invalid pit number {}, must be between 1 and 6".format(pit)
 
@@ -25,6 +137,9 @@ class GameBoard:
             self.board[index] += 1
             marbles -= 1
 
+        self.hash = GameBoard.zobrist_hash(self.board)
+        self.legal = GameBoard.legal_mask(self.board)
+
         if index == 0 or index == 13:
             return player
 
@@ -36,13 +151,14 @@ class GameBoard:
                 self.board[across] = 0
                 self.board[index] = 0
                 self.board[-player] += plus_points
+                self.hash = GameBoard.zobrist_hash(self.board)
+                self.legal = GameBoard.legal_mask(self.board)
 
         return -player + 1
 
     def check_end_condition(self):
-        index0 = GameBoard.board_index(0, 1)
-        index1 = GameBoard.board_index(1, 1)
-        return not any(self.board[index0: index0 + 6]) or not any(self.board[index1: index1 + 6])
+        # A row is empty exactly when its player has no legal move
+        return not self.legal & 0x3F or not self.legal >> 6
 
     def get_sum_rows(self):
         index0 = GameBoard.board_index(0, 1)
@@ -115,3 +231,51 @@ class GameBoard:
             if index == 13 and player == 0:
                 return 6
             return index
+
+    @staticmethod
+    def zobrist_hash(board, player=None):
+        """
+        Computes the Zobrist hash of a board from scratch by xoring one random key per (index, count).
+
+        :param board: list of 14 marble counts
+        :param player: optional player to move, xored in as ZOBRIST_PLAYER for player 1 so positions with different
+        players to move hash differently
+        """
+        zobrist = GameBoard.ZOBRIST
+        h = 0
+        for index, count in enumerate(board):
+            h ^= zobrist[index][count]
+        if player == 1:
+            h ^= GameBoard.ZOBRIST_PLAYER
+        return h
+
+    @staticmethod
+    def legal_mask(board):
+        """
+        Computes the legal move bitmask of a board from scratch.
+
+        :param board: list of 14 marble counts
+        :return: bitmask with bit (index - 1) set for every non empty pit at board index 1 - 12
+        """
+        mask = 0
+        for index in range(1, 13):
+            if board[index] != 0:
+                mask |= 1 << (index - 1)
+        return mask
+
+
+# Precomputed move tables of the standard variant, indexed by [player][pit] (pit 0 is unused). GameBoard keeps its own
+# 6 pit move code for speed; VariantGameBoard plays the other BoardVariants from their own tables.
+# SOWING_ORDER: the 13 indices reachable from each pit, in sowing order
+# SOWING_MASK: legal_mask bits of the pits among the first k entries of the sowing order, for k = 0 - 13
+# INDEX_ACROSS: index_across for every board index (the stores have no pit across)
+# MASK_PITS: the pits whose bits are set, for every legal move mask (BoardVariant.MAX_PITS bits, the first 64 entries
+# cover GameBoard's 6 bit masks)
+# ZOBRIST: random 64 bit key for every (index, count), counts up to 255 so a board always fits in PackedBoard bytes
+# ZOBRIST_PLAYER: key xored in when player 1 is to move
+GameBoard.SOWING_ORDER = BoardVariant.STANDARD.sowing_order
+GameBoard.SOWING_MASK = BoardVariant.STANDARD.sowing_mask
+GameBoard.INDEX_ACROSS = BoardVariant.STANDARD.index_across
+GameBoard.MASK_PITS = BoardVariant.MASK_PITS
+GameBoard.ZOBRIST = BoardVariant.STANDARD.zobrist
+GameBoard.ZOBRIST_PLAYER = BoardVariant.STANDARD.zobrist_player
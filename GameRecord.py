@@ -0,0 +1,300 @@
+"""
+Compact binary records of played games, for training offline from stored games instead of playing them again.
+
+A record file is a short prefix followed by games back to back:
+
+    magic        8 bytes, b'MANCREC\\0'
+    version      uint32, little endian
+
+and every game is
+
+    agent player 1 byte, the side the first agent played (MatchResult.agent_player)
+    board        14 bytes, the marble counts of the initial board
+    moves        1 byte per move, player << 4 | pit, never 0
+    end          1 byte, 0
+
+so a game takes about 50 bytes, and a file can be read game by game without any index. Everything else about a game
+(the positions, store gains, winner and score) follows from replaying its moves on a GameBoard, and the player bits
+of every move are checked against the replay.
+
+generate writes games in chunks of games_per_file to one file each, in parallel processes, every chunk seeded by its
+index so the games do not depend on the number of workers. GameRecordReader streams the games of a set of files, as
+records, replayed MatchResults or minibatches of (state, action, scored, return) rows, reading one memory mapped file
+at a time.
+"""
+from Game import *
+from collections import namedtuple
+import concurrent.futures
+import mmap
+import os
+import struct
+import numpy as np
+import random
+
+MAGIC = b'MANCREC\0'
+VERSION = 1
+PREFIX = struct.Struct('<8sI')
+EXTENSION = '.mrec'
+
+# One stored game: agent_player, the initial board (list of 14) and the moves as a list of (player, pit)
+GameRecord = namedtuple('GameRecord', ['agent_player', 'board', 'moves'])
+
+# Minibatch of moves: states (n, 15), actions (n,) pits 1 - 6, scored (n,) whether the move added marbles to the
+# mover's store, returns (n,) discounted rewards as Game.move_rewards computes them
+RecordBatch = namedtuple('RecordBatch', ['states', 'actions', 'scored', 'returns'])
+
+
+def encode(result):
+    """
+    :param result: MatchResult with a history
+    :return: bytes of the game's record
+    """
+    if not result.history:
+        raise Exception('Game {} has no recorded history to encode.'.format(result.game))
+    # The batched MatchRunner records its inputs as floats
+    board = [int(marbles) for marbles in result.history[0][1][:14]]
+    return (bytes([result.agent_player]) + bytes(board) +
+            bytes(player << 4 | pit for player, _, pit, _, _ in result.history) + b'\0')
+
+
+class GameRecordWriter:
+
+    """
+    Appends games to a new record file. Usable as a context manager.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(PREFIX.pack(MAGIC, VERSION))
+        self.games = 0
+
+    def write(self, result):
+        self.file.write(encode(result))
+        self.games += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class GameRecordReader:
+
+    """
+    Streams the games of record files in order.
+    """
+
+    def __init__(self, paths):
+        """
+        :param paths: a record file, a directory of record files, or a list of either
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        self.paths = []
+        for path in paths:
+            if os.path.isdir(path):
+                self.paths += sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(EXTENSION))
+            else:
+                self.paths.append(path)
+
+    def games(self):
+        """
+        :return: yields a GameRecord per stored game
+        """
+        for path in self.paths:
+            with open(path, 'rb') as file:
+                # mmap cannot map an empty file, so files too short for the prefix are refused before mapping
+                if os.fstat(file.fileno()).st_size < PREFIX.size:
+                    raise Exception('{} is not a game record file.'.format(path))
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if data[:len(MAGIC)] != MAGIC:
+                    raise Exception('{} is not a game record file.'.format(path))
+                version = PREFIX.unpack(data[:PREFIX.size])[1]
+                if version > VERSION:
+                    raise Exception('{} is a version {} game record file, only up to version {} can be read.'
+                                    .format(path, version, VERSION))
+
+                offset = PREFIX.size
+                while offset < len(data):
+                    # Board bytes can be 0, so the end of the moves is searched for past the board
+                    end = data.find(b'\0', offset + 15)
+                    if end < 0:
+                        raise Exception('{} ends in the middle of a game, at byte {}.'.format(path, offset))
+                    moves = [(move >> 4, move & 0xF) for move in data[offset + 15:end]]
+                    yield GameRecord(data[offset], list(data[offset + 1:offset + 15]), moves)
+                    offset = end + 1
+            finally:
+                data.close()
+
+    @staticmethod
+    def replay(record, game=0):
+        """
+        Plays a record's moves on a GameBoard.
+
+        :param game: index given to the MatchResult
+        :return: MatchResult with a history whose outputs are None, as MatchRunner records it
+        """
+        board = GameBoard(record.board)
+        b = board.board
+        player = record.moves[0][0] if record.moves else 0
+        history = []
+
+        for turn, (mover, pit) in enumerate(record.moves):
+            if mover != player or not board.legal_moves(player) >> (pit - 1) & 1:
+                raise Exception('Record of game {} has an illegal move {} by player {} at turn {}.'
+                                .format(game, pit, mover, turn))
+            input_list = b + [player]
+            store = player * 13
+            before = b[store]
+            next_player = board.move_marbles(player, pit)
+            history.append((player, input_list, pit, None, b[store] - before))
+            player = next_player
+
+        if not board.check_end_condition():
+            raise Exception('Record of game {} stops before the game is over.'.format(game))
+
+        score = board.get_score()
+        final_marbles = board.get_sum_rows()
+        score = [score[i] + final_marbles[i] for i in range(len(score))]
+        winner = max(enumerate(score), key=lambda x: x[1])[0]
+        return MatchResult(game, record.agent_player, winner, score, len(history), b[:], history)
+
+    def results(self):
+        """
+        :return: yields the replayed MatchResult of every stored game
+        """
+        for game, record in enumerate(self.games()):
+            yield GameRecordReader.replay(record, game)
+
+    def minibatches(self, batch_size=32, player='agent', d_rate=0.5, shuffle=0, rng=None):
+        """
+        Replays the games into minibatches of their moves, lazily: only the moves of the current minibatches are
+        held.
+
+        :param player: whose moves are used: 'agent' for the first agent's side, 'both', or a player id
+        :param d_rate: discount rate of the returns
+        :param shuffle: moves gathered and shuffled before they are handed out, 0 keeps the order of the games
+        :param rng: optional np.random.RandomState or Generator for the shuffling
+        :return: yields RecordBatches of batch_size moves, the last one possibly smaller
+        """
+        rng = rng if rng is not None else np.random
+        gather = max(batch_size, shuffle)
+        pending = []
+        size = 0
+
+        for result in self.results():
+            if player == 'agent':
+                players = (result.agent_player,)
+            elif player == 'both':
+                players = (0, 1)
+            else:
+                players = (player,)
+
+            for side in players:
+                rewards = Game.move_rewards(result, side, d_rate)
+                if rewards is not None:
+                    pending.append(rewards)
+                    size += len(rewards[0])
+
+            if size >= gather:
+                batch = GameRecordReader.concatenate(pending, shuffle, rng)
+                # Whole minibatches are handed out, the rest waits for the next games
+                full = len(batch.states) - len(batch.states) % batch_size
+                for start in range(0, full, batch_size):
+                    yield RecordBatch(*(array[start:start + batch_size] for array in batch))
+                pending = [tuple(array[full:] for array in batch)]
+                size = len(batch.states) - full
+
+        if size > 0:
+            batch = GameRecordReader.concatenate(pending, shuffle, rng)
+            for start in range(0, len(batch.states), batch_size):
+                yield RecordBatch(*(array[start:start + batch_size] for array in batch))
+
+    @staticmethod
+    def concatenate(pending, shuffle, rng):
+        """
+        :return: RecordBatch of all pending (states, actions, scored, returns) moves, in random order if shuffle
+        """
+        batch = RecordBatch(*(np.concatenate(arrays) for arrays in zip(*pending)))
+        if shuffle:
+            order = rng.permutation(len(batch.states))
+            batch = RecordBatch(*(array[order] for array in batch))
+        return batch
+
+
+def train_network(nn, reader, batch_size=32, epochs=1, player='agent', d_rate=0.5, shuffle=0):
+    """
+    Trains nn on stored games like Game.train_neural_network trains on played ones: the target of a move is the
+    network's current output with the chosen pit pushed up to 0.99 if the move scored and down to 0.01 otherwise,
+    scaled by the move's return.
+
+    :param reader: GameRecordReader of the games
+    :return: number of moves trained on
+    """
+    moves = 0
+    for _ in range(epochs):
+        for batch in reader.minibatches(batch_size, player, d_rate, shuffle):
+            targets = nn.query_batch(batch.states).copy()
+            targets[np.arange(len(batch.actions)), batch.actions - 1] = np.where(batch.scored, 0.99, 0.01)
+            nn.train_batch(batch.states, targets * batch.returns[:, np.newaxis])
+            moves += len(batch.actions)
+    return moves
+
+
+def generate(directory, num_games, players=('random', 'random'), nn=None, temperature=1.0, workers=1,
+             games_per_file=100000, parallel=64, random_opening=0, seed=0):
+    """
+    Plays num_games games and records them into directory, games_per_file per file.
+
+    :param players: the two agents, each 'random' or 'network'
+    :param nn: NeuralNetwork of the 'network' agents
+    :param temperature: softmax temperature of the network's moves, None always plays its best pit
+    :param workers: processes playing files at once
+    :param parallel: games in flight at once in every process
+    :param random_opening: random moves at the start of every game, see MatchRunner
+    :param seed: chunk i is played with random and np.random seeded by seed + i
+    :return: list of the written files
+    """
+    if 'network' in players and nn is None:
+        raise Exception('Recording games of a network agent needs a network.')
+    os.makedirs(directory, exist_ok=True)
+
+    layers = None if nn is None else list(nn.layers)
+    genome = None if nn is None else np.array(nn.genome)
+    tasks = []
+    for chunk, start in enumerate(range(0, num_games, games_per_file)):
+        path = os.path.join(directory, 'games-{:05d}{}'.format(chunk, EXTENSION))
+        tasks.append((path, min(games_per_file, num_games - start), tuple(players), layers, genome, temperature,
+                      parallel, random_opening, seed + chunk))
+
+    if workers <= 1:
+        return [write_chunk(*task) for task in tasks]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(write_chunk, *zip(*tasks)))
+
+
+def write_chunk(path, num_games, players, layers, genome, temperature, parallel, random_opening, seed):
+    """
+    Body of a generate task: plays and records one file of games.
+
+    :return: path of the file
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+
+    nn = None if layers is None else NeuralNetwork(layers, genome=genome)
+    agents = [NetworkAgent(nn, temperature) if name == 'network' else RandomAgent() for name in players]
+    runner = MatchRunner(agents[0], agents[1], random_opening=random_opening)
+
+    with GameRecordWriter(path + '.tmp') as writer:
+        for result in runner.play(num_games, parallel, record=True):
+            writer.write(result)
+    os.replace(path + '.tmp', path)
+    return path
@@ -1,35 +1,155 @@
 from NeuralNetwork import *
 from Game import *
+from ParallelFitness import *
+from FitnessCache import *
+from PopulationNetwork import *
+import Checkpoint
 import numpy as np
-import random as rand
 
 
 class GeneticAgent:
 
-    def __init__(self, population_size, net_size):
+    def __init__(self, population_size, net_size, workers=1, seed=None, games_per_fitness=100,
+                 fitness_cache_size=1024, max_fitness_games=None, batched_fitness=False, league=None,
+                 league_opponents=4, league_interval=None, fitness_dtype=None, instrumentation=None):
         """
         population_size is the number of neural nets you start off with
 
         net_size is a list in which the length is the number of layers and the elements are the number
         of weights in that layer
 
+        workers is the number of processes fitness is computed with. With more than one, the population is
+        evaluated by a ParallelFitness process pool.
+
+        seed makes a run reproducible: it seeds random and np.random, and every fitness evaluation gets its own seed
+        drawn from np.random, so the results are the same for any number of workers.
+
+        fitness_cache_size is the number of networks whose fitness is remembered (0 disables the cache). A cached
+        network is only played again while it has fewer than max_fitness_games games (games_per_fitness by default),
+        and the new games are merged into its estimate.
+
+        batched_fitness makes every evaluated network play its fitness games in lockstep in one process, with a
+        PopulationNetwork and Game.batch_test_against_random_agent, instead of one network and one game at a time.
+        It takes the place of the worker pool. fitness_dtype (e.g. np.float32) is the precision the batched games are
+        played in, the genomes' own by default.
+
+        league is an optional League. Once it has members, fitness is the win rate against up to league_opponents
+        members sampled by rating instead of against the random agent, which stops fitness from saturating near 100%.
+        Each network plays all of its league games in lockstep in this process, in place of the worker pool or
+        batched_fitness. Every league_interval generations run adds the best network of the population to the league.
+
+        instrumentation is an optional Instrumentation timing selection, recombination, mutation and fitness, logged
+        after every generation, and profiling the generation it is set to.
+
         In this genetic algorithm, each singular weight in the neural network is considered a real valued allele.
         Concepts drawn from "Introduction to Evolutionary Computing," by A.E. Eiben and J.E. Smith.
         """
-        self.population = [NeuralNetwork(net_size) for _ in range(population_size)]
-        self.game = Game()
-        self.net_size = net_size
+        self.seed = seed
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
 
-    def fitness(self, nn):
-        return self.game.test_against_random_agent(nn, 100)
+        self.net_size = net_size
+        # Every genome is one row of a single (population_size, genes) matrix, and every member of the population is
+        # a NeuralNetwork whose weights are views into its row
+        self.genomes = GeneticAgent.random_genomes(population_size, net_size)
+        self.population = self.networks_from_genomes(self.genomes)
+        self.game = Game()
+        self.games_per_fitness = games_per_fitness
+        self.workers = workers
+        self.batched_fitness = batched_fitness
+        self.parallel_fitness = None
+        if workers > 1 and not batched_fitness:
+            self.parallel_fitness = ParallelFitness(net_size, workers, games_per_fitness)
+        self.fitness_cache = FitnessCache(fitness_cache_size) if fitness_cache_size > 0 else None
+        self.max_fitness_games = max_fitness_games if max_fitness_games is not None else games_per_fitness
+        self.league = league
+        self.league_opponents = league_opponents
+        self.league_interval = league_interval
+        self.fitness_dtype = fitness_dtype
+        self.instrumentation = instrumentation if instrumentation is not None else NO_INSTRUMENTATION
+        # League version the cached fitness values were measured against
+        self.league_version = None
+        self.generation = 0
+
+    def uses_league(self):
+        return self.league is not None and len(self.league) > 0
+
+    def fitness(self, nn, seed=None):
+        if self.uses_league():
+            if seed is None:
+                return self.league.win_rate(nn, self.games_per_fitness, self.league_opponents)
+            return call_seeded(seed, self.league.win_rate, nn, self.games_per_fitness, self.league_opponents)
+
+        if seed is None:
+            return self.game.test_against_random_agent(nn, self.games_per_fitness)
+        return evaluate_network(self.game, nn, self.games_per_fitness, seed)
 
     def compute_fitness(self, population):
+        with self.instrumentation.phase('fitness'):
+            return self.measure_fitness(population)
+
+    def measure_fitness(self, population):
         pop_performance = {}
 
+        seeds = np.random.randint(0, 2 ** 31, size=len(population)) if self.seed is not None else None
+
+        use_league = self.uses_league()
+        if self.fitness_cache is not None and use_league and self.league_version != self.league.version:
+            # Results against an older league (or the random agent) do not mix with results against this one
+            self.fitness_cache.clear()
+            self.league_version = self.league.version
+
+        # Only networks which are not cached, or whose estimate still needs more games, are evaluated. Copies of the
+        # same network within the population are evaluated once.
+        keys = [None] * len(population)
+        to_evaluate = {}
+        # Win rate of every key, from the cache lookups here and the merged results below. The cache is not read
+        # again afterwards, as it may have evicted entries of this population by then.
+        fitness_by_key = {}
+        for i in range(len(population)):
+            if self.fitness_cache is not None:
+                keys[i] = FitnessCache.key(population[i])
+                if keys[i] in fitness_by_key or keys[i] in to_evaluate:
+                    continue
+                cached = self.fitness_cache.get(keys[i])
+                if cached is not None and cached[1] >= self.max_fitness_games:
+                    fitness_by_key[keys[i]] = cached[0]
+                    continue
+                to_evaluate[keys[i]] = i
+            else:
+                to_evaluate[i] = i
+
+        indices = list(to_evaluate.values())
+        self.instrumentation.count('games', len(indices) * self.games_per_fitness)
+        if use_league:
+            win_pcts = [self.fitness(population[i], None if seeds is None else int(seeds[i])) for i in indices]
+        elif self.batched_fitness:
+            win_pcts = []
+            if indices:
+                genomes = np.stack([population[i].genome for i in indices])
+                if self.fitness_dtype is not None:
+                    genomes = genomes.astype(self.fitness_dtype, copy=False)
+                population_net = PopulationNetwork(self.net_size, genomes)
+                win_pcts = Game.batch_test_against_random_agent(population_net, self.games_per_fitness).tolist()
+        elif self.parallel_fitness is not None:
+            if seeds is None:
+                seeds = [random.getrandbits(31) for _ in range(len(population))]
+            win_pcts = self.parallel_fitness.compute([population[i] for i in indices], [seeds[i] for i in indices])
+        else:
+            win_pcts = [self.fitness(population[i], None if seeds is None else int(seeds[i])) for i in indices]
+
+        if self.fitness_cache is None:
+            for i, win_pct in zip(indices, win_pcts):
+                pop_performance[population[i]] = win_pct
+            return pop_performance
+
+        for i, win_pct in zip(indices, win_pcts):
+            fitness_by_key[keys[i]] = self.fitness_cache.add(keys[i], win_pct, self.games_per_fitness)[0]
+
         for i in range(len(population)):
             # print(population[i])
-            win_pct = self.fitness(population[i])
-            pop_performance[population[i]] = win_pct
+            pop_performance[population[i]] = fitness_by_key[keys[i]]
 
         # return sorted(pop_performance.items(), key=lambda x: x[1], reverse=True)
         return pop_performance
@@ -67,78 +187,104 @@ class GeneticAgent:
         pop_performance = self.compute_fitness(self.population)
         assert(tournament_size < len(pop_performance)), "Invalid Tournament size, must be less than population size"
 
-        mating_pool = []
-        current_member = 0
-        while current_member < mating_pool_size:
-            # print(pop_performance.items())
-            tourney_list = rand.choices(list(pop_performance.items()), k=tournament_size)
-            tourney_list = sorted(tourney_list, key=lambda x: x[1])
-
-            best_member = tourney_list.pop()[0]
+        members = list(pop_performance.keys())
+        fitness = np.array(list(pop_performance.values()))
 
-            if np.random.uniform() < p_value:
-                mating_pool.append(best_member)
-                current_member += 1
+        # Tournaments are run a round at a time: every row of tourneys is one tournament, its best member wins and is
+        # accepted with probability p_value. Rounds repeat until the mating pool is full.
+        winners = []
+        while len(winners) < mating_pool_size:
+            needed = mating_pool_size - len(winners)
+            tourneys = np.random.randint(0, len(members), size=(needed, tournament_size))
+            best_members = tourneys[np.arange(needed), np.argmax(fitness[tourneys], axis=1)]
+            winners.extend(best_members[np.random.uniform(size=needed) < p_value])
 
-        return mating_pool
+        return [members[i] for i in winners]
 
     def mulambda_survival_selector(self, children_pool, population_size):
         assert len(children_pool) > population_size, "Not enough children to fit population specification"
 
-        children_pool = self.compute_fitness(children_pool)
-
-        children_pool = sorted(children_pool.items(), key=lambda x: x[1], reverse=True)
+        pop_performance = self.compute_fitness(children_pool)
+        fitness = np.array([pop_performance[child] for child in children_pool])
 
-        children_pool = [x[0] for x in children_pool]
-        return children_pool[:population_size]
+        survivors = np.argsort(-fitness, kind='stable')[:population_size]
+        return [children_pool[i] for i in survivors]
 
     def recombination(self, mating_pool, population_size, mutation_probability):
-        new_population = []
-
-        for _ in range(population_size):
-            # print(len(mating_pool))
-            parents = random.choices(mating_pool, k=2)
-
-            new_population.append(self.whole_arithmetic_recombination(parents[0], parents[1], 0.7))
+        """
+        Creates population_size children from pairs of random parents of the mating pool. Recombination and mutation
+        run on the whole (population_size, genes) matrix of children at once.
+        """
+        pool = np.stack([member.genome for member in mating_pool])
+        parents = np.random.randint(0, len(pool), size=(population_size, 2))
 
-        # print(new_population)
-        for member in new_population:
-            self.uniform_reset_mutator(member, mutation_probability)
+        with self.instrumentation.phase('recombination'):
+            children = GeneticAgent.whole_arithmetic_recombination(pool[parents[:, 0]], pool[parents[:, 1]], 0.7)
+        with self.instrumentation.phase('mutation'):
+            GeneticAgent.uniform_reset_mutator(children, mutation_probability)
 
-        return new_population
+        return self.networks_from_genomes(children)
 
     @staticmethod
-    def uniform_reset_mutator(net, mutation_probability):
+    def uniform_reset_mutator(genomes, mutation_probability):
+        """
+        Resets every gene, with probability mutation_probability, to a uniform value in [0, 1). Works in place on a
+        single genome or a matrix of genomes.
+        """
         # Note: currently uses np.random.uniform(). Remember to later change this scheme
         # to the same random used in NeuralNetwork.py
-        weights = net.weights
-        for layer in weights:
-            for x in np.nditer(layer, op_flags=['readwrite']):
-                if np.random.uniform() < mutation_probability:
-                    x[...] = np.random.uniform()
+        mutations = np.random.uniform(size=genomes.shape) < mutation_probability
+        genomes[mutations] = np.random.uniform(size=np.count_nonzero(mutations))
 
-    def nonuniform_creep_mutator(self):
-        return
+    @staticmethod
+    def nonuniform_creep_mutator(genomes, mutation_probability, sigma=0.05):
+        """
+        Adds normally distributed noise with standard deviation sigma to every gene with probability
+        mutation_probability. Works in place on a single genome or a matrix of genomes.
+        """
+        mutations = np.random.uniform(size=genomes.shape) < mutation_probability
+        genomes[mutations] += np.random.normal(0.0, sigma, size=np.count_nonzero(mutations))
 
-    def whole_arithmetic_recombination(self, parent1, parent2, a):
-        weights1 = parent1.weights
-        weights2 = parent2.weights
-        child = NeuralNetwork(self.net_size)
-        for layer_index in range(len(weights1)):
-            layer1 = weights1[layer_index]
-            layer2 = weights2[layer_index]
-            child_layer = child.weights[layer_index]
-            # print(layer1.shape)
-            for row_index in range(layer1.shape[1]):
-                for column_index in range(layer2.shape[0]):
-                    x = layer1[column_index, row_index]
-                    y = layer2[column_index, row_index]
-
-                    child_layer[column_index, row_index] = x * a + (1 - a) * y
-
-        return child
-    def blend_recombination(self, parent1, parent2):
-        return
+    @staticmethod
+    def whole_arithmetic_recombination(genomes1, genomes2, a):
+        """
+        :return: a * genomes1 + (1 - a) * genomes2, for a pair of genomes or two matrices of paired genomes
+        """
+        return genomes1 * a + (1 - a) * genomes2
+
+    @staticmethod
+    def blend_recombination(genomes1, genomes2, alpha=0.5):
+        """
+        Blend crossover (BLX-alpha): every child gene is drawn uniformly from the range spanned by the two parent
+        genes, widened by alpha times its length on either side.
+        """
+        low = np.minimum(genomes1, genomes2)
+        high = np.maximum(genomes1, genomes2)
+        spread = alpha * (high - low)
+        return np.random.uniform(low - spread, high + spread)
+
+    def networks_from_genomes(self, genomes):
+        """
+        :return: one NeuralNetwork per row of genomes, using the row as its weights without copying
+        """
+        return [NeuralNetwork(self.net_size, genome=genome) for genome in genomes]
+
+    def set_population(self, population):
+        """
+        Makes population the current population, gathering its genomes into a new population matrix.
+        """
+        self.genomes = np.stack([member.genome for member in population])
+        self.population = self.networks_from_genomes(self.genomes)
+
+    @staticmethod
+    def random_genomes(population_size, net_size):
+        """
+        :return: (population_size, genes) matrix of genomes, each layer drawn like the weights of a new NeuralNetwork
+        """
+        genomes = np.empty((population_size, NeuralNetwork.genome_size(net_size)))
+        for layer, views in zip(net_size, NeuralNetwork.genome_views(net_size, genomes)):
+            views[...] = np.random.normal(0.0, pow(layer, -0.5), views.shape)
+        return genomes
 
     def test_fitness(self):
         pop_performance = self.compute_fitness(self.population)
@@ -147,23 +293,113 @@ class GeneticAgent:
 
         return sorted_by_performance[:5]
 
-    def run(self, num_generations):
+    def run(self, num_generations, checkpoint=None, checkpoint_interval=1):
+        """
+        Runs num_generations generations.
+
+        :param checkpoint: optional path the run is saved to with save_checkpoint
+        :param checkpoint_interval: generations between checkpoints, at least 1
+        """
+        if checkpoint_interval < 1:
+            raise Exception('Checkpoint interval has incorrect value. The interval was {}, but should be at least 1.'
+                            .format(checkpoint_interval))
 
+        # Closes the interval of the work done before the run, e.g. a test_fitness call, so the first generation's
+        # record only holds the generation
+        self.instrumentation.log('run_start', generation=self.generation)
         for _ in range(num_generations):
             print(_)
-            mating_pool = self.tournament_generation_parent_selector(3, 30, 0.5)
+            with self.instrumentation.profile(self.generation):
+                with self.instrumentation.phase('selection'):
+                    mating_pool = self.tournament_generation_parent_selector(3, 30, 0.5)
+
+                children_pool = self.recombination(mating_pool, len(self.population) * 2, 0.05)
 
-            children_pool = self.recombination(mating_pool, len(self.population) * 2, 0.05)
+                # print(len(children_pool))
 
-            # print(len(children_pool))
+                with self.instrumentation.phase('selection'):
+                    self.set_population(self.mulambda_survival_selector(children_pool, len(self.population)))
 
-            self.population = self.mulambda_survival_selector(children_pool, len(self.population))
+            self.instrumentation.log('generation', generation=self.generation)
+            self.generation += 1
+            if self.league is not None and self.league_interval and self.generation % self.league_interval == 0:
+                self.add_best_to_league()
 
+            if checkpoint is not None and self.generation % checkpoint_interval == 0:
+                self.save_checkpoint(checkpoint)
+
+    def save_checkpoint(self, path):
+        """
+        Saves the run to a Checkpoint population file: the genome matrix, the settings, the generation, the fitness
+        cache and the states of random and np.random, so resume continues the run where it stopped.
+        """
+        state = {
+            'population_size': len(self.population),
+            'net_size': list(self.net_size),
+            'seed': self.seed,
+            'games_per_fitness': self.games_per_fitness,
+            'fitness_cache_size': self.fitness_cache.max_entries if self.fitness_cache is not None else 0,
+            'max_fitness_games': self.max_fitness_games,
+            'batched_fitness': self.batched_fitness,
+            'fitness_dtype': None if self.fitness_dtype is None else np.dtype(self.fitness_dtype).name,
+            'league_opponents': self.league_opponents,
+            'league_interval': self.league_interval,
+            'generation': self.generation,
+            'fitness_cache': self.fitness_cache.state() if self.fitness_cache is not None else [],
+            'random_state': random.getstate(),
+            'np_random_state': list(np.random.get_state()),
+        }
+        state['np_random_state'][1] = state['np_random_state'][1].tolist()
+        Checkpoint.save_population(path, self.genomes, self.net_size, genetic_agent=state)
 
-# Note, the list first and last elements in the net_size list must remain the same in order for the algorithm to work
-ga = GeneticAgent(100, [15, 100, 6])
-print(ga.test_fitness())
+    @staticmethod
+    def resume(path, workers=1, league=None, fitness_dtype=None, instrumentation=None):
+        """
+        Continues a run saved by save_checkpoint. With the same workers and league settings, and no league, running
+        on from the checkpoint gives the same populations as the run which was saved would have.
+
+        :param workers: number of fitness processes, which may differ from the saved run's
+        :param league: League to measure fitness against, if the saved run used one
+        :param fitness_dtype: precision of the batched fitness games, the saved run's by default
+        :param instrumentation: optional Instrumentation of the continued run
+        :return: GeneticAgent in the saved state
+        """
+        genomes, header = Checkpoint.load_population(path, mmap_mode=None)
+        state = header['genetic_agent']
+
+        ga = GeneticAgent(state['population_size'], state['net_size'], workers=workers,
+                          games_per_fitness=state['games_per_fitness'], fitness_cache_size=state['fitness_cache_size'],
+                          max_fitness_games=state['max_fitness_games'], batched_fitness=state['batched_fitness'],
+                          fitness_dtype=fitness_dtype if fitness_dtype is not None else state['fitness_dtype'],
+                          league=league, league_opponents=state['league_opponents'],
+                          league_interval=state['league_interval'], instrumentation=instrumentation)
+        ga.seed = state['seed']
+        ga.generation = state['generation']
+        ga.genomes = genomes.astype(np.float64)
+        ga.population = ga.networks_from_genomes(ga.genomes)
+        if ga.fitness_cache is not None:
+            ga.fitness_cache.load_state(state['fitness_cache'])
+
+        # Restored last, creating the agent above drew a random population from np.random
+        version, internal_state, gauss = state['random_state']
+        random.setstate((version, tuple(internal_state), gauss))
+        name, keys, position, has_gauss, cached_gaussian = state['np_random_state']
+        np.random.set_state((name, np.array(keys, dtype=np.uint32), position, has_gauss, cached_gaussian))
+        return ga
+
+    def add_best_to_league(self):
+        """
+        Freezes the fittest network of the current population into the league.
 
-ga.run(10)
+        :return: the name of the new member
+        """
+        best = self.test_fitness()[0][0]
+        return self.league.add(best, 'ga-{}-generation-{}'.format(len(self.league), self.generation))
 
-print(ga.test_fitness())
+    def close(self):
+        """
+        Shuts down the fitness worker pool, if there is one.
+        """
+        if self.parallel_fitness is not None:
+            self.parallel_fitness.close()
+            self.parallel_fitness = None
@@ -0,0 +1,220 @@
+"""
+Opt-in timing of the phases of training and evolution runs.
+
+Code marks its phases with
+
+    with instrumentation.phase('fitness'):
+        ...
+
+and counts its work with instrumentation.count('games', n). Phases nest: a phase's seconds include the phases inside
+it, its self seconds do not, so the game loop's self time is the board simulation left once the agents' time is taken
+out. Every log writes the phase times, call counts and counters since the previous log as one JSON line, with the
+counters also as rates per second.
+
+Code which is not instrumented gets NO_INSTRUMENTATION, whose phase hands out one shared context manager doing
+nothing, so the disabled cost is a method call per phase. Per move phases are only timed by wrapping the agents
+(Instrumentation.agent), which a disabled run does not do at all.
+"""
+import cProfile
+import json
+import time
+
+
+class Instrumentation:
+
+    def __init__(self, path=None, interval=10.0, profile_path=None, profile_step=0):
+        """
+        :param path: file the JSON lines are appended to, stdout by default
+        :param interval: seconds between the logs of tick
+        :param profile_path: file a cProfile dump is written to (pstats format, e.g. for snakeviz or flameprof)
+        :param profile_step: step profiled by profile: the generation of a GeneticAgent run, 0 for a training session
+        """
+        self.path = path
+        self.interval = interval
+        self.profile_path = profile_path
+        self.profile_step = profile_step
+
+        self.start = time.perf_counter()
+        self.last_log = self.start
+        self.phases = {}
+        self.counters = {}
+        self.stack = []
+
+    def phase(self, name):
+        """
+        :return: context manager adding the time spent inside it to the phase name
+        """
+        return Phase(self, name)
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def iterate(self, name, iterable):
+        """
+        Times every step of an iterable as the phase name, e.g. the games of MatchRunner.play.
+        """
+        iterator = iter(iterable)
+        while True:
+            with Phase(self, name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def agent(self, agent, name):
+        """
+        :return: agent whose moves are timed as the phase name
+        """
+        return InstrumentedAgent(agent, self, name)
+
+    def tick(self, **fields):
+        """
+        Logs if interval seconds have passed since the last log.
+        """
+        if time.perf_counter() - self.last_log >= self.interval:
+            self.log(**fields)
+
+    def log(self, event='progress', **fields):
+        """
+        Writes the phases and counters since the last log as a JSON line, and starts a new interval.
+
+        :param fields: additional entries of the line, e.g. the generation
+        """
+        now = time.perf_counter()
+        seconds = now - self.last_log
+        record = dict(fields, event=event, time=time.time(), elapsed=now - self.start, seconds=seconds)
+        record['phases'] = {name: {'seconds': stats[0], 'self_seconds': stats[1], 'calls': stats[2]}
+                            for name, stats in self.phases.items()}
+        record['counters'] = dict(self.counters)
+        record['rates'] = {name + '_per_sec': value / seconds if seconds > 0 else 0.0
+                           for name, value in self.counters.items()}
+
+        line = json.dumps(record)
+        if self.path is None:
+            print(line)
+        else:
+            with open(self.path, 'a') as file:
+                file.write(line + '\n')
+
+        self.phases = {}
+        self.counters = {}
+        self.last_log = now
+        return record
+
+    def profile(self, step):
+        """
+        :return: context manager running cProfile inside it and dumping to profile_path if step is profile_step
+        """
+        if self.profile_path is None or step != self.profile_step:
+            return NO_PHASE
+        return Profile(self.profile_path)
+
+
+class Phase:
+
+    __slots__ = ('instrumentation', 'name', 'start', 'children')
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.children = 0.0
+        self.instrumentation.stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        instrumentation = self.instrumentation
+        instrumentation.stack.pop()
+        if instrumentation.stack:
+            instrumentation.stack[-1].children += elapsed
+
+        stats = instrumentation.phases.get(self.name)
+        if stats is None:
+            stats = instrumentation.phases[self.name] = [0.0, 0.0, 0]
+        stats[0] += elapsed
+        stats[1] += elapsed - self.children
+        stats[2] += 1
+        return False
+
+
+class Profile:
+
+    def __init__(self, path):
+        self.path = path
+        self.profiler = cProfile.Profile()
+
+    def __enter__(self):
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        self.profiler.dump_stats(self.path)
+        return False
+
+
+class InstrumentedAgent:
+
+    """
+    MatchRunner agent timing the moves of another agent. It only offers choose_one if the agent does.
+    """
+
+    def __init__(self, agent, instrumentation, name):
+        self.agent = agent
+        self.instrumentation = instrumentation
+        self.name = name
+        if hasattr(agent, 'choose_one'):
+            self.choose_one = self.timed_choose_one
+
+    def choose(self, inputs, legal, games):
+        with Phase(self.instrumentation, self.name):
+            return self.agent.choose(inputs, legal, games)
+
+    def timed_choose_one(self, input_list, legal):
+        with Phase(self.instrumentation, self.name):
+            return self.agent.choose_one(input_list, legal)
+
+
+class NoPhase:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NoInstrumentation:
+
+    """
+    Instrumentation which records nothing, the default everywhere.
+    """
+
+    def phase(self, name):
+        return NO_PHASE
+
+    def count(self, name, amount=1):
+        pass
+
+    def iterate(self, name, iterable):
+        return iterable
+
+    def agent(self, agent, name):
+        return agent
+
+    def tick(self, **fields):
+        pass
+
+    def log(self, event='progress', **fields):
+        return None
+
+    def profile(self, step):
+        return NO_PHASE
+
+
+NO_PHASE = NoPhase()
+NO_INSTRUMENTATION = NoInstrumentation()
@@ -0,0 +1,243 @@
+from NeuralNetwork import *
+from PopulationNetwork import *
+from MatchRunner import *
+from collections import OrderedDict
+import Checkpoint
+import json
+import os
+import numpy as np
+
+
+class League:
+
+    """
+    Pool of frozen opponents, kept on disk as weight snapshots in one directory.
+
+    Every member is a float32 Checkpoint file, listed with its layer sizes and its record in league.json. Members are
+    only loaded when they play, memory mapped into a small least recently used cache of NeuralNetworks, so processes
+    evaluating against the same league share the pages of its files.
+
+    Members carry an Elo rating and their record against the challengers evaluated against them, so opponents can be
+    sampled by rating (opponents a challenger has an even chance against tell the most about it) or by win rate (the
+    members beating challengers most often are the ones left to learn from). A challenger is evaluated against
+    several members at once: every member with the same layer sizes plays in one PopulationNetwork, so all games run
+    in lockstep on one MatchRunner.
+    """
+
+    INDEX = 'league.json'
+
+    def __init__(self, directory, cache_size=8, initial_rating=1000.0, k_factor=16.0):
+        """
+        :param directory: directory of the league, created if needed; an existing league in it is opened
+        :param cache_size: number of members kept loaded
+        :param initial_rating: Elo rating of new members
+        :param k_factor: largest Elo change of a member per evaluation against it
+        """
+        self.directory = directory
+        self.cache_size = cache_size
+        self.initial_rating = initial_rating
+        self.k_factor = k_factor
+        self.cache = OrderedDict()
+        # Bumped on every change to the members, so cached results against the league can be recognized as stale
+        self.version = 0
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, League.INDEX)
+        if os.path.exists(path):
+            with open(path) as index:
+                self.members = json.load(index)['members']
+        else:
+            self.members = []
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, name):
+        return self.member(name) is not None
+
+    def names(self):
+        return [member['name'] for member in self.members]
+
+    def member(self, name):
+        """
+        :return: the index entry of a member (name, file, layers, rating, games, wins), or None
+        """
+        for member in self.members:
+            if member['name'] == name:
+                return member
+        return None
+
+    def add(self, nn, name=None, rating=None):
+        """
+        Freezes a copy of the network's weights into the league.
+
+        :param name: unique name of the member, generated by default
+        :param rating: starting Elo rating, initial_rating by default
+        :return: the name of the member
+        """
+        if name is None:
+            name = 'member-{}'.format(len(self.members))
+        if name in self:
+            raise Exception('League member {} already exists.'.format(name))
+
+        file = name + '.ckpt'
+        Checkpoint.save_network(os.path.join(self.directory, file), nn, dtype=np.float32)
+        self.members.append({'name': name, 'file': file, 'layers': list(nn.layers),
+                             'rating': self.initial_rating if rating is None else rating, 'games': 0, 'wins': 0})
+        self.version += 1
+        self.save()
+        return name
+
+    def load(self, name):
+        """
+        :return: the member as a NeuralNetwork, from the cache if it is loaded
+        """
+        nn = self.cache.get(name)
+        if nn is not None:
+            self.cache.move_to_end(name)
+            return nn
+
+        member = self.member(name)
+        if member is None:
+            raise Exception('League member {} does not exist.'.format(name))
+
+        nn = Checkpoint.load_network(os.path.join(self.directory, member['file']))
+        self.cache[name] = nn
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return nn
+
+    def sample(self, count, by='elo', rating=None, rng=None):
+        """
+        Picks count distinct members (every member if there are fewer).
+
+        :param by: 'elo' favours members a player of the given rating has an even chance against, 'win_rate' favours
+        members with the best record against challengers, 'uniform' picks any member
+        :param rating: rating of the challenger for 'elo', the average rating of the league by default
+        :param rng: optional np.random.RandomState or Generator; the global np.random state is used by default
+        :return: list of member names
+        """
+        if not self.members:
+            return []
+        count = min(count, len(self.members))
+        ratings = np.array([member['rating'] for member in self.members])
+
+        if by == 'elo':
+            if rating is None:
+                rating = ratings.mean()
+            expected = expected_score(rating, ratings)
+            # The variance of a game's result, largest for an even match
+            weights = expected * (1.0 - expected)
+        elif by == 'win_rate':
+            # Smoothed so members which have not played yet still get picked
+            wins = np.array([member['wins'] for member in self.members], dtype=float)
+            games = np.array([member['games'] for member in self.members], dtype=float)
+            weights = ((wins + 1.0) / (games + 2.0)) ** 2
+        elif by == 'uniform':
+            weights = np.ones(len(self.members))
+        else:
+            raise Exception('Unknown sampling {}, must be elo, win_rate or uniform.'.format(by))
+
+        rng = rng if rng is not None else np.random
+        picks = rng.choice(len(self.members), size=count, replace=False, p=weights / weights.sum())
+        return [self.members[i]['name'] for i in picks]
+
+    def evaluate(self, nn, games_per_opponent=20, opponents=None, update=False, random_opening=2):
+        """
+        Plays nn against every opponent, games_per_opponent games each, nn taking player 0 in even games and player 1
+        in odd games. All games against opponents with the same layer sizes run at once.
+
+        Networks always play their best pit, so every game starts with random_opening random moves, otherwise all
+        games with the same sides would be the same game.
+
+        :param opponents: member names, every member by default
+        :param update: record the results in the league: the members' records, and their Elo ratings against the
+        performance rating of nn
+        :return: dict mapping every opponent to the share of games nn won against it
+        """
+        if opponents is None:
+            opponents = self.names()
+
+        groups = OrderedDict()
+        for name in opponents:
+            groups.setdefault(tuple(self.member(name)['layers']), []).append(name)
+
+        results = {}
+        for layers, names in groups.items():
+            population_net = PopulationNetwork(list(layers), np.stack([self.load(name).genome for name in names]))
+            runner = MatchRunner(NetworkAgent(nn), PopulationAgent(population_net, games_per_opponent),
+                                 random_opening=random_opening)
+
+            wins = np.zeros(len(names))
+            total = len(names) * games_per_opponent
+            for result in runner.play(total, parallel=total):
+                if result.winner == result.agent_player:
+                    wins[result.game // games_per_opponent] += 1
+            for name, won in zip(names, wins):
+                results[name] = float(won) / games_per_opponent
+
+        if update and results:
+            self.record(results, games_per_opponent)
+        return results
+
+    def win_rate(self, nn, num_games, max_opponents=4, by='elo', rng=None):
+        """
+        Share of num_games nn wins against up to max_opponents sampled members, e.g. as a fitness which does not
+        saturate like the win rate against the random agent.
+        """
+        opponents = self.sample(max_opponents, by, rng=rng)
+        if not opponents:
+            raise Exception('The league has no members to play against.')
+        games_per_opponent = max(1, -(-num_games // len(opponents)))
+        results = self.evaluate(nn, games_per_opponent, opponents)
+        return sum(results.values()) / len(results)
+
+    def performance_rating(self, results):
+        """
+        :param results: dict mapping members to the share of games a player won against them, as evaluate returns
+        :return: the Elo rating at which the player's expected score against these members equals its actual score
+        """
+        ratings = np.array([self.member(name)['rating'] for name in results])
+        score = sum(results.values())
+
+        # The expected score grows with the rating, so bisect within 800 points of the opponents (a 99% win rate
+        # already sits at about 800 points above them)
+        low = ratings.min() - 800.0
+        high = ratings.max() + 800.0
+        for _ in range(50):
+            middle = (low + high) / 2
+            if expected_score(middle, ratings).sum() < score:
+                low = middle
+            else:
+                high = middle
+        return float(low + high) / 2
+
+    def record(self, results, games_per_opponent):
+        """
+        Records a challenger's results against members, updating their records and Elo ratings.
+        """
+        rating = self.performance_rating(results)
+        for name, win_pct in results.items():
+            member = self.member(name)
+            member_score = 1.0 - win_pct
+            member['rating'] += float(self.k_factor * (member_score - expected_score(member['rating'], rating)))
+            member['games'] += games_per_opponent
+            member['wins'] += int(round(member_score * games_per_opponent))
+        self.version += 1
+        self.save()
+
+    def save(self):
+        """
+        Writes the index, through a temporary file so an interrupted write never leaves a broken index behind.
+        """
+        path = os.path.join(self.directory, League.INDEX)
+        with open(path + '.tmp', 'w') as index:
+            json.dump({'members': self.members}, index, indent=1)
+        os.replace(path + '.tmp', path)
+
+
+def expected_score(rating, opponent_rating):
+    """
+    :return: expected share of points of a player against an opponent, by the Elo formula. Works on arrays.
+    """
+    return 1.0 / (1.0 + 10.0 ** ((np.asarray(opponent_rating) - rating) / 400.0))
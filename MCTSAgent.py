@@ -0,0 +1,267 @@
+from GameBoard import *
+import numpy as np
+import math
+import time
+
+
+class MCTSNode:
+
+    """
+    Node of the MCTS tree. A node is created with only its prior, and its board is filled in the first time the
+    search walks into it.
+
+    value_sum is stored from the point of view of the player who moved into the node (the parent's player), so
+    the parent can read Q = value_sum / visits directly when selecting.
+    """
+
+    __slots__ = ('board', 'player', 'prior', 'visits', 'value_sum', 'children', 'terminal_value')
+
+    def __init__(self, prior, board=None, player=None):
+        self.board = board
+        self.player = player
+        self.prior = prior
+        self.visits = 0
+        self.value_sum = 0.0
+        # pit -> MCTSNode, empty until the node is expanded
+        self.children = {}
+        self.terminal_value = None
+
+
+class MCTSAgent:
+
+    """
+    Monte Carlo Tree Search player guided by a NeuralNetwork.
+
+    The network's outputs for the legal pits, normalized to sum to 1, are the policy prior. The value of a leaf comes
+    from an optional value network with a single output, mapped from (0, 1) to (-1, 1). Without one, a tanh of the
+    store difference is used. Finished games are valued exactly: 1 for a win, -1 for a loss and 0 for a draw.
+
+    Leaves are collected with virtual loss and evaluated batch_size at a time in one forward pass. The tree under the
+    position reached after each move is kept for the next move.
+    """
+
+    def __init__(self, policy_net, value_net=None, simulations=400, time_limit=None, batch_size=16, c_puct=1.5,
+                 value_scale=8.0, reuse_depth=4):
+        """
+        :param policy_net: NeuralNetwork with the usual 15 inputs and 6 outputs, used as the prior
+        :param value_net: optional NeuralNetwork with 15 inputs and 1 output, the value for the player to move
+        :param simulations: simulations per move, ignored if time_limit is given
+        :param time_limit: optional wall clock budget per move, in seconds
+        :param batch_size: number of leaves evaluated per forward pass
+        :param c_puct: exploration constant of the PUCT formula
+        :param value_scale: store difference that maps to tanh(1) when no value network is given
+        :param reuse_depth: how many plies below the previous root to look for the current position
+        """
+        self.policy_net = policy_net
+        self.value_net = value_net
+        self.simulations = simulations
+        self.time_limit = time_limit
+        self.batch_size = batch_size
+        self.c_puct = c_puct
+        self.value_scale = value_scale
+        self.reuse_depth = reuse_depth
+
+        self.root = None
+        # Statistics of the last search
+        self.simulations_run = 0
+        self.evaluations = 0
+        self.elapsed = 0.0
+
+    def query(self, input_list):
+        """
+        :param input_list: the 14 board entries followed by the player to move, as given to NeuralNetwork.query
+        :return: (6, 1) array with the share of root visits of every pit. Empty pits score -inf.
+        """
+        if len(input_list) != 15:
+            raise Exception('Input has incorrect size. The size of input was {}, but should be {}.'
+                            .format(len(input_list), 15))
+
+        root = self.search(GameBoard([int(x) for x in input_list[:14]]), int(input_list[14]))
+
+        scores = np.full((6, 1), -np.inf)
+        total = max(sum(child.visits for child in root.children.values()), 1)
+        for pit, child in root.children.items():
+            scores[pit - 1, 0] = child.visits / total
+        return scores
+
+    def choose_move(self, board, player):
+        """
+        :param board: a GameBoard
+        :return: the most visited pit (1 - 6), or None if the game is over
+        """
+        root = self.search(board, player)
+        if not root.children:
+            return None
+        return max(root.children.items(), key=lambda x: x[1].visits)[0]
+
+    def reset(self):
+        """
+        Drops the kept tree, e.g. between games.
+        """
+        self.root = None
+
+    def search(self, board, player):
+        start = time.perf_counter()
+        deadline = start + self.time_limit if self.time_limit is not None else None
+
+        root = self.find_root(board, player)
+        self.root = root
+        self.simulations_run = 0
+        self.evaluations = 0
+
+        if root.visits == 0 and not self.is_terminal(root):
+            self.evaluate_leaves([[root]])
+
+        while self.is_budget_left(deadline) and root.terminal_value is None:
+            pending = []
+            pending_nodes = set()
+
+            while len(pending) < self.batch_size and self.is_budget_left(deadline):
+                path = self.select(root)
+                leaf = path[-1]
+                self.simulations_run += 1
+
+                if self.is_terminal(leaf):
+                    MCTSAgent.backup(path, leaf.terminal_value)
+                    continue
+
+                if id(leaf) in pending_nodes:
+                    # Already waiting for its evaluation, so stop filling this batch
+                    self.simulations_run -= 1
+                    break
+
+                MCTSAgent.apply_virtual_loss(path, 1)
+                pending.append(path)
+                pending_nodes.add(id(leaf))
+
+            if pending:
+                for path in pending:
+                    MCTSAgent.apply_virtual_loss(path, -1)
+                self.evaluate_leaves(pending)
+
+        self.elapsed = time.perf_counter() - start
+        return root
+
+    def is_budget_left(self, deadline):
+        if deadline is not None:
+            return time.perf_counter() < deadline
+        return self.simulations_run < self.simulations
+
+    def find_root(self, board, player):
+        """
+        Looks for the position in the tree kept from the previous move, so its statistics are reused.
+        """
+        if self.root is not None:
+            level = [self.root]
+            for _ in range(self.reuse_depth + 1):
+                next_level = []
+                for node in level:
+                    if node.board is None:
+                        continue
+                    if node.player == player and node.board.hash == board.hash and node.board.board == board.board:
+                        return node
+                    next_level.extend(node.children.values())
+                level = next_level
+
+        return MCTSNode(1.0, board.copy(), player)
+
+    def select(self, root):
+        """
+        Walks down the tree with the PUCT rule until reaching a node that is not expanded yet.
+
+        :return: list of nodes from the root to the leaf
+        """
+        path = [root]
+        node = root
+
+        while node.children and node.terminal_value is None:
+            sqrt_visits = math.sqrt(node.visits)
+            best_score = -math.inf
+            best_child = None
+            for child in node.children.values():
+                q = child.value_sum / child.visits if child.visits else 0.0
+                score = q + self.c_puct * child.prior * sqrt_visits / (1 + child.visits)
+                if score > best_score:
+                    best_score = score
+                    best_child = child
+
+            if best_child.board is None:
+                pit = next(p for p, c in node.children.items() if c is best_child)
+                best_child.board = node.board.copy()
+                next_player = best_child.board.move_marbles(node.player, pit)
+                best_child.player = next_player
+
+            node = best_child
+            path.append(node)
+
+        return path
+
+    def is_terminal(self, node):
+        """
+        Checks (and caches) whether the node's game is over, setting terminal_value for the node's player.
+        """
+        if node.terminal_value is None and node.board.check_end_condition():
+            rows = node.board.get_sum_rows()
+            b = node.board.board
+            diff = b[0] + rows[0] - b[13] - rows[1]
+            if node.player == 1:
+                diff = -diff
+            node.terminal_value = float(np.sign(diff))
+        return node.terminal_value is not None
+
+    def evaluate_leaves(self, paths):
+        """
+        Evaluates the leaves of all paths with one forward pass per network, expands them and backs the values up.
+        """
+        leaves = [path[-1] for path in paths]
+        inputs = np.array([leaf.board.board + [leaf.player] for leaf in leaves], dtype=float)
+        self.evaluations += len(leaves)
+
+        # query_batch returns a buffer the next query overwrites, and the value net may be the policy net itself
+        priors = self.policy_net.query_batch(inputs).copy()
+        if self.value_net is not None:
+            values = self.value_net.query_batch(inputs)[:, 0] * 2.0 - 1.0
+        else:
+            values = None
+
+        for i, (path, leaf) in enumerate(zip(paths, leaves)):
+            b = leaf.board.board
+            legal = leaf.board.legal_pits(leaf.player)
+
+            total = sum(priors[i, pit - 1] for pit in legal)
+            for pit in legal:
+                prior = priors[i, pit - 1] / total if total > 0 else 1.0 / len(legal)
+                leaf.children[pit] = MCTSNode(prior)
+
+            if values is not None:
+                value = float(values[i])
+            else:
+                diff = b[0] - b[13] if leaf.player == 0 else b[13] - b[0]
+                value = math.tanh(diff / self.value_scale)
+
+            MCTSAgent.backup(path, value)
+
+    @staticmethod
+    def apply_virtual_loss(path, amount):
+        """
+        Adds (amount = 1) or removes (amount = -1) a pending visit that counts as a loss on every node of the path,
+        so leaves collected for the same batch spread over the tree.
+        """
+        for node in path[1:]:
+            node.visits += amount
+            node.value_sum -= amount
+
+    @staticmethod
+    def backup(path, value):
+        """
+        :param value: value of the leaf for the leaf's player to move
+        """
+        for i in range(len(path) - 1, 0, -1):
+            node = path[i]
+            parent = path[i - 1]
+            # Convert to the point of view of the parent's player, who chose this node
+            if parent.player != node.player:
+                value = -value
+            node.visits += 1
+            node.value_sum += value
+        path[0].visits += 1
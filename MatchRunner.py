@@ -0,0 +1,183 @@
+from GameBoard import *
+from BatchGameBoard import *
+from Agents import *
+from collections import namedtuple
+import numpy as np
+
+
+# Result of one finished game.
+# game: index of the game, in the order games were started
+# agent_player: player id (0 or 1) the first agent played as; the second agent played the other side
+# winner: player id of the winner, ties go to player 0 like everywhere else in Game
+# score: [player 0, player 1] final scores, store plus the marbles left in the row
+# turns: number of moves played
+# board: the final board, a list of 14 marble counts (variant.size for other BoardVariants)
+# history: list of (player, input, pit, outputs, store_gain) per move if the runner records, None otherwise, where
+# input is the 15 (variant.input_size) entry list the mover was queried with, outputs the mover's scores (or None)
+# and store_gain the number of marbles the move added to the mover's store
+MatchResult = namedtuple('MatchResult', ['game', 'agent_player', 'winner', 'score', 'turns', 'board', 'history'])
+
+
+class MatchRunner:
+
+    """
+    Plays games between two agents (see Agents) on a BatchGameBoard, many games at once.
+
+    Every step asks each agent for a move in all games where it is to move, with the illegal (empty) pits masked out,
+    then applies all moves with one BatchGameBoard.move_marbles. Finished games are streamed out of play as
+    MatchResults and their slots are refilled with new games until num_games have been played.
+
+    Games of other BoardVariants give the agents inputs of variant.input_size columns and legal arrays of
+    variant.pits columns.
+    """
+
+    def __init__(self, agent0, agent1, alternate=True, random_opening=0, variant=None):
+        """
+        :param agent0: first agent, anything accepted by Agents.as_agent
+        :param agent1: second agent
+        :param alternate: if True the first agent plays player 0 in even games and player 1 in odd games, like the
+        Game loops always did; otherwise it is always player 0
+        :param random_opening: number of moves at the start of every game played by a RandomAgent instead of the
+        agents. Two deterministic agents always play the same game, so a few random moves make every game differ.
+        :param variant: BoardVariant of the games, the standard game by default
+        """
+        self.agents = [as_agent(agent0), as_agent(agent1), RandomAgent()]
+        self.alternate = alternate
+        self.random_opening = random_opening
+        self.variant = variant if variant is not None else BoardVariant.STANDARD
+
+    def play(self, num_games, parallel=1, record=False):
+        """
+        Generator playing num_games games, parallel of them at the same time.
+
+        :param num_games: number of games to play
+        :param parallel: number of games in flight at once
+        :param record: if True every MatchResult carries the move history of its game
+        :return: yields a MatchResult per game as soon as it finishes
+        """
+        if num_games <= 0:
+            return
+
+        slots = max(1, min(parallel, num_games))
+        if slots == 1 and all(hasattr(agent, 'choose_one') for agent in self.agents):
+            for game in range(num_games):
+                yield self.play_one(game, record)
+            return
+
+        size = self.variant.size
+        boards = BatchGameBoard(slots, variant=self.variant)
+        slot_game = np.arange(slots)
+        agent_player = (slot_game % 2) if self.alternate else np.zeros(slots, dtype=np.intp)
+        player = np.zeros(slots, dtype=np.intp)
+        active = np.ones(slots, dtype=bool)
+        turns = np.zeros(slots, dtype=np.intp)
+        histories = [[] for _ in range(slots)] if record else None
+        started = slots
+        while active.any():
+            rows = np.nonzero(active)[0]
+            movers = player[rows]
+
+            inputs = np.empty((len(rows), size + 1))
+            inputs[:, :size] = boards.boards[rows]
+            inputs[:, size] = movers
+            legal = boards.legal_moves(movers, rows)
+
+            pits = np.empty(len(rows), dtype=np.intp)
+            outputs = [None] * len(rows) if record else None
+            seat = np.where(movers == agent_player[rows], 0, 1)
+            if self.random_opening:
+                seat[turns[rows] < self.random_opening] = 2
+            for s in (0, 1, 2):
+                selected = np.nonzero(seat == s)[0]
+                if len(selected) == 0:
+                    continue
+                chosen, scores = self.agents[s].choose(inputs[selected], legal[selected], slot_game[rows[selected]])
+                pits[selected] = chosen
+                if record and scores is not None:
+                    for i, row_scores in zip(selected, scores):
+                        outputs[i] = row_scores
+
+            stores = movers * (size - 1)
+            before = boards.boards[rows, stores]
+            player[rows] = boards.move_marbles(movers, pits, rows)
+            turns[rows] += 1
+
+            if record:
+                gains = boards.boards[rows, stores] - before
+                for i, row in enumerate(rows):
+                    histories[row].append((int(movers[i]), inputs[i].tolist(), int(pits[i]), outputs[i],
+                                           int(gains[i])))
+
+            ended = rows[boards.check_end_condition()[rows]]
+            final_scores = boards.get_final_score() if len(ended) else None
+            for row in ended:
+                score = final_scores[row]
+                yield MatchResult(int(slot_game[row]), int(agent_player[row]), int(np.argmax(score)),
+                                  score.tolist(), int(turns[row]), boards.boards[row].tolist(),
+                                  histories[row] if record else None)
+
+                if started < num_games:
+                    # Reuse the slot for the next game
+                    boards.reset_games([row])
+                    slot_game[row] = started
+                    agent_player[row] = started % 2 if self.alternate else 0
+                    player[row] = 0
+                    turns[row] = 0
+                    if record:
+                        histories[row] = []
+                    started += 1
+                else:
+                    active[row] = False
+
+    def play_one(self, game, record=False):
+        """
+        Plays a single game on a GameBoard with the agents' choose_one, which avoids the array overhead of the
+        batched loop when only one game is in flight. The rules and results are the same as in play.
+
+        :param game: index of the game, which decides the sides when alternating
+        :return: MatchResult of the game
+        """
+        agent_player = game % 2 if self.alternate else 0
+        board = VariantGameBoard.create(self.variant)
+        b = board.board
+        player = 0
+        turns = 0
+        history = [] if record else None
+
+        while True:
+            input_list = b + [player]
+
+            if turns < self.random_opening:
+                agent = self.agents[2]
+            else:
+                agent = self.agents[0] if player == agent_player else self.agents[1]
+            pit, outputs = agent.choose_one(input_list, board.legal_moves(player))
+
+            store = -player
+            before = b[store]
+            next_player = board.move_marbles(player, pit)
+            turns += 1
+
+            if record:
+                history.append((player, input_list, pit, outputs, b[store] - before))
+
+            if board.check_end_condition():
+                break
+            player = next_player
+
+        score = board.get_score()
+        final_marbles = board.get_sum_rows()
+        score = [score[i] + final_marbles[i] for i in range(len(score))]
+        winner = max(enumerate(score), key=lambda x: x[1])[0]
+
+        return MatchResult(game, agent_player, winner, score, turns, b[:], history)
+
+    def win_rate(self, num_games, parallel=1):
+        """
+        :return: share of num_games won by the first agent
+        """
+        wins = 0
+        for result in self.play(num_games, parallel):
+            if result.winner == result.agent_player:
+                wins += 1
+        return wins / num_games if num_games > 0 else 0.0
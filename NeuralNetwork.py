@@ -1,5 +1,19 @@
 import numpy as np
-import scipy.special as sp
+
+
+def sigmoid(x, out=None):
+    """
+    Logistic function 1 / (1 + exp(-x)), the activation function of every layer. Computed in place when out is given
+    (out may be x itself), so the batched paths do not allocate.
+
+    Uses the identity sigmoid(x) = 0.5 * tanh(0.5 * x) + 0.5, which cannot overflow for any input, so no clipping or
+    error state handling is needed.
+    """
+    out = np.multiply(x, 0.5, out=out)
+    np.tanh(out, out=out)
+    out *= 0.5
+    out += 0.5
+    return out
 
 
 class NeuralNetwork:
@@ -10,11 +24,22 @@ class NeuralNetwork:
 
     NOTE: This version of Neural Network is tuned to train for Mancala.
     """
-    def __init__(self, layers,  learning_rate=0.5):
+
+    # Bit of every pit in a legal move bitmask of the standard 6 pit board, see masked_scores
+    MOVE_BITS = 1 << np.arange(6)
+
+    def __init__(self, layers,  learning_rate=0.5, genome=None, dtype=None):
         """"
         initializer for neuralNetwork class, requires learning rate and a variable number of layers, which
         which are given by list layers for which the length of the list represents the # of layers
         and each list represents the layer.
+
+        genome is an optional flat array of every weight (see genome_size) which the network uses as its weights
+        without copying, e.g. a row of a GeneticAgent population matrix. A random genome is created by default.
+
+        dtype is the floating point type of the weights and of every buffer, inputs included: np.float64 by default,
+        or the genome's dtype when a genome is given. np.float32 halves the memory traffic of every layer at the cost
+        of precision, see precision_difference.
         """
 
         self.learning_rate = learning_rate
@@ -22,6 +47,9 @@ class NeuralNetwork:
         # Each element in layers refers to the number of weights in said layer.
         # NOTE: cannot be a np array (Those do not support jagged arrays natively
         self.layers = layers
+        if dtype is None:
+            dtype = genome.dtype if genome is not None else np.float64
+        self.dtype = np.dtype(dtype)
 
         # Enumerate(**) creates an enumerated list of (index, val) tuples up to and including the second to
         # last value of the list (last value of layers doesn't matter because it is the output, no weight matrix)
@@ -35,16 +63,65 @@ class NeuralNetwork:
         # list of np matrices which contain weights, as described above
         # weights are determined randomly along a normal distribution around 0 w/ std dev
         # 1/sqrt(len_column)
-        self.weights = [np.random.normal(0.0, pow(l[0], -0.5), (l[1], l[0])) for l in layer_next]
+        # All weight matrices are views into one contiguous genome vector, layer after layer
+        if genome is None:
+            genome = np.empty(NeuralNetwork.genome_size(self.layers), dtype=self.dtype)
+            offset = 0
+            for l in layer_next:
+                genome[offset: offset + l[0] * l[1]] = np.random.normal(0.0, pow(l[0], -0.5), (l[1], l[0])).ravel()
+                offset += l[0] * l[1]
+        self.set_genome(genome)
+
+        # Preallocated buffers reused across calls. Activation, error and input buffers depend on the batch size and
+        # are kept per size; gradient buffers only depend on the weight shapes.
+        self.batch_buffers = {}
+        self.input_buffers = {}
+        self.gradient_buffers = None
+        self.single_input = np.empty((1, self.layers[0]), dtype=self.dtype)
+
+    def set_genome(self, genome):
+        """
+        Makes the network use genome (a flat array of genome_size(layers) weights) as its weights, without copying.
+        """
+        if genome.shape != (NeuralNetwork.genome_size(self.layers),):
+            raise Exception('Genome has incorrect shape. The shape of the genome was {}, but should be ({},).'
+                            .format(genome.shape, NeuralNetwork.genome_size(self.layers)))
+        if genome.dtype != self.dtype:
+            raise Exception('Genome has incorrect dtype. The dtype of the genome was {}, but should be {}.'
+                            .format(genome.dtype, self.dtype))
+
+        self.genome = genome
+        self.weights = NeuralNetwork.genome_views(self.layers, genome)
+
+    @staticmethod
+    def genome_size(layers):
+        """
+        :return: number of weights of a network with the given layer sizes
+        """
+        return sum(layers[i] * layers[i + 1] for i in range(len(layers) - 1))
+
+    @staticmethod
+    def genome_views(layers, genome):
+        """
+        Splits genome into the weight matrices of a network with the given layer sizes. The last axis of genome holds
+        the weights, so a (population, genes) matrix gives (population, next layer, layer) views of every network.
 
-        # sets the activation function
-        # primarily for testing purposes(we can change this later)
-        self.activation_function = lambda x: sp.expit(x)
+        :return: list of views, one per weight layer
+        """
+        views = []
+        offset = 0
+        for i in range(len(layers) - 1):
+            size = layers[i] * layers[i + 1]
+            views.append(genome[..., offset: offset + size].reshape(genome.shape[:-1] + (layers[i + 1], layers[i])))
+            offset += size
+        return views
 
     def query(self, input_list):
         """
         Runs through the whole matrix and given an input, returns an output given the current weight matrix.
         Throws an illegal exception if the input is of the incorrect size.
+
+        Thin wrapper around query_batch for a single input; returns a new (outputs, 1) column array.
         """
 
         # Checks input size
@@ -52,34 +129,36 @@ class NeuralNetwork:
             raise Exception('Input has incorrect size. The size of input was {}, but should be {}.'
                             .format(len(input_list), self.layers[0]))
 
-        # converts input to np array
-        prev_layer = np.array(input_list, ndmin=2).T
-
-        # First list is the input
-        layers = [input_list]
-        for weight_layer in self.weights:
-
-            # print(prev_layer)
+        self.single_input[0] = input_list
+        return self.query_batch(self.single_input).T.copy()
 
-            # multiplies previous layer with the weights to get the next layer
-            next_layer = np.dot(weight_layer, prev_layer)
+    def query_batch(self, inputs):
+        """
+        Runs a whole batch of inputs through the network with one matrix product and sigmoid per layer.
 
-            # applies activation function on the next layer
-            next_layer = self.activation_function(next_layer)
+        :param inputs: (batch, input size) array, one input per row
+        :return: (batch, output size) array. NOTE: this is an internal buffer which is overwritten by the next call
+        with the same batch size, copy it if it has to be kept.
+        """
+        inputs = self.prepare_batch(inputs, self.layers[0], 'Input')
+        activations = self.get_batch_buffers(inputs.shape[0])[0]
 
-            # appends the next layer
-            layers.append(next_layer)
-            # sets previous layer as next layer
+        prev_layer = inputs
+        for weight_layer, next_layer in zip(self.weights, activations):
+            # multiplies previous layer with the weights to get the next layer, then applies the activation function
+            np.dot(prev_layer, weight_layer.T, out=next_layer)
+            sigmoid(next_layer, out=next_layer)
             prev_layer = next_layer
 
-        # Last list in layers should be the output.
-        return layers[-1]
+        return activations[-1]
 
     def train(self, input_list, target_list):
         """
         Runs through the whole matrix and given an input, and then compares output to target. Then compares output
         to target_list and backpropogates the error. Throws an illegal exception if the input or target is of the
         incorrect size.
+
+        Thin wrapper around train_batch for a single input and target.
         """
 
         # Checks input size
@@ -92,55 +171,207 @@ class NeuralNetwork:
             raise Exception('Input has incorrect size. The size of input was {}, but should be {}.'
                             .format(len(target_list), self.layers[-1]))
 
-        # Converts target to np array
-        targets = np.array(target_list, ndmin=2).T
-        # Converts input to np array
-        prev_layer = np.array(input_list, ndmin=2).T
+        self.single_input[0] = input_list
+        self.train_batch(self.single_input, np.array(target_list, ndmin=2))
+
+    def train_batch(self, inputs, targets):
+        """
+        Trains on a whole batch at once. The errors of every sample are backpropogated like in train, and the weight
+        updates of the batch are summed, so a batch of one is exactly a call to train.
 
-        # converts target to target
-        # First list is the input
-        layers = [np.array([input_list]).T]
-        for weight_layer in self.weights:
+        :param inputs: (batch, input size) array, one input per row
+        :param targets: (batch, output size) array, one target per row
+        """
+        inputs = self.check_batch(inputs, self.layers[0], 'Input', self.dtype)
+        targets = self.check_batch(targets, self.layers[-1], 'Target', self.dtype)
+        if inputs.shape[0] != targets.shape[0]:
+            raise Exception('Batch sizes differ: {} inputs but {} targets.'.format(inputs.shape[0], targets.shape[0]))
 
-            # multiplies previous layer with the weights to get the next layer
-            next_layer = np.dot(weight_layer, prev_layer)
+        activations, errors, deltas = self.get_batch_buffers(inputs.shape[0])
+        self.query_batch(inputs)
 
-            # applies activation function on the next layer
-            next_layer = self.activation_function(next_layer)
+        # Finds the Output error
+        np.subtract(targets, activations[-1], out=errors[-1])
 
-            # appends the next layer
-            layers.append(next_layer)
-            # sets previous layer as next layer
-            prev_layer = next_layer
+        # Backpropogation loop, from the output layer to the first hidden layer. The error of the previous layer is
+        # computed from the weights before they are updated, like the error_array of the single sample version.
+        for i in range(len(self.weights) - 1, -1, -1):
+            weight_layer = self.weights[i]
+            layer = activations[i]
+            prev_layer = activations[i - 1] if i > 0 else inputs
 
-        # Last list in layers should be the output.
-        output = layers[-1]
+            if i > 0:
+                np.dot(errors[i], weight_layer, out=errors[i - 1])
 
-        # Finds the Output error
-        output_error = targets - output
-
-        weights_len = len(self.weights)
-        # loop to create a list of numpy arrays of errors in reverse order (i.e. output error is first error)
-        error_array = []
-        for i in range(0, weights_len):
-            if i == 0:
-                # first error is output error
-                error_array += [output_error]
-            else:
-                # print(error_array)
-                error_array += [np.dot(self.weights[weights_len - i].T, error_array[i - 1])]
-        #print(error_array)
-        # Backpropogation loop
-
-        # b = np.dot((error_array[0] * layers[2] * (1.0 - layers[2])), np.transpose(layers[1]))
-        # self.weights[1] += self.learning_rate * b
-        # b = np.dot((error_array[1] * layers[1] * (1.0 - layers[1])), np.transpose(layers[0]))
-        # self.weights[0] += self.learning_rate * b
-
-        for i in range(0, weights_len):
-            # Applies backpropogation function to weights matrix
-            # print(len(error_array[-i - 1]))
-            # print(len(layers[-i - 1]))
-            a = error_array[i] * layers[-i - 1] * (1.0 - layers[-i - 1])
-            prop_dot_product = np.dot(a, np.transpose(layers[weights_len - i - 1]))
-            self.weights[-i - 1] += self.learning_rate * prop_dot_product
+            # delta = error * output * (1 - output)
+            delta = deltas[i]
+            np.subtract(1.0, layer, out=delta)
+            delta *= layer
+            delta *= errors[i]
+
+            if self.gradient_buffers is None:
+                self.gradient_buffers = [np.empty(w.shape, dtype=self.dtype) for w in self.weights]
+            gradient = self.gradient_buffers[i]
+            np.dot(delta.T, prev_layer, out=gradient)
+            gradient *= self.learning_rate
+            weight_layer += gradient
+
+    def get_batch_buffers(self, batch_size):
+        """
+        :return: (activations, errors, deltas), lists with one (batch_size, layer size) array per weight layer
+        """
+        buffers = self.batch_buffers.get(batch_size)
+        if buffers is None:
+            # Only a few batch sizes are used at a time, so old sizes are simply dropped
+            if len(self.batch_buffers) >= 8:
+                self.batch_buffers.clear()
+            buffers = tuple([np.empty((batch_size, size), dtype=self.dtype) for size in self.layers[1:]]
+                            for _ in range(3))
+            self.batch_buffers[batch_size] = buffers
+        return buffers
+
+    def prepare_batch(self, batch, size, name):
+        """
+        Checks a batch of inputs and brings it to the network's dtype. An array of another dtype (e.g. the integer
+        boards of a BatchGameBoard) is converted into a preallocated input buffer rather than a new array.
+
+        NOTE: a converted batch is an internal buffer which is overwritten by the next call with the same batch size.
+        """
+        if not isinstance(batch, np.ndarray) or batch.dtype == self.dtype:
+            return self.check_batch(batch, size, name, self.dtype)
+        if batch.ndim != 2 or batch.shape[1] != size:
+            raise Exception('{} has incorrect shape. The shape of the batch was {}, but should be (batch, {}).'
+                            .format(name, batch.shape, size))
+
+        buffer = self.input_buffers.get(batch.shape[0])
+        if buffer is None:
+            if len(self.input_buffers) >= 8:
+                self.input_buffers.clear()
+            buffer = np.empty((batch.shape[0], size), dtype=self.dtype)
+            self.input_buffers[batch.shape[0]] = buffer
+        np.copyto(buffer, batch, casting='unsafe')
+        return buffer
+
+    def astype(self, dtype):
+        """
+        :return: a copy of the network with its weights converted to dtype
+        """
+        return NeuralNetwork(self.layers, self.learning_rate, genome=self.genome.astype(dtype), dtype=dtype)
+
+    def precision_difference(self, inputs, dtype=np.float32):
+        """
+        Measures how far the outputs of the network in another precision are from its own.
+
+        :param inputs: (batch, input size) array of inputs to compare on, e.g. boards seen in play
+        :return: dict with the largest and mean absolute difference of the outputs, and the share of inputs for
+        which both pick the same highest scoring output
+        """
+        reference = self.query_batch(inputs).copy()
+        other = self.astype(dtype).query_batch(inputs).astype(reference.dtype)
+
+        difference = np.abs(other - reference)
+        return {'dtype': np.dtype(dtype).name,
+                'max_abs_error': float(difference.max()),
+                'mean_abs_error': float(difference.mean()),
+                'argmax_agreement': float(np.mean(np.argmax(other, axis=1) == np.argmax(reference, axis=1)))}
+
+    @staticmethod
+    def masked_scores(scores, legal):
+        """
+        Brings move scores and their legal moves to matching (..., pits) arrays for the masked selection helpers.
+        Boards have 6 pits per side, or as many as the network has outputs for other BoardVariants.
+
+        :param scores: scores of one board, as a (pits,) array, a (pits, 1) column like query returns or a list, or a
+        (batch, pits) array with one row per board
+        :param legal: boolean array of the same shape as the scores, or the legal move bitmask of every board (an int,
+        or an integer array with one mask per row), bit (pit - 1) set for a legal pit like GameBoard.legal_moves
+        :return: (scores, legal) as a float array and a boolean array of the same shape
+        """
+        scores = np.asarray(scores, dtype=float)
+        if scores.ndim == 2 and scores.shape[1] == 1:
+            scores = scores[:, 0]
+        pits = scores.shape[-1] if scores.ndim else 0
+
+        legal = np.asarray(legal)
+        if legal.dtype != bool:
+            bits = NeuralNetwork.MOVE_BITS if pits == 6 else 1 << np.arange(pits)
+            legal = (legal[..., np.newaxis] & bits) != 0
+        elif legal.ndim == 2 and legal.shape[1] == 1:
+            legal = legal[:, 0]
+
+        if scores.ndim not in (1, 2) or legal.shape != scores.shape:
+            raise Exception('Scores and legal moves have incorrect shapes. The shapes were {} and {}, but should both '
+                            'be (pits,) or (batch, pits).'.format(scores.shape, legal.shape))
+        return scores, legal
+
+    @staticmethod
+    def masked_argmax(scores, legal):
+        """
+        :return: the highest scoring legal pit (1 - pits), the first one on ties, as an int for one board or an array
+        for a batch. A board without legal moves gets pit 1.
+        """
+        if isinstance(legal, int):
+            # One board with a bitmask, as in the single game loops: a plain loop beats the array round trip
+            values = np.ravel(scores).tolist()
+            if legal >> len(values):
+                raise Exception('Scores have incorrect size. The size of the scores was {}, but the legal moves '
+                                'have {} pits.'.format(len(values), legal.bit_length()))
+            best_pit = 1
+            best_score = None
+            for i in range(len(values)):
+                if legal >> i & 1 and (best_score is None or values[i] > best_score):
+                    best_pit = i + 1
+                    best_score = values[i]
+            return best_pit
+
+        scores, legal = NeuralNetwork.masked_scores(scores, legal)
+        pits = np.argmax(np.where(legal, scores, -np.inf), axis=-1) + 1
+        return int(pits) if scores.ndim == 1 else pits
+
+    @staticmethod
+    def masked_softmax(scores, legal, temperature=1.0):
+        """
+        :return: softmax of scores / temperature over the legal pits, same shape as the scores, with 0 for every
+        illegal pit. A board without legal moves gets all zeros.
+        """
+        scores, legal = NeuralNetwork.masked_scores(scores, legal)
+        masked = np.where(legal, scores / temperature, -np.inf)
+
+        # Shifting by the largest legal score keeps exp from overflowing; boards without legal moves shift by 0
+        shift = masked.max(axis=-1, keepdims=True)
+        shift[~np.isfinite(shift)] = 0.0
+        probabilities = np.exp(masked - shift)
+
+        total = probabilities.sum(axis=-1, keepdims=True)
+        total[total == 0] = 1.0
+        probabilities /= total
+        return probabilities
+
+    @staticmethod
+    def masked_sample(scores, legal, temperature=1.0, rng=None):
+        """
+        Samples a legal pit with probabilities masked_softmax(scores, legal, temperature), for exploration. A
+        temperature of 0 or None is masked_argmax.
+
+        :param rng: optional np.random.RandomState or Generator; the global np.random state is used by default
+        :return: sampled pit (1 - pits), as an int for one board or an array for a batch
+        """
+        if not temperature:
+            return NeuralNetwork.masked_argmax(scores, legal)
+
+        probabilities = NeuralNetwork.masked_softmax(scores, legal, temperature)
+        cumulative = probabilities.cumsum(axis=-1)
+        draws = (rng if rng is not None else np.random).uniform(size=cumulative.shape[:-1] + (1,))
+
+        # The first pit whose cumulative probability passes the draw. Scaling the draw by the total keeps it inside
+        # the last legal pit despite rounding; illegal pits add nothing to the sum so they are never picked.
+        pits = np.argmax(cumulative > draws * cumulative[..., -1:], axis=-1) + 1
+        return int(pits) if probabilities.ndim == 1 else pits
+
+    @staticmethod
+    def check_batch(batch, size, name, dtype=np.float64):
+        batch = np.asarray(batch, dtype=dtype)
+        if batch.ndim != 2 or batch.shape[1] != size:
+            raise Exception('{} has incorrect shape. The shape of the batch was {}, but should be (batch, {}).'
+                            .format(name, batch.shape, size))
+        return batch
@@ -0,0 +1,223 @@
+from GameBoard import *
+from AlphaBetaAgent import *
+import concurrent.futures
+import os
+import numpy as np
+
+
+class OpeningBook:
+
+    """
+    Best moves of every position reachable in the first plies from the standard start, searched once and stored.
+
+    A ply is one move, so chains of extra turns count a ply per move. The book holds every unfinished position
+    reachable in fewer than plies moves. Every move leaving the book is valued by an AlphaBetaAgent search of the
+    position it leads to, depth moves deep, with a full window so the value is exact rather than an alpha-beta bound.
+    The book positions are then solved by negamax over the book itself, so the book's moves are those of a search
+    plies + depth deep.
+
+    A move either puts marbles in a store or moves every marble it sows nearer to the store ahead of it, so ordering
+    positions by the marbles in the stores, then by how far the marbles in the pits still have to go, puts every
+    position after the positions it can be reached from. Solving in the reverse order solves every position after
+    the book positions it leads to.
+
+    The book is an .npy array of entries sorted by the Zobrist hash of the position and the player to move
+    (GameBoard.zobrist_hash). A lookup is a binary search of the hashes, and the entry's board and player are checked,
+    so hash collisions cannot return a wrong move.
+    """
+
+    DTYPE = np.dtype([('key', '<u8'), ('board', 'u1', (14,)), ('player', 'u1'), ('pit', 'u1'), ('value', '<i2')])
+
+    # Distance of every board index to the store its marbles are sown into next, 0 for the stores
+    DISTANCES = np.array([0, 1, 2, 3, 4, 5, 6, 6, 5, 4, 3, 2, 1, 0])
+
+    ZOBRIST = np.array(GameBoard.ZOBRIST, dtype=np.uint64)
+
+    def __init__(self, path, mmap_mode='r'):
+        """
+        Opens a book written by build.
+
+        :param mmap_mode: np.load mmap_mode, None reads the whole book into memory
+        """
+        self.path = path
+        self.entries = np.load(path, mmap_mode=mmap_mode)
+        if self.entries.dtype != OpeningBook.DTYPE:
+            raise Exception('{} is not an opening book.'.format(path))
+        self.keys = self.entries['key']
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def positions(plies):
+        """
+        :return: dict mapping every unfinished (board tuple, player) reachable in fewer than plies moves from the
+        start to its list of (pit, child board tuple, child player, finished) per legal pit
+        """
+        book = {}
+        layer = [(tuple(GameBoard().board), 0)]
+        for _ in range(plies):
+            next_layer = []
+            for position in layer:
+                if position in book:
+                    continue
+                board = GameBoard(list(position[0]))
+                if board.check_end_condition():
+                    continue
+
+                moves = []
+                for pit in board.legal_pits(position[1]):
+                    child = board.copy()
+                    next_player = child.move_marbles(position[1], pit)
+                    finished = child.check_end_condition()
+                    moves.append((pit, tuple(child.board), next_player, finished))
+                    if not finished:
+                        next_layer.append((tuple(child.board), next_player))
+                book[position] = moves
+            layer = next_layer
+        return book
+
+    @staticmethod
+    def build(path, plies=6, depth=6, workers=1, verbose=False):
+        """
+        Searches the book and writes it to path.
+
+        :param plies: book positions are reachable in fewer than plies moves
+        :param depth: AlphaBetaAgent depth of the positions at the edge of the book
+        :param workers: processes searching at once
+        :return: OpeningBook over the new file
+        """
+        book = OpeningBook.positions(plies)
+
+        # The moves leaving the book are searched, grouped by the position they are played from
+        frontier = []
+        for position, moves in book.items():
+            pits = [pit for pit, child, next_player, finished in moves
+                    if not finished and (child, next_player) not in book]
+            if pits:
+                frontier.append((position[0], position[1], pits))
+        if verbose:
+            print("{} book positions, searching {} moves of {} of them"
+                  .format(len(book), sum(len(pits) for _, _, pits in frontier), len(frontier)))
+
+        if workers <= 1:
+            searched = search_positions(frontier, depth)
+        else:
+            chunks = [frontier[i::workers * 4] for i in range(workers * 4)]
+            searched = {}
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                for values in executor.map(search_positions, chunks, [depth] * len(chunks)):
+                    searched.update(values)
+
+        # Solved from the positions furthest into the game backwards, see the class docstring
+        order = sorted(book, key=lambda position: (position[0][0] + position[0][13],
+                                                   -int(np.dot(OpeningBook.DISTANCES, position[0]))), reverse=True)
+        values = {}
+        entries = np.zeros(len(book), dtype=OpeningBook.DTYPE)
+        for i, position in enumerate(order):
+            board, player = position
+            best_pit = None
+            best_value = None
+            for pit, child, next_player, finished in book[position]:
+                if finished:
+                    value = AlphaBetaAgent.final_value(GameBoard(list(child)), player)
+                elif (child, next_player) in values:
+                    value = values[(child, next_player)]
+                    value = value if next_player == player else -value
+                else:
+                    value = searched[position][pit]
+                if best_value is None or value > best_value:
+                    best_pit = pit
+                    best_value = value
+
+            values[position] = best_value
+            entries[i] = (GameBoard.zobrist_hash(list(board), player), board, player, best_pit, best_value)
+
+        entries.sort(order='key')
+        np.save(path + '.tmp.npy', entries)
+        os.replace(path + '.tmp.npy', path)
+        return OpeningBook(path)
+
+    def find(self, board, player):
+        """
+        :param board: list of 14 marble counts
+        :return: index of the position's entry, or None if it is not in the book
+        """
+        key = GameBoard.zobrist_hash(board, player)
+        i = int(np.searchsorted(self.keys, key))
+        while i < len(self.keys) and self.keys[i] == key:
+            entry = self.entries[i]
+            if entry['player'] == player and list(entry['board']) == list(board):
+                return i
+            i += 1
+        return None
+
+    def lookup(self, board, player):
+        """
+        :return: (pit, value) of the position with player to move, value being the searched final store difference
+        for player, or None if the position is not in the book
+        """
+        i = self.find(board, player)
+        if i is None:
+            return None
+        return int(self.entries['pit'][i]), int(self.entries['value'][i])
+
+    def moves(self, inputs):
+        """
+        :param inputs: (n, 15) array of the 14 board entries followed by the player to move
+        :return: array of the book pit of every row, 0 for rows not in the book
+        """
+        inputs = np.asarray(inputs)
+        boards = inputs[:, :14].astype(np.intp)
+        players = inputs[:, 14].astype(np.intp)
+        keys = np.bitwise_xor.reduce(OpeningBook.ZOBRIST[np.arange(14), boards], axis=1)
+        keys[players == 1] ^= np.uint64(GameBoard.ZOBRIST_PLAYER)
+
+        # Colliding hashes are next to each other, so looking at the first match and checking it finds nearly all
+        found = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        entries = self.entries[found]
+        hit = (entries['key'] == keys) & (entries['player'] == players) & (entries['board'] == boards).all(axis=1)
+        pits = np.where(hit, entries['pit'], 0).astype(np.intp)
+
+        for row in np.flatnonzero(~hit & (entries['key'] == keys)):
+            lookup = self.lookup(boards[row].tolist(), int(players[row]))
+            pits[row] = 0 if lookup is None else lookup[0]
+        return pits
+
+    def query(self, input_list):
+        """
+        :param input_list: the 14 board entries followed by the player to move, as given to NeuralNetwork.query
+        :return: (6, 1) array of move scores: 1 for the book move, 0 for the other legal pits and -inf for empty pits
+        """
+        if len(input_list) != 15:
+            raise Exception('Input has incorrect size. The size of input was {}, but should be {}.'
+                            .format(len(input_list), 15))
+
+        board = [int(x) for x in input_list[:14]]
+        player = int(input_list[14])
+        lookup = self.lookup(board, player)
+        if lookup is None:
+            raise Exception('Position is not in the opening book.')
+
+        scores = np.where(np.array(board[player * 6 + 1: player * 6 + 7]) > 0, 0.0, -np.inf)
+        scores[lookup[0] - 1] = 1.0
+        return scores[:, np.newaxis]
+
+
+def search_positions(positions, depth):
+    """
+    Body of a build task: searches moves with one AlphaBetaAgent.
+
+    :param positions: list of (board tuple, player, pits to search)
+    :return: dict mapping every (board tuple, player) to a dict of the exact value of every searched pit for the
+    player to move
+    """
+    agent = AlphaBetaAgent(max_depth=depth)
+    values = {}
+    for board, player, pits in positions:
+        game_board = GameBoard(list(board))
+        # search_child plays the pit and searches the position after it depth moves deep. A full window makes the
+        # value exact: the root of AlphaBetaAgent.search only gets bounds for the moves after its best one.
+        values[(board, player)] = {pit: agent.search_child(game_board, player, pit, depth + 1, -np.inf, np.inf)
+                                   for pit in pits}
+    return values
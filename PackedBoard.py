@@ -0,0 +1,75 @@
+from GameBoard import *
+
+
+class PackedBoard:
+
+    """
+    Compact, immutable Mancala position: the 14 marble counts packed into a 14 byte bytes object in the same layout
+    as GameBoard.board (stores at index 0 and 13), plus an optional player to move.
+
+    Hashing returns the precomputed Zobrist hash (the same value GameBoard.hash tracks incrementally) and equality is a
+    single bytes comparison, so PackedBoards work well as keys of transposition tables or for deduplicating training
+    positions. Copying is free, since a PackedBoard never changes.
+    """
+
+    __slots__ = ('data', 'player', 'hash')
+
+    def __init__(self, data, player=None, hash_value=None):
+        """
+        :param data: 14 bytes of marble counts
+        :param player: optional player to move (0 or 1), part of the hash and of equality
+        :param hash_value: Zobrist hash of the position if already known (e.g. GameBoard.hash), computed otherwise
+        """
+        assert len(data) == 14, "Invalid board length {}, must be 14".format(len(data))
+
+        self.data = bytes(data)
+        self.player = player
+        if hash_value is None:
+            hash_value = GameBoard.zobrist_hash(self.data, player)
+        elif player == 1:
+            hash_value ^= GameBoard.ZOBRIST_PLAYER
+        self.hash = hash_value
+
+    @staticmethod
+    def from_list(board, player=None):
+        """
+        :param board: list of 14 marble counts, as returned by GameBoard.get_board
+        """
+        return PackedBoard(bytes(board), player)
+
+    @staticmethod
+    def from_game_board(game_board, player=None):
+        """
+        Packs a GameBoard, reusing its incrementally updated hash rather than recomputing it.
+        """
+        return PackedBoard(bytes(game_board.board), player, game_board.hash)
+
+    def to_list(self):
+        return list(self.data)
+
+    def to_game_board(self):
+        board = GameBoard.__new__(GameBoard)
+        board.board = list(self.data)
+        board.hash = self.hash ^ GameBoard.ZOBRIST_PLAYER if self.player == 1 else self.hash
+        board.legal = GameBoard.legal_mask(board.board)
+        return board
+
+    def get_score(self):
+        return self.data[0], self.data[13]
+
+    def __getitem__(self, index):
+        return self.data[index]
+
+    def __len__(self):
+        return 14
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        if not isinstance(other, PackedBoard):
+            return NotImplemented
+        return self.hash == other.hash and self.player == other.player and self.data == other.data
+
+    def __repr__(self):
+        return "PackedBoard({}, player={})".format(list(self.data), self.player)
@@ -0,0 +1,135 @@
+from Game import *
+from multiprocessing import shared_memory
+import concurrent.futures
+import numpy as np
+import random
+
+
+class ParallelFitness:
+
+    """
+    Spreads fitness evaluation of a population over a pool of worker processes.
+
+    Once per call to compute, the weights of the whole population are copied into one shared memory block as a
+    (population, genes) matrix. The workers attach to it and build their networks as views into it, so tasks only
+    carry the block name, a range of network indices and their seeds. Every network is evaluated with its own seed,
+    so the results do not depend on the number of workers or on how the tasks are split.
+    """
+
+    def __init__(self, net_size, workers, games_per_fitness=100):
+        """
+        :param net_size: layer sizes shared by every network of the population
+        :param workers: number of worker processes
+        :param games_per_fitness: games against the random agent per network
+        """
+        self.net_size = net_size
+        self.workers = workers
+        self.games_per_fitness = games_per_fitness
+        self.genes = NeuralNetwork.genome_size(net_size)
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                                               initargs=(net_size, games_per_fitness))
+
+    def compute(self, population, seeds):
+        """
+        :param population: list of NeuralNetworks with layer sizes net_size
+        :param seeds: one integer seed per network
+        :return: list of win percentages against the random agent, in population order
+        """
+        shape = (len(population), self.genes)
+        block = shared_memory.SharedMemory(create=True, size=max(shape[0] * shape[1] * 8, 1))
+        try:
+            matrix = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+            for i, nn in enumerate(population):
+                matrix[i] = nn.genome
+            # The matrix has to be released before the block can be closed
+            del matrix
+
+            # A few chunks per worker keeps every worker busy without sending one task per network
+            chunk_size = max(1, -(-len(population) // (self.workers * 4)))
+            futures = []
+            for start in range(0, len(population), chunk_size):
+                stop = min(start + chunk_size, len(population))
+                futures.append(self.executor.submit(evaluate_chunk, block.name, shape, start, stop,
+                                                    [int(seed) for seed in seeds[start:stop]]))
+
+            results = []
+            for future in futures:
+                results.extend(future.result())
+            return results
+        finally:
+            block.close()
+            block.unlink()
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def evaluate_network(game, nn, num_games, seed):
+    """
+    Plays num_games against the random agent with random and np.random seeded by seed.
+    """
+    game.reset_game()
+    return call_seeded(seed, game.test_against_random_agent, nn, num_games)
+
+
+def call_seeded(seed, function, *args):
+    """
+    Calls function(*args) with random and np.random seeded by seed, then restores their previous states so the
+    caller's stream of random numbers is not disturbed.
+    """
+    state = random.getstate()
+    np_state = np.random.get_state()
+    random.seed(seed)
+    np.random.seed(seed)
+    try:
+        return function(*args)
+    finally:
+        random.setstate(state)
+        np.random.set_state(np_state)
+
+
+# State of a worker process, set up once by init_worker
+_worker = {}
+
+
+def init_worker(net_size, games_per_fitness):
+    _worker['game'] = Game()
+    _worker['nn'] = NeuralNetwork(net_size)
+    _worker['games'] = games_per_fitness
+    _worker['block'] = None
+
+
+def attach_block(name, shape):
+    """
+    Attaches to the shared weight matrix of the current call, reusing the attachment between tasks of the same call.
+    """
+    block = _worker['block']
+    if block is not None and block.name == name:
+        return _worker['matrix']
+
+    if block is not None:
+        # Views into the old block must be gone before it can be closed
+        _worker['nn'].set_genome(np.empty(_worker['nn'].genome.shape))
+        _worker['matrix'] = None
+        block.close()
+
+    # The workers share the parent's resource tracker, so attaching here does not take ownership of the block;
+    # the parent unlinks it once the call is done
+    block = shared_memory.SharedMemory(name=name)
+
+    _worker['block'] = block
+    _worker['matrix'] = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+    return _worker['matrix']
+
+
+def evaluate_chunk(name, shape, start, stop, seeds):
+    matrix = attach_block(name, shape)
+    nn = _worker['nn']
+
+    results = []
+    for index, seed in zip(range(start, stop), seeds):
+        # The worker's network becomes a set of views into the shared row, nothing is copied
+        nn.set_genome(matrix[index])
+        results.append(evaluate_network(_worker['game'], nn, _worker['games'], seed))
+
+    return results
@@ -0,0 +1,65 @@
+from NeuralNetwork import *
+import numpy as np
+
+
+class PopulationNetwork:
+
+    """
+    Inference for a whole population of networks with the same layer sizes at once.
+
+    The weights of the population are a stack of (population, next layer, layer) tensors, which are zero-copy views
+    into a (population, genes) genome matrix such as GeneticAgent.genomes. A query evaluates a batch of inputs for every
+    network with one batched matrix product per layer, instead of one NeuralNetwork.query per network and input.
+    """
+
+    def __init__(self, net_size, genomes):
+        """
+        :param net_size: layer sizes shared by every network
+        :param genomes: (population, genes) matrix with one genome per row, see NeuralNetwork.genome_size. Queries
+        run in its dtype, so a float32 matrix halves the memory traffic of every layer.
+        """
+        if genomes.ndim != 2 or genomes.shape[1] != NeuralNetwork.genome_size(net_size):
+            raise Exception('Genomes have incorrect shape. The shape of the genomes was {}, but should be '
+                            '(population, {}).'.format(genomes.shape, NeuralNetwork.genome_size(net_size)))
+
+        self.net_size = net_size
+        self.genomes = genomes
+        self.population_size = genomes.shape[0]
+        self.dtype = genomes.dtype
+        self.weights = NeuralNetwork.genome_views(net_size, genomes)
+        # Transposed once so every layer is a plain (population, batch, layer) @ (population, layer, next) product
+        self.weights_t = [weight_layer.transpose(0, 2, 1) for weight_layer in self.weights]
+
+    @staticmethod
+    def from_networks(networks):
+        """
+        :return: PopulationNetwork over a copy of the genomes of a list of NeuralNetworks
+        """
+        return PopulationNetwork(networks[0].layers, np.stack([nn.genome for nn in networks]))
+
+    def astype(self, dtype):
+        """
+        :return: PopulationNetwork over a copy of the genomes converted to dtype
+        """
+        return PopulationNetwork(self.net_size, self.genomes.astype(dtype))
+
+    def query(self, inputs):
+        """
+        :param inputs: (population, batch, input size) array of inputs for every network, or (population, input size)
+        for a single input per network
+        :return: outputs of matching shape, (population, batch, output size) or (population, output size)
+        """
+        single = inputs.ndim == 2
+        layer = np.asarray(inputs, dtype=self.dtype)
+        if single:
+            layer = layer[:, np.newaxis, :]
+
+        if layer.shape[0] != self.population_size or layer.shape[2] != self.net_size[0]:
+            raise Exception('Input has incorrect shape. The shape of the input was {}, but should be ({}, batch, {}).'
+                            .format(inputs.shape, self.population_size, self.net_size[0]))
+
+        for weight_layer in self.weights_t:
+            layer = np.matmul(layer, weight_layer)
+            sigmoid(layer, out=layer)
+
+        return layer[:, 0, :] if single else layer
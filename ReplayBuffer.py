@@ -0,0 +1,186 @@
+from collections import namedtuple
+import os
+import numpy as np
+
+
+# Minibatch drawn from a ReplayBuffer.
+# indices: buffer rows of the samples, to pass back to update_priorities
+# states: (batch, input size) network inputs
+# targets: (batch, output size) training targets, before scaling by the return
+# actions: (batch,) pits (1 - 6) that were played
+# returns: (batch,) discounted returns of the moves
+# weights: (batch,) importance sampling weights, all 1 for uniform sampling
+ReplayBatch = namedtuple('ReplayBatch', ['indices', 'states', 'targets', 'actions', 'returns', 'weights'])
+
+
+class ReplayBuffer:
+
+    """
+    Fixed capacity store of training moves, kept in preallocated arrays used as a ring: once full, every new move
+    overwrites the oldest one. Nothing is allocated per move, and every stored move can be sampled again for as long
+    as it stays in the buffer.
+
+    Minibatches are sampled uniformly or prioritized, where a move is drawn with probability proportional to
+    priority ** alpha and comes with an importance sampling weight correcting for it (Schaul et al., Prioritized
+    Experience Replay).
+
+    With a directory the arrays are memory mapped .npy files in it instead of living in memory, so long runs with a
+    large capacity only keep the pages in use resident.
+    """
+
+    def __init__(self, capacity, input_size=15, output_size=6, directory=None, alpha=0.6, epsilon=1e-3):
+        """
+        :param capacity: number of moves the buffer holds
+        :param input_size: size of a network input
+        :param output_size: size of a network output (a target)
+        :param directory: optional directory to spill the arrays to as memory mapped .npy files
+        :param alpha: how strongly prioritized sampling follows the priorities, 0 is uniform
+        :param epsilon: added to every priority so every move can still be sampled
+        """
+        assert capacity > 0, "Invalid capacity {}, must be positive".format(capacity)
+
+        self.capacity = capacity
+        self.alpha = alpha
+        self.epsilon = epsilon
+        self.directory = directory
+
+        self.states = self.allocate('states', (capacity, input_size), np.float64)
+        self.targets = self.allocate('targets', (capacity, output_size), np.float64)
+        self.actions = self.allocate('actions', (capacity,), np.int8)
+        self.returns = self.allocate('returns', (capacity,), np.float64)
+        self.priorities = self.allocate('priorities', (capacity,), np.float64)
+
+        # Number of stored moves, and the row the next move is written to
+        self.size = 0
+        self.position = 0
+        # Largest priority seen, given to new moves without one so they are sampled at least once soon
+        self.max_priority = 1.0
+
+    def allocate(self, name, shape, dtype):
+        if self.directory is None:
+            return np.zeros(shape, dtype=dtype)
+
+        os.makedirs(self.directory, exist_ok=True)
+        return np.lib.format.open_memmap(os.path.join(self.directory, name + '.npy'), mode='w+', dtype=dtype,
+                                         shape=shape)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, target, action, discounted_return, priority=None):
+        """
+        Stores a single move.
+
+        :return: buffer row of the move
+        """
+        return self.add_batch(np.array(state, ndmin=2), np.array(target, ndmin=2), [action], [discounted_return],
+                              None if priority is None else [priority])[0]
+
+    def add_batch(self, states, targets, actions, returns, priorities=None):
+        """
+        Stores a batch of moves, overwriting the oldest ones once the buffer is full. If the batch alone is larger
+        than the buffer only its last capacity moves are kept.
+
+        :param states: (n, input size) array of network inputs
+        :param targets: (n, output size) array of targets
+        :param actions: n pits played
+        :param returns: n discounted returns
+        :param priorities: optional n sampling priorities; new moves get the largest priority seen by default
+        :return: array of the buffer rows the moves were written to
+        """
+        states = np.asarray(states)
+        targets = np.asarray(targets)
+        actions = np.asarray(actions)
+        returns = np.asarray(returns)
+        count = len(states)
+        assert len(targets) == count and len(actions) == count and len(returns) == count, \
+            "Every argument must hold one entry per move"
+
+        if priorities is None:
+            priorities = np.full(count, self.max_priority)
+        else:
+            priorities = np.abs(np.asarray(priorities, dtype=np.float64)) + self.epsilon
+            if count:
+                self.max_priority = max(self.max_priority, float(priorities.max()))
+
+        if count > self.capacity:
+            skip = count - self.capacity
+            states, targets, actions, returns, priorities = \
+                states[skip:], targets[skip:], actions[skip:], returns[skip:], priorities[skip:]
+            count = self.capacity
+
+        # At most two contiguous slices: up to the end of the arrays, then wrapped around to the start
+        rows = (self.position + np.arange(count)) % self.capacity
+        first = min(count, self.capacity - self.position)
+        for source, start, stop in ((slice(0, first), self.position, self.position + first),
+                                    (slice(first, count), 0, count - first)):
+            if stop > start:
+                self.states[start:stop] = states[source]
+                self.targets[start:stop] = targets[source]
+                self.actions[start:stop] = actions[source]
+                self.returns[start:stop] = returns[source]
+                self.priorities[start:stop] = priorities[source]
+
+        self.position = (self.position + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+        return rows
+
+    def sample(self, batch_size, prioritized=False, beta=0.4, rng=None):
+        """
+        Draws a minibatch of stored moves, with replacement.
+
+        :param prioritized: draw moves with probability proportional to priority ** alpha instead of uniformly
+        :param beta: strength of the importance sampling correction of prioritized sampling, 1 corrects fully
+        :param rng: optional np.random.RandomState or Generator; the global np.random state is used by default
+        :return: ReplayBatch
+        """
+        assert self.size > 0, "Cannot sample from an empty replay buffer"
+        rng = rng if rng is not None else np.random
+
+        if prioritized:
+            scaled = self.priorities[:self.size] ** self.alpha
+            probabilities = scaled / scaled.sum()
+            # Inverse transform sampling on the cumulative distribution, one binary search per sample
+            cumulative = np.cumsum(probabilities)
+            indices = np.searchsorted(cumulative, rng.uniform(size=batch_size) * cumulative[-1], side='right')
+            indices = np.minimum(indices, self.size - 1)
+
+            weights = (self.size * probabilities[indices]) ** -beta
+            weights /= weights.max()
+        else:
+            indices = np.minimum((rng.uniform(size=batch_size) * self.size).astype(np.intp), self.size - 1)
+            weights = np.ones(batch_size)
+
+        return self.get(indices, weights)
+
+    def get(self, indices, weights=None):
+        """
+        :return: ReplayBatch of the given buffer rows, e.g. the rows returned by add_batch
+        """
+        indices = np.asarray(indices, dtype=np.intp)
+        if weights is None:
+            weights = np.ones(len(indices))
+        return ReplayBatch(indices, self.states[indices], self.targets[indices], self.actions[indices],
+                           self.returns[indices], weights)
+
+    def update_priorities(self, indices, priorities):
+        """
+        Sets new sampling priorities for the given rows, e.g. the size of their latest training error.
+        """
+        priorities = np.abs(np.asarray(priorities, dtype=np.float64)) + self.epsilon
+        self.priorities[np.asarray(indices, dtype=np.intp)] = priorities
+        if len(priorities):
+            self.max_priority = max(self.max_priority, float(priorities.max()))
+
+    def clear(self):
+        self.size = 0
+        self.position = 0
+        self.max_priority = 1.0
+
+    def flush(self):
+        """
+        Writes the memory mapped arrays to disk. Does nothing for a buffer kept in memory.
+        """
+        if self.directory is not None:
+            for array in (self.states, self.targets, self.actions, self.returns, self.priorities):
+                array.flush()
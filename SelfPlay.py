@@ -0,0 +1,227 @@
+from Game import *
+from ReplayBuffer import *
+from multiprocessing import shared_memory
+import multiprocessing
+import queue
+import time
+import numpy as np
+import random
+
+
+class SelfPlay:
+
+    """
+    Self-play training split into actors and a learner.
+
+    Actor processes play the current network against itself or against one of its past snapshots, many games at once
+    on a MatchRunner, and stream the training data of every finished chunk of games through a queue. The learner (the
+    process calling train) stores the moves in a ReplayBuffer and trains the network in minibatches, publishing its
+    weights back to the actors every few chunks.
+
+    The weights are published in one shared memory block: a version counter per slot followed by a (slots, genes)
+    weight matrix. Slot 0 holds the current weights and the other slots a ring of past snapshots, with version 0 for
+    a slot not filled yet. Readers and the writer hold a lock while copying, so an actor never sees half of an update.
+    """
+
+    def __init__(self, nn, actors=2, snapshots=4, games_per_chunk=32, parallel=32, temperature=1.0,
+                 past_probability=0.5, replay_capacity=50000, batch_size=64, replay_ratio=1.0, publish_interval=4,
+                 snapshot_interval=10, seed=None, league=None):
+        """
+        :param nn: NeuralNetwork trained in place by the learner
+        :param actors: number of actor processes
+        :param snapshots: number of past snapshots kept as opponents
+        :param games_per_chunk: games an actor plays between checks for new weights, sent to the learner together
+        :param parallel: games an actor plays at once
+        :param temperature: softmax temperature of the actors' moves, see NeuralNetwork.masked_sample
+        :param past_probability: chance of a chunk being played against a past snapshot rather than the current
+        network, once there are snapshots
+        :param replay_capacity: moves kept in the replay buffer
+        :param batch_size: moves per minibatch
+        :param replay_ratio: times every received move is trained on, on average
+        :param publish_interval: received chunks between publishing the weights to the actors
+        :param snapshot_interval: publications between storing the weights as a past snapshot
+        :param seed: optional seed of the actors' random and np.random, actor i uses seed + i
+        :param league: optional League every past snapshot is also added to
+        """
+        self.nn = nn
+        self.actors = actors
+        self.slots = snapshots + 1
+        self.games_per_chunk = games_per_chunk
+        self.parallel = parallel
+        self.temperature = temperature
+        self.past_probability = past_probability
+        self.batch_size = batch_size
+        self.replay_ratio = replay_ratio
+        self.publish_interval = publish_interval
+        self.snapshot_interval = snapshot_interval
+        self.seed = seed
+        self.league = league
+
+        self.replay = ReplayBuffer(replay_capacity, nn.layers[0], nn.layers[-1])
+        self.genes = NeuralNetwork.genome_size(nn.layers)
+
+        self.version = 0
+        self.next_snapshot = 1
+        self.updates = 0
+
+    def train(self, num_games):
+        """
+        Runs the actors until num_games games have been received, training on them as they arrive.
+
+        :return: dict of statistics: games and moves received, minibatch updates, weight versions published, the
+        share of games the current network won against past snapshots, and games per second
+        """
+        context = multiprocessing.get_context()
+        block = shared_memory.SharedMemory(create=True, size=self.slots * 8 + self.slots * self.genes * 8)
+        versions, weights = shared_weights(block, self.slots, self.genes)
+
+        lock = context.Lock()
+        stop = context.Event()
+        # A bounded queue makes the actors wait for a learner that falls behind instead of piling up chunks
+        chunks = context.Queue(maxsize=self.actors * 4)
+
+        stats = {'games': 0, 'moves': 0, 'past_games': 0, 'past_wins': 0}
+        processes = []
+        start = time.perf_counter()
+        try:
+            versions[:] = 0
+            self.publish(versions, weights, lock)
+
+            for actor in range(self.actors):
+                seed = None if self.seed is None else self.seed + actor
+                process = context.Process(target=actor_loop, daemon=True,
+                                          args=(block.name, self.slots, self.genes, self.nn.layers, lock, chunks, stop,
+                                                seed, self.games_per_chunk, self.parallel, self.temperature,
+                                                self.past_probability))
+                process.start()
+                processes.append(process)
+
+            received = 0
+            while stats['games'] < num_games:
+                try:
+                    version, states, targets, actions, returns, games, past_games, past_wins = chunks.get(timeout=1.0)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes):
+                        raise Exception('Every self-play actor has stopped.')
+                    continue
+
+                stats['games'] += games
+                stats['moves'] += len(states)
+                stats['past_games'] += past_games
+                stats['past_wins'] += past_wins
+                self.learn(states, targets, actions, returns)
+
+                received += 1
+                if received % self.publish_interval == 0:
+                    self.publish(versions, weights, lock)
+        finally:
+            stop.set()
+            # Actors blocked on a full queue only notice the stop once there is room, so keep draining until they exit
+            while any(process.is_alive() for process in processes):
+                try:
+                    chunks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            for process in processes:
+                process.join()
+
+            # The views must be gone before the block can be closed
+            del versions, weights
+            block.close()
+            block.unlink()
+
+        elapsed = time.perf_counter() - start
+        return {'games': stats['games'], 'moves': stats['moves'], 'updates': self.updates, 'versions': self.version,
+                'past_win_rate': stats['past_wins'] / stats['past_games'] if stats['past_games'] else None,
+                'games_per_sec': stats['games'] / elapsed if elapsed > 0 else 0.0}
+
+    def learn(self, states, targets, actions, returns):
+        """
+        Stores a chunk of moves in the replay buffer and trains on replay_ratio times as many sampled moves.
+        """
+        self.replay.add_batch(states, targets, actions, returns)
+
+        # Fractional numbers of minibatches carry over in expectation
+        expected = len(states) * self.replay_ratio / self.batch_size
+        minibatches = int(expected) + (1 if random.random() < expected - int(expected) else 0)
+        for _ in range(minibatches):
+            batch = self.replay.sample(self.batch_size)
+            self.nn.train_batch(batch.states, batch.targets * batch.returns[:, np.newaxis])
+            self.updates += 1
+
+    def publish(self, versions, weights, lock):
+        """
+        Copies the network into slot 0 as a new version, and every snapshot_interval versions into the ring of past
+        snapshots as well.
+        """
+        self.version += 1
+        with lock:
+            weights[0] = self.nn.genome
+            versions[0] = self.version
+
+            if self.slots > 1 and self.version % self.snapshot_interval == 0:
+                weights[self.next_snapshot] = self.nn.genome
+                versions[self.next_snapshot] = self.version
+                self.next_snapshot = self.next_snapshot % (self.slots - 1) + 1
+
+        if self.league is not None and self.version % self.snapshot_interval == 0:
+            self.league.add(self.nn, 'selfplay-{}-version-{}'.format(len(self.league), self.version))
+
+
+def shared_weights(block, slots, genes):
+    """
+    :return: (versions, weights) views into a SharedMemory block laid out as SelfPlay describes
+    """
+    versions = np.ndarray((slots,), dtype=np.int64, buffer=block.buf)
+    weights = np.ndarray((slots, genes), dtype=np.float64, buffer=block.buf, offset=slots * 8)
+    return versions, weights
+
+
+def actor_loop(name, slots, genes, layers, lock, chunks, stop, seed, games_per_chunk, parallel, temperature,
+               past_probability):
+    """
+    Body of an actor process: plays chunks of games until stop is set, sending the training data of every chunk as
+    (version, states, targets, actions, returns, games, past games, past wins).
+    """
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+
+    block = shared_memory.SharedMemory(name=name)
+    versions, weights = shared_weights(block, slots, genes)
+    try:
+        current = NeuralNetwork(layers)
+        opponent = NeuralNetwork(layers)
+        current_agent = NetworkAgent(current, temperature)
+        opponent_agent = NetworkAgent(opponent, temperature)
+        version = 0
+
+        while not stop.is_set():
+            with lock:
+                if versions[0] != version:
+                    current.genome[:] = weights[0]
+                    version = int(versions[0])
+
+                past = [slot for slot in range(1, slots) if versions[slot] > 0]
+                against_past = len(past) > 0 and random.random() < past_probability
+                if against_past:
+                    opponent.genome[:] = weights[random.choice(past)]
+
+            # Against itself both sides are the current network and both are learned from
+            runner = MatchRunner(current_agent, opponent_agent if against_past else current_agent)
+            data = []
+            past_wins = 0
+            for result in runner.play(games_per_chunk, parallel, record=True):
+                if result.winner == result.agent_player:
+                    past_wins += 1
+                for player in ((result.agent_player,) if against_past else (0, 1)):
+                    moves = Game.training_moves(result, player)
+                    if moves is not None:
+                        data.append(moves)
+
+            states, targets, actions, returns = (np.concatenate(arrays) for arrays in zip(*data))
+            chunks.put((version, states, targets, actions, returns, games_per_chunk,
+                        games_per_chunk if against_past else 0, past_wins if against_past else 0))
+    finally:
+        del versions, weights
+        block.close()
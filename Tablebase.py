@@ -0,0 +1,263 @@
+from GameBoard import *
+from BatchGameBoard import *
+import os
+import numpy as np
+
+
+class Tablebase:
+
+    """
+    Endgame tablebase: the exact value of every position with at most max_seeds seeds left in the pits.
+
+    The stores do not affect how a game goes on, so a position is just the 12 pit counts and the player to move, and
+    its value is the net number of seeds the player to move still gains on the opponent with perfect play by both
+    sides, counting the seeds each side keeps from its row when the game ends. The final score difference of a
+    position is then its store difference plus its value (see final_value).
+
+    Reversing the 12 pits (board index k <-> 13 - k) swaps the rows, each with its pits still in order towards its own
+    store, so a position with player 1 to move is the reversed position with player 0 to move. Only player 0 to move
+    is stored.
+
+    Positions are numbered by rank: with s_j the sum of the first j pit counts, rank = sum of C(s_j + j - 1, j) for
+    j = 1 - 12. This is the combinatorial number system over the nondecreasing sequence of prefix sums, so it is a
+    bijection, and all positions with fewer than n seeds come before the ones with n seeds: positions with up to n
+    seeds have the ranks 0 to C(n + 12, 12) - 1. The table is a flat int8 .npy array indexed by rank, memory mapped
+    when loaded, so a lookup is a rank computation and one read.
+
+    The table is solved retrogradely, one seed count at a time. A move either puts a seed in the mover's store (or
+    captures), leaving fewer seeds, or sows every seed nearer to the next store than the emptied pit was, which lowers
+    the potential: the sum over all seeds of their distance to the store ahead of them. The mirroring keeps the
+    potential, so within a seed count positions are solved in increasing potential, and every position they lead to
+    is solved before them. All positions of one potential are solved at once on a BatchGameBoard.
+    """
+
+    # Distance of every pit (board index 1 - 12) to the store its seeds are sown into next
+    DISTANCES = np.array([1, 2, 3, 4, 5, 6, 6, 5, 4, 3, 2, 1])
+
+    def __init__(self, path, mmap_mode='r'):
+        """
+        Opens a table written by generate.
+
+        :param mmap_mode: np.load mmap_mode, None reads the whole table into memory
+        """
+        self.path = path
+        self.values = np.load(path, mmap_mode=mmap_mode)
+        self.max_seeds = Tablebase.seeds_for_size(len(self.values))
+        self.binomial = Tablebase.binomial_table(self.max_seeds)
+        self.binomial_list = self.binomial.tolist()
+
+    @staticmethod
+    def binomial_table(max_seeds):
+        """
+        :return: (max_seeds + 13, 13) int64 array of C(t, j)
+        """
+        table = np.zeros((max_seeds + 13, 13), dtype=np.int64)
+        table[:, 0] = 1
+        for t in range(1, max_seeds + 13):
+            table[t, 1:] = table[t - 1, 1:] + table[t - 1, :-1]
+        return table
+
+    @staticmethod
+    def table_size(max_seeds):
+        """
+        :return: number of positions with at most max_seeds seeds in the pits, C(max_seeds + 12, 12)
+        """
+        return int(Tablebase.binomial_table(max_seeds)[max_seeds + 12, 12])
+
+    @staticmethod
+    def seeds_for_size(size):
+        max_seeds = 0
+        while Tablebase.table_size(max_seeds) < size:
+            max_seeds += 1
+        if Tablebase.table_size(max_seeds) != size:
+            raise Exception('Table has incorrect size. The size of the table was {}, which is not C(n + 12, 12) for '
+                            'any seed count n.'.format(size))
+        return max_seeds
+
+    @staticmethod
+    def rank_batch(counts, binomial):
+        """
+        :param counts: (n, 12) array of pit counts, board indices 1 - 12
+        :param binomial: binomial_table covering the seed counts
+        :return: array of the n ranks
+        """
+        prefix = np.cumsum(counts, axis=1, dtype=np.int64) + np.arange(12)
+        return binomial[prefix, np.arange(1, 13)].sum(axis=1)
+
+    @staticmethod
+    def unrank_batch(ranks, binomial):
+        """
+        :return: (n, 12) int16 array of the pit counts of the given ranks, the inverse of rank_batch
+        """
+        remainder = np.array(ranks, dtype=np.int64)
+        prefix = np.empty((len(remainder), 12), dtype=np.int64)
+        for j in range(12, 0, -1):
+            # Largest t with C(t, j) <= remainder; the column is nondecreasing in t
+            column = binomial[:, j]
+            t = np.searchsorted(column, remainder, side='right') - 1
+            prefix[:, j - 1] = t - (j - 1)
+            remainder -= column[t]
+        return np.diff(prefix, axis=1, prepend=0).astype(np.int16)
+
+    @staticmethod
+    def generate(path, max_seeds, chunk_size=2 ** 18, verbose=False):
+        """
+        Solves every position with at most max_seeds seeds and writes the table to path (an .npy file).
+
+        :param chunk_size: positions solved per batch
+        :return: Tablebase over the new table
+        """
+        assert 0 <= max_seeds <= 127, "Invalid seed count {}, values must fit in int8".format(max_seeds)
+
+        binomial = Tablebase.binomial_table(max_seeds)
+        size = int(binomial[max_seeds + 12, 12])
+        values = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=np.int8, shape=(size,))
+
+        # A tablebase over the table being written, for the lookups of positions already solved
+        tablebase = Tablebase.__new__(Tablebase)
+        tablebase.path = path
+        tablebase.values = values
+        tablebase.max_seeds = max_seeds
+        tablebase.binomial = binomial
+        tablebase.binomial_list = binomial.tolist()
+
+        for seeds in range(max_seeds + 1):
+            start = int(binomial[seeds + 11, 12]) if seeds > 0 else 0
+            stop = int(binomial[seeds + 12, 12])
+
+            potentials = np.empty(stop - start, dtype=np.int32)
+            for chunk in range(start, stop, chunk_size):
+                ranks = np.arange(chunk, min(chunk + chunk_size, stop))
+                potentials[chunk - start: chunk - start + len(ranks)] = \
+                    Tablebase.unrank_batch(ranks, binomial) @ Tablebase.DISTANCES
+            order = np.argsort(potentials, kind='stable')
+            bounds = np.flatnonzero(np.diff(potentials[order])) + 1
+
+            for group in np.split(order, bounds):
+                for chunk in range(0, len(group), chunk_size):
+                    ranks = group[chunk: chunk + chunk_size] + start
+                    counts = Tablebase.unrank_batch(ranks, binomial)
+                    boards = np.zeros((len(ranks), 14), dtype=np.int16)
+                    boards[:, 1:13] = counts
+                    values[ranks] = tablebase.solve_batch(boards)
+
+            if verbose:
+                print("Solved {} positions with {} seeds".format(stop - start, seeds))
+
+        values.flush()
+        del values, tablebase
+        os.replace(path + '.tmp', path)
+        return Tablebase(path)
+
+    def solve_batch(self, boards):
+        """
+        :param boards: (n, 14) array of positions with player 0 to move; the stores are ignored
+        :return: array of their values, from the values of the positions every move leads to
+        """
+        move_values = self.move_values_batch(boards)
+        rows = boards[:, 1:13].astype(np.int32)
+        row_difference = rows[:, :6].sum(axis=1) - rows[:, 6:].sum(axis=1)
+
+        # A position with an empty row is already over: each side keeps its own row
+        terminal = ~(rows[:, :6].any(axis=1) & rows[:, 6:].any(axis=1))
+        return np.where(terminal, row_difference, move_values.max(axis=1)).astype(np.int8)
+
+    def move_values_batch(self, boards):
+        """
+        :param boards: (n, 14) array of positions with player 0 to move, each position with at most max_seeds seeds
+        in its pits
+        :return: (n, 6) array with the value for player 0 of playing every pit: the seeds the move puts in the store,
+        plus the value of the position it leads to (negated if it is player 1's turn then). Empty pits get -inf.
+        """
+        boards = np.array(boards, dtype=np.int16, ndmin=2)
+        boards[:, 0] = 0
+        boards[:, 13] = 0
+        result = np.full((len(boards), 6), -np.inf)
+
+        for pit in range(1, 7):
+            rows = np.flatnonzero(boards[:, pit] > 0)
+            if len(rows) == 0:
+                continue
+
+            after = BatchGameBoard(len(rows), boards[rows])
+            next_player = after.move_marbles(np.zeros(len(rows), dtype=np.intp), np.full(len(rows), pit))
+            value = after.boards[:, 0].astype(np.int32)
+
+            ended = after.check_end_condition()
+            rows0, rows1 = after.get_sum_rows()
+            value[ended] += rows0[ended] - rows1[ended]
+
+            again = ~ended & (next_player == 0)
+            if again.any():
+                value[again] += self.values[Tablebase.rank_batch(after.boards[again, 1:13], self.binomial)]
+            other = ~ended & (next_player == 1)
+            if other.any():
+                # Player 1 to move is the reversed position with player 0 to move
+                value[other] -= self.values[Tablebase.rank_batch(after.boards[other, 12:0:-1], self.binomial)]
+
+            result[rows, pit - 1] = value
+        return result
+
+    def covers(self, board):
+        """
+        :param board: list of 14 marble counts
+        :return: True if the table holds the position, i.e. it has at most max_seeds seeds in its pits
+        """
+        return sum(board[1:13]) <= self.max_seeds
+
+    def rank(self, board, player):
+        """
+        :return: rank of the position with player to move, reversed first for player 1
+        """
+        binomial = self.binomial_list
+        counts = board[1:13] if player == 0 else board[12:0:-1]
+        rank = 0
+        prefix = 0
+        for j in range(12):
+            prefix += counts[j]
+            rank += binomial[prefix + j][j + 1]
+        return rank
+
+    def value(self, board, player):
+        """
+        :return: net number of seeds player (to move) still gains on the opponent with perfect play
+        """
+        return int(self.values[self.rank(board, player)])
+
+    def final_value(self, board, player):
+        """
+        :param board: GameBoard or list of 14 marble counts
+        :return: final score difference for player (to move) with perfect play, the scale AlphaBetaAgent.final_value
+        uses for finished games
+        """
+        b = board.board if isinstance(board, GameBoard) else board
+        stores = b[0] - b[13] if player == 0 else b[13] - b[0]
+        return stores + self.value(b, player)
+
+    def move_values(self, inputs):
+        """
+        :param inputs: (n, 15) array of the 14 board entries followed by the player to move, as MatchRunner hands to
+        agents, every position covered by the table
+        :return: (n, 6) array with the value for the player to move of playing every pit, -inf for empty pits
+        """
+        inputs = np.array(inputs, ndmin=2)
+        boards = inputs[:, :14].astype(np.int16)
+        flipped = inputs[:, 14] == 1
+        # Player 1 to move plays the reversed position as player 0, where its pit p is player 0's pit 7 - p
+        boards[flipped, 1:13] = boards[flipped, 12:0:-1]
+        values = self.move_values_batch(boards)
+        values[flipped] = values[flipped, ::-1]
+        return values
+
+    def query(self, input_list):
+        """
+        :param input_list: the 14 board entries followed by the player to move, as given to NeuralNetwork.query
+        :return: (6, 1) array of exact move values, the best move scored highest and empty pits -inf
+        """
+        if len(input_list) != 15:
+            raise Exception('Input has incorrect size. The size of input was {}, but should be {}.'
+                            .format(len(input_list), 15))
+        if not self.covers(input_list[:14]):
+            raise Exception('Position with {} seeds is not covered by a tablebase of up to {} seeds.'
+                            .format(sum(input_list[1:13]), self.max_seeds))
+        return self.move_values([input_list]).T
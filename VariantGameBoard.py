@@ -0,0 +1,174 @@
+from GameBoard import *
+
+
+class VariantGameBoard(GameBoard):
+
+    """
+    GameBoard of any BoardVariant. It plays by the same rules and closed form moves as GameBoard, with the move tables,
+    sizes and Zobrist keys taken from its variant instead of GameBoard's 6 pit constants, so it is a little slower.
+    Use create, which returns a plain GameBoard for the 6 pit variants.
+
+    The layout follows BoardVariant: player 0's store at index 0, player 1's at the last index (so board[-player] is
+    always the mover's store), pit p of a player at player * pits + p and bit (index - 1) of legal for every pit.
+    """
+
+    def __init__(self, variant, board=None):
+        """
+        :param variant: BoardVariant of the game
+        :param board: optional list of variant.size marble counts to start from. Defaults to the variant's starting
+        position.
+        """
+        if board is None:
+            board = variant.start
+        assert len(board) == variant.size, \
+            "Invalid board size {}, must be {} for {}".format(len(board), variant.size, variant)
+
+        self.variant = variant
+        self.board = list(board)
+        self.hash = variant.zobrist_hash(self.board)
+        self.legal = variant.legal_mask(self.board)
+
+    @staticmethod
+    def create(variant=None, board=None):
+        """
+        :return: GameBoard of the variant. The move tables only depend on the pits per side, so 6 pit variants get a
+        plain GameBoard (the fast 6 pit code) started from the variant's start.
+        """
+        if variant is None:
+            return GameBoard(board)
+        if variant.pits == 6:
+            return GameBoard(board if board is not None else variant.start)
+        return VariantGameBoard(variant, board)
+
+    def set_board(self, board):
+        self.board = list(board)
+        self.hash = self.variant.zobrist_hash(self.board)
+        self.legal = self.variant.legal_mask(self.board)
+
+    def copy(self):
+        board = VariantGameBoard.__new__(VariantGameBoard)
+        board.variant = self.variant
+        board.board = self.board[:]
+        board.hash = self.hash
+        board.legal = self.legal
+        return board
+
+    def legal_moves(self, player):
+        variant = self.variant
+        return (self.legal >> (player * variant.pits)) & variant.row_mask
+
+    def legal_pits(self, player):
+        variant = self.variant
+        return BoardVariant.MASK_PITS[(self.legal >> (player * variant.pits)) & variant.row_mask]
+
+    def move_marbles(self, player, pit):
+        """
+        GameBoard.move_marbles over the variant's tables.
+
+        :param pit: numbered 1 - variant.pits
+        """
+        variant = self.variant
+        assert player == 0 or player == 1, "Invalid player id, must be either 0 or 1"
+        assert 1 <= pit <= variant.pits, "Invalid pit number {}, must be between 1 and {}".format(pit, variant.pits)
+
+        board = self.board
+        index = player * variant.pits + pit
+        marbles = board[index]
+
+        if marbles == 0:
+            return 2
+
+        zobrist = variant.zobrist
+        h = self.hash ^ zobrist[index][marbles] ^ zobrist[index][0]
+        board[index] = 0
+
+        lap = variant.lap
+        order = variant.sowing_order[player][pit]
+        laps, remainder = divmod(marbles, lap)
+
+        legal = (self.legal & ~(1 << (index - 1))) | variant.sowing_mask[player][pit][lap if laps else remainder]
+        if laps:
+            for i in order:
+                count = board[i]
+                h ^= zobrist[i][count] ^ zobrist[i][count + laps]
+                board[i] = count + laps
+        for i in order[:remainder]:
+            count = board[i]
+            h ^= zobrist[i][count] ^ zobrist[i][count + 1]
+            board[i] = count + 1
+        index = order[(marbles - 1) % lap]
+
+        if index == 0 or index == variant.size - 1:
+            self.hash = h
+            self.legal = legal
+            return player
+
+        if board[index] == 1:
+            across = variant.index_across[index]
+            captured = board[across]
+            if captured != 0:
+                store = board[-player]
+                h ^= zobrist[across][captured] ^ zobrist[across][0] ^ zobrist[index][1] ^ zobrist[index][0]
+                h ^= zobrist[-player][store] ^ zobrist[-player][store + captured + 1]
+                board[-player] = store + captured + 1
+                board[across] = 0
+                board[index] = 0
+                legal &= ~((1 << (across - 1)) | (1 << (index - 1)))
+
+        self.hash = h
+        self.legal = legal
+        return -player + 1
+
+    def move_marbles_reference(self, player, pit):
+        """
+        GameBoard.move_marbles_reference over the variant: sows one marble at a time with next_index.
+        """
+        variant = self.variant
+        assert player == 0 or player == 1, "Invalid player id, must be either 0 or 1"
+        assert 1 <= pit <= variant.pits, "Invalid pit number {}, must be between 1 and {}".format(pit, variant.pits)
+
+        index = variant.board_index(player, pit)
+        marbles = self.board[index]
+
+        if marbles == 0:
+            return 2
+
+        self.board[index] = 0
+        while marbles != 0:
+            index = variant.next_index(index, player)
+            self.board[index] += 1
+            marbles -= 1
+
+        if index != 0 and index != variant.size - 1 and self.board[index] == 1:
+            across = variant.across(index)
+            if self.board[across] != 0:
+                self.board[-player] += self.board[across] + self.board[index]
+                self.board[across] = 0
+                self.board[index] = 0
+
+        self.hash = variant.zobrist_hash(self.board)
+        self.legal = variant.legal_mask(self.board)
+
+        if index == 0 or index == variant.size - 1:
+            return player
+        return -player + 1
+
+    def check_end_condition(self):
+        variant = self.variant
+        return not self.legal & variant.row_mask or not self.legal >> variant.pits
+
+    def get_sum_rows(self):
+        pits = self.variant.pits
+        return sum(self.board[1:pits + 1]), sum(self.board[pits + 1:2 * pits + 1])
+
+    def text_display_board(self):
+        pits = self.variant.pits
+        separator = "=" * (4 * pits + 1)
+        print(separator)
+
+        spacing = "  "
+        print(spacing * 2 + "".join(str(marbles) + spacing for marbles in self.board[1:pits + 1]))
+        print(spacing + str(self.board[0]) + (spacing + " ") * pits + str(self.board[-1]))
+        print(spacing * 2 + "".join(str(marbles) + spacing for marbles in self.board[pits + 1:2 * pits + 1]))
+
+        print(separator)
@@ -0,0 +1,414 @@
+"""
+Command line entry point for the Mancala AI.
+
+    python main.py play                       two players at the keyboard
+    python main.py train --games 100000       train a network against the random agent, then test it
+    python main.py train --pits 8 --seeds 6   the same on a board of 8 pits per side with 6 seeds each
+    python main.py selfplay --actors 4        train a network by self-play in actor processes
+    python main.py evolve --generations 10    run the genetic algorithm
+    python main.py evaluate --agent alphabeta evaluate an agent against the random agent
+    python main.py tablebase --seeds 12       solve the endgame tablebase
+    python main.py book --plies 6             search the opening book
+    python main.py record --games 1000000     record games to files for offline training
+    python main.py offline --records records  train a network on recorded games
+    python main.py bench --output base.json   benchmark the hot paths, --baseline base.json flags regressions
+
+Every command imports what it needs when it runs, so importing this module (or starting a worker process) stays
+cheap.
+"""
+import argparse
+import random
+import sys
+import time
+
+
+def parse_net_size(text):
+    return [int(x) for x in text.split(',')]
+
+
+def parse_positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("{} is not a positive integer".format(text))
+    return value
+
+
+def seed_everything(seed):
+    if seed is not None:
+        import numpy as np
+        random.seed(seed)
+        np.random.seed(seed)
+
+
+def open_variant(args):
+    """
+    :return: BoardVariant of the --pits and --seeds arguments
+    """
+    from BoardVariant import BoardVariant
+    return BoardVariant.get(args.pits, args.seeds)
+
+
+def check_network_variant(nn, variant):
+    if nn.layers[0] != variant.input_size or nn.layers[-1] != variant.output_size:
+        raise Exception('Network has incorrect layer sizes for {}. The layers were {}, but should start with {} and '
+                        'end with {}.'.format(variant, nn.layers, variant.input_size, variant.output_size))
+
+
+def play(args):
+    from Game import Game
+    Game(open_variant(args)).text_play()
+
+
+def train(args):
+    from Game import Game
+    from ReplayBuffer import ReplayBuffer
+    import Checkpoint
+    seed_everything(args.seed)
+
+    game = Game(open_variant(args))
+    if args.load is not None:
+        game.nn = Checkpoint.load_network(args.load, mmap_mode=None)
+        check_network_variant(game.nn, game.variant)
+    replay = ReplayBuffer(args.replay_capacity, game.nn.layers[0], game.nn.layers[-1], directory=args.replay_dir)
+    game.train_neural_network(args.games, temperature=args.temperature, replay=replay,
+                              replay_batches=args.replay_batches, batch_size=args.batch_size,
+                              prioritized=args.prioritized, instrumentation=open_instrumentation(args))
+    if args.save is not None:
+        Checkpoint.save_network(args.save, game.nn)
+    if args.test_games > 0:
+        game.test_neural_network(args.test_games, open_league(args))
+
+
+def open_instrumentation(args):
+    if args.log is None and args.profile is None:
+        return None
+    from Instrumentation import Instrumentation
+    return Instrumentation(None if args.log == '-' else args.log, args.log_interval, args.profile,
+                           getattr(args, 'profile_step', 0))
+
+
+def open_league(args):
+    if args.league is None:
+        return None
+    from League import League
+    return League(args.league)
+
+
+def selfplay(args):
+    from Game import Game
+    from NeuralNetwork import NeuralNetwork
+    from SelfPlay import SelfPlay
+    seed_everything(args.seed)
+
+    nn = NeuralNetwork(args.net_size, args.learning_rate)
+    league = open_league(args)
+    trainer = SelfPlay(nn, actors=args.actors, snapshots=args.snapshots, temperature=args.temperature,
+                       batch_size=args.batch_size, replay_ratio=args.replay_ratio, seed=args.seed, league=league)
+    print(trainer.train(args.games))
+    if args.test_games > 0:
+        win_pct = Game().test_against_random_agent(nn, args.test_games)
+        print("Network won {} of {} games against the random agent".format(win_pct, args.test_games))
+    if league is not None and len(league) > 0:
+        results = league.evaluate(nn)
+        print("Network has a performance rating of {:.0f} against the league"
+              .format(league.performance_rating(results)))
+
+
+def evolve(args):
+    from GeneticAgent import GeneticAgent
+
+    # Note, the list first and last elements in the net_size list must remain the same in order for the algorithm to
+    # work
+    if args.resume is not None:
+        ga = GeneticAgent.resume(args.resume, workers=args.workers, league=open_league(args),
+                                 fitness_dtype=args.dtype, instrumentation=open_instrumentation(args))
+    else:
+        ga = GeneticAgent(args.population, args.net_size, workers=args.workers, seed=args.seed,
+                          games_per_fitness=args.games, batched_fitness=args.batched, league=open_league(args),
+                          league_interval=args.league_interval, fitness_dtype=args.dtype,
+                          instrumentation=open_instrumentation(args))
+    try:
+        print(ga.test_fitness())
+        ga.run(args.generations, args.checkpoint, args.checkpoint_interval)
+        print(ga.test_fitness())
+    finally:
+        ga.close()
+
+
+def make_agent(args):
+    variant = open_variant(args)
+    if variant.pits != 6 or variant.seeds != 4:
+        # The searches, the tablebase and the book are written for the standard board
+        if args.agent != 'network' or args.tablebase is not None or args.book is not None:
+            raise Exception('Only network agents play {}, without a tablebase or an opening book.'.format(variant))
+
+    tablebase = None
+    if args.tablebase is not None:
+        from Tablebase import Tablebase
+        tablebase = Tablebase(args.tablebase)
+    book = None
+    if args.book is not None:
+        from OpeningBook import OpeningBook
+        book = OpeningBook(args.book)
+
+    if args.agent == 'alphabeta':
+        from AlphaBetaAgent import AlphaBetaAgent
+        return AlphaBetaAgent(max_depth=args.depth, time_limit=args.time_limit, tablebase=tablebase, book=book)
+    if book is not None:
+        from Agents import OpeningBookAgent
+        args.book = None
+        return OpeningBookAgent(make_agent(args), book)
+    if tablebase is not None:
+        from Agents import EndgameAgent
+        args.tablebase = None
+        return EndgameAgent(make_agent(args), tablebase)
+    if args.agent == 'mcts':
+        from MCTSAgent import MCTSAgent
+        from NeuralNetwork import NeuralNetwork
+        return MCTSAgent(NeuralNetwork(args.net_size or variant.layers(100)), simulations=args.simulations,
+                         time_limit=args.time_limit)
+
+    if args.load is not None:
+        import Checkpoint
+        nn = Checkpoint.load_network(args.load)
+    else:
+        from NeuralNetwork import NeuralNetwork
+        nn = NeuralNetwork(args.net_size or variant.layers(100))
+    check_network_variant(nn, variant)
+    return nn if args.dtype is None else nn.astype(args.dtype)
+
+
+def evaluate(args):
+    from Game import Game
+    seed_everything(args.seed)
+
+    agent = make_agent(args)
+    start = time.perf_counter()
+    win_pct = Game(open_variant(args)).test_against_random_agent(agent, args.games)
+    elapsed = time.perf_counter() - start
+    print("{} won {} of {} games against the random agent in {:.2f}s".format(args.agent, win_pct, args.games, elapsed))
+
+
+def tablebase(args):
+    from Tablebase import Tablebase
+    start = time.perf_counter()
+    table = Tablebase.generate(args.path, args.seeds, verbose=True)
+    print("Solved {} positions with up to {} seeds in {:.2f}s".format(len(table.values), args.seeds,
+                                                                     time.perf_counter() - start))
+
+
+def record(args):
+    import GameRecord
+    nn = None
+    if args.load is not None:
+        import Checkpoint
+        nn = Checkpoint.load_network(args.load, mmap_mode=None)
+    elif 'network' in args.players:
+        from NeuralNetwork import NeuralNetwork
+        seed_everything(args.seed)
+        nn = NeuralNetwork(args.net_size)
+
+    start = time.perf_counter()
+    files = GameRecord.generate(args.directory, args.games, args.players, nn, temperature=args.temperature,
+                                workers=args.workers, games_per_file=args.games_per_file,
+                                random_opening=args.random_opening, seed=0 if args.seed is None else args.seed)
+    print("Recorded {} games into {} files in {:.2f}s".format(args.games, len(files), time.perf_counter() - start))
+
+
+def offline(args):
+    import GameRecord
+    import Checkpoint
+    from Game import Game
+    seed_everything(args.seed)
+
+    game = Game()
+    if args.load is not None:
+        game.nn = Checkpoint.load_network(args.load, mmap_mode=None)
+    reader = GameRecord.GameRecordReader(args.records)
+    start = time.perf_counter()
+    moves = GameRecord.train_network(game.nn, reader, args.batch_size, args.epochs, args.player, shuffle=args.shuffle)
+    print("Trained on {} moves in {:.2f}s".format(moves, time.perf_counter() - start))
+    if args.save is not None:
+        Checkpoint.save_network(args.save, game.nn)
+    if args.test_games > 0:
+        win_pct = game.test_against_random_agent(game.nn, args.test_games)
+        print("Network won {} of {} games against the random agent".format(win_pct, args.test_games))
+
+
+def book(args):
+    from OpeningBook import OpeningBook
+    start = time.perf_counter()
+    opening_book = OpeningBook.build(args.path, args.plies, args.depth, args.workers, verbose=True)
+    print("Searched {} book positions in {:.2f}s".format(len(opening_book), time.perf_counter() - start))
+
+
+def bench(args):
+    import json
+    import Benchmark
+    suite = Benchmark.Benchmark(seconds=args.seconds, repeats=args.repeats, seed=0 if args.seed is None else args.seed)
+    to_stdout = args.output == '-'
+    results = suite.run(args.only, verbose=not to_stdout and args.baseline is None)
+
+    if to_stdout:
+        print(json.dumps(suite.report(results), indent=1))
+    elif args.output is not None:
+        suite.save(args.output, results)
+
+    if args.baseline is not None:
+        baseline = Benchmark.load_results(args.baseline)
+        regressions = Benchmark.compare(results, baseline, args.threshold)
+        Benchmark.print_comparison(results, baseline, regressions, out=sys.stderr if to_stdout else sys.stdout)
+        if regressions:
+            print("{} of {} benchmarks are more than {:.0%} slower than the baseline"
+                  .format(len(regressions), len(results), args.threshold), file=sys.stderr)
+            sys.exit(1)
+
+
+def add_variant_arguments(command):
+    command.add_argument('--pits', type=int, default=6, help="pits per side of the board")
+    command.add_argument('--seeds', type=int, default=4, help="seeds per pit at the start")
+
+
+def add_instrumentation_arguments(command, profiled, steps=False):
+    """
+    :param steps: whether the command runs in steps (generations) and takes --profile-step to pick the profiled one
+    """
+    command.add_argument('--log', default=None, help="JSON lines file of per phase timings, - for stdout")
+    command.add_argument('--log-interval', type=float, default=10.0, help="seconds between timing logs")
+    command.add_argument('--profile', default=None, help="cProfile dump of " + profiled)
+    if steps:
+        command.add_argument('--profile-step', type=int, default=0, help="generation profiled with --profile")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Mancala AI")
+    parser.add_argument('--seed', type=int, default=None, help="seed for random and np.random")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('play', help="play a game at the keyboard")
+    add_variant_arguments(command)
+    command.set_defaults(run=play)
+
+    command = commands.add_parser('train', help="train a network against the random agent")
+    command.add_argument('--games', type=int, default=100000)
+    command.add_argument('--test-games', type=int, default=1000)
+    command.add_argument('--temperature', type=float, default=None,
+                         help="sample training moves from a softmax at this temperature instead of the best pit")
+    command.add_argument('--league', default=None, help="league directory to test the trained network against")
+    command.add_argument('--load', default=None, help="checkpoint to start training from")
+    command.add_argument('--save', default=None, help="checkpoint to save the trained network to")
+    command.add_argument('--replay-capacity', type=int, default=20000, help="moves kept in the replay buffer")
+    command.add_argument('--replay-dir', default=None, help="keep the replay buffer in memory mapped files here")
+    command.add_argument('--replay-batches', type=int, default=0, help="replayed minibatches after every game")
+    command.add_argument('--batch-size', type=int, default=32, help="moves per replayed minibatch")
+    command.add_argument('--prioritized', action='store_true', help="replay moves with large rewards more often")
+    add_variant_arguments(command)
+    add_instrumentation_arguments(command, "the training session")
+    command.set_defaults(run=train)
+
+    command = commands.add_parser('selfplay', help="train a network by self-play in actor processes")
+    command.add_argument('--games', type=int, default=100000)
+    command.add_argument('--test-games', type=int, default=1000)
+    command.add_argument('--net-size', type=parse_net_size, default=[15, 200, 6])
+    command.add_argument('--learning-rate', type=float, default=0.1)
+    command.add_argument('--actors', type=int, default=2, help="actor processes playing games")
+    command.add_argument('--snapshots', type=int, default=4, help="past networks kept as opponents")
+    command.add_argument('--temperature', type=float, default=1.0, help="softmax temperature of the actors' moves")
+    command.add_argument('--batch-size', type=int, default=64)
+    command.add_argument('--replay-ratio', type=float, default=1.0, help="times every move is trained on")
+    command.add_argument('--league', default=None, help="league directory the past snapshots are added to")
+    command.set_defaults(run=selfplay)
+
+    command = commands.add_parser('evolve', help="run the genetic algorithm")
+    command.add_argument('--population', type=int, default=100)
+    command.add_argument('--net-size', type=parse_net_size, default=[15, 100, 6])
+    command.add_argument('--generations', type=int, default=10)
+    command.add_argument('--games', type=int, default=100, help="fitness games per network")
+    command.add_argument('--workers', type=int, default=1)
+    command.add_argument('--batched', action='store_true', help="play fitness games of a population in lockstep")
+    command.add_argument('--league', default=None, help="league directory to measure fitness against")
+    command.add_argument('--league-interval', type=int, default=None,
+                         help="generations between adding the best network to the league")
+    command.add_argument('--dtype', choices=['float32', 'float64'], default=None,
+                         help="precision of the batched fitness games, with --resume the saved run's by default")
+    command.add_argument('--checkpoint', default=None, help="file the run is saved to")
+    command.add_argument('--checkpoint-interval', type=parse_positive_int, default=1,
+                         help="generations between checkpoints")
+    command.add_argument('--resume', default=None, help="checkpoint of a run to continue")
+    add_instrumentation_arguments(command, "the generation given by --profile-step", steps=True)
+    command.set_defaults(run=evolve)
+
+    command = commands.add_parser('evaluate', help="evaluate an agent against the random agent")
+    command.add_argument('--agent', choices=['network', 'alphabeta', 'mcts'], default='alphabeta')
+    command.add_argument('--games', type=int, default=100)
+    command.add_argument('--net-size', type=parse_net_size, default=None,
+                         help="layer sizes of a new network, 15,100,6 on the standard board")
+    command.add_argument('--depth', type=int, default=6, help="alphabeta search depth")
+    command.add_argument('--simulations', type=int, default=200, help="mcts simulations per move")
+    command.add_argument('--time-limit', type=float, default=None, help="search seconds per move")
+    command.add_argument('--load', default=None, help="network checkpoint to evaluate, for --agent network")
+    command.add_argument('--dtype', choices=['float32', 'float64'], default=None,
+                         help="precision of the network, for --agent network")
+    command.add_argument('--tablebase', default=None, help="endgame tablebase file to play endgames from")
+    command.add_argument('--book', default=None, help="opening book file to play openings from")
+    add_variant_arguments(command)
+    command.set_defaults(run=evaluate)
+
+    command = commands.add_parser('tablebase', help="solve the endgame tablebase")
+    command.add_argument('--seeds', type=int, default=12, help="most seeds left in the pits of a solved position")
+    command.add_argument('--path', default='tablebase.npy', help="file the table is written to")
+    command.set_defaults(run=tablebase)
+
+    command = commands.add_parser('book', help="search the opening book")
+    command.add_argument('--plies', type=int, default=6, help="book positions are reachable in fewer moves")
+    command.add_argument('--depth', type=int, default=6, help="search depth past the edge of the book")
+    command.add_argument('--workers', type=int, default=1)
+    command.add_argument('--path', default='book.npy', help="file the book is written to")
+    command.set_defaults(run=book)
+
+    command = commands.add_parser('record', help="record games to files for offline training")
+    command.add_argument('--directory', default='records', help="directory the record files are written to")
+    command.add_argument('--games', type=int, default=100000)
+    command.add_argument('--players', nargs=2, choices=['random', 'network'], default=['random', 'random'],
+                         help="the two agents")
+    command.add_argument('--load', default=None, help="network checkpoint of the network agents")
+    command.add_argument('--net-size', type=parse_net_size, default=[15, 100, 6],
+                         help="size of a new random network, without --load")
+    command.add_argument('--temperature', type=float, default=1.0, help="softmax temperature of the network's moves")
+    command.add_argument('--random-opening', type=int, default=0, help="random moves at the start of every game")
+    command.add_argument('--workers', type=int, default=1)
+    command.add_argument('--games-per-file', type=int, default=100000)
+    command.set_defaults(run=record)
+
+    command = commands.add_parser('offline', help="train a network on recorded games")
+    command.add_argument('--records', nargs='+', default=['records'], help="record files or directories")
+    command.add_argument('--epochs', type=int, default=1)
+    command.add_argument('--batch-size', type=int, default=32)
+    command.add_argument('--shuffle', type=int, default=0, help="moves shuffled together, 0 keeps the game order")
+    command.add_argument('--player', choices=['agent', 'both'], default='agent',
+                         help="learn from the first agent's moves or from both sides")
+    command.add_argument('--load', default=None, help="checkpoint to start training from")
+    command.add_argument('--save', default=None, help="checkpoint to save the trained network to")
+    command.add_argument('--test-games', type=int, default=1000)
+    command.set_defaults(run=offline)
+
+    command = commands.add_parser('bench', help="measure throughput of the hot paths")
+    command.add_argument('--seconds', type=float, default=1.0, help="time spent per measurement")
+    command.add_argument('--repeats', type=int, default=3, help="measurements per benchmark, the best is kept")
+    command.add_argument('--only', nargs='+', default=None, help="benchmarks to run, by name or name prefix")
+    command.add_argument('--output', default=None, help="JSON file the results are written to, - for stdout")
+    command.add_argument('--baseline', default=None, help="JSON results of an earlier run to compare against")
+    command.add_argument('--threshold', type=float, default=0.1,
+                         help="slowdown against the baseline reported as a regression, 0.1 being 10%%")
+    command.set_defaults(run=bench)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
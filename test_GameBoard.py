@@ -0,0 +1,70 @@
+from BatchGameBoard import *
+import random
+
+
+def random_boards(rng, count, size, total):
+    """
+    :return: list of count boards of size entries holding total marbles. The marbles of a board are spread over a
+    random handful of its indices, so pits with more than a lap of marbles, empty rows and full stores all come up.
+    """
+    boards = []
+    for _ in range(count):
+        board = [0] * size
+        for index in rng.choices(rng.sample(range(size), rng.randint(2, size)), k=total):
+            board[index] += 1
+        boards.append(board)
+    return boards
+
+
+def test_move_marbles_matches_reference_and_batch():
+    rng = random.Random(2)
+    boards = random_boards(rng, 5000, 14, 48)
+    players = [rng.randrange(2) for _ in boards]
+    pits = [rng.randrange(1, 7) for _ in boards]
+
+    batch = BatchGameBoard(len(boards), boards)
+    next_players = batch.move_marbles(players, pits)
+
+    for i, (board, player, pit) in enumerate(zip(boards, players, pits)):
+        fast = GameBoard(board)
+        reference = GameBoard(board)
+        next_player = fast.move_marbles(player, pit)
+
+        assert next_player == reference.move_marbles_reference(player, pit)
+        assert fast.board == reference.board
+        assert fast.hash == reference.hash == GameBoard.zobrist_hash(fast.board)
+        assert fast.legal == reference.legal == GameBoard.legal_mask(fast.board)
+
+        assert next_player == next_players[i]
+        assert fast.board == batch.boards[i].tolist()
+
+
+def test_variant_move_marbles_matches_reference_and_batch():
+    rng = random.Random(3)
+    for pits, seeds in ((4, 3), (8, 6), (10, 2), (6, 6)):
+        variant = BoardVariant.get(pits, seeds)
+        boards = random_boards(rng, 1000, variant.size, variant.total_seeds)
+        players = [rng.randrange(2) for _ in boards]
+        moves = [rng.randrange(1, pits + 1) for _ in boards]
+
+        batch = BatchGameBoard(len(boards), boards, variant)
+        next_players = batch.move_marbles(players, moves)
+
+        for i, (board, player, pit) in enumerate(zip(boards, players, moves)):
+            fast = VariantGameBoard(variant, board)
+            reference = VariantGameBoard(variant, board)
+            next_player = fast.move_marbles(player, pit)
+
+            assert next_player == reference.move_marbles_reference(player, pit)
+            assert fast.board == reference.board
+            assert fast.hash == reference.hash == variant.zobrist_hash(fast.board)
+            assert fast.legal == reference.legal == variant.legal_mask(fast.board)
+
+            assert next_player == next_players[i]
+            assert fast.board == batch.boards[i].tolist()
+
+            # 6 pit variants are played by a plain GameBoard
+            if pits == 6:
+                board6 = VariantGameBoard.create(variant, board)
+                assert type(board6) is GameBoard
+                assert board6.move_marbles(player, pit) == next_player and board6.board == fast.board
@@ -0,0 +1,51 @@
+from OpeningBook import *
+import numpy as np
+
+
+def brute_force(board, player, depth):
+    """
+    Plain negamax without pruning or transposition table, with AlphaBetaAgent's leaf values.
+    """
+    if board.check_end_condition():
+        return AlphaBetaAgent.final_value(board, player)
+    if depth <= 0:
+        return AlphaBetaAgent.evaluate(board, player)
+
+    best = -np.inf
+    for pit in board.legal_pits(player):
+        child = board.copy()
+        next_player = child.move_marbles(player, pit)
+        value = brute_force(child, next_player, depth - 1)
+        best = max(best, value if next_player == player else -value)
+    return best
+
+
+def test_book_matches_brute_force(tmp_path):
+    plies, depth = 4, 2
+    book = OpeningBook.build(str(tmp_path / 'book.npy'), plies, depth)
+    positions = OpeningBook.positions(plies)
+    assert len(book) == len(positions)
+
+    # Exact value of every pit of a book position: book moves recurse into the book, moves leaving it are searched
+    # depth moves deep past the position they lead to
+    solved = {}
+
+    def pit_values(position):
+        if position not in solved:
+            values = {}
+            for pit, child, next_player, finished in positions[position]:
+                if finished:
+                    value = AlphaBetaAgent.final_value(GameBoard(list(child)), position[1])
+                elif (child, next_player) in positions:
+                    value = max(pit_values((child, next_player)).values())
+                else:
+                    value = brute_force(GameBoard(list(child)), next_player, depth)
+                values[pit] = value if next_player == position[1] else -value
+            solved[position] = values
+        return solved[position]
+
+    for board, player in positions:
+        values = pit_values((board, player))
+        pit, value = book.lookup(list(board), player)
+        assert value == max(values.values())
+        assert values[pit] == value